@@ -1,17 +1,33 @@
 # ==================== IMPORTS ====================
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, Response, \
+    has_request_context
 from functools import wraps
 from decimal import Decimal
-import datetime
-import csv
-import io
 import os
 import re
-import mysql.connector
-from mysql.connector import Error
+import json
+import base64
+import threading
+from collections import OrderedDict
+import click
 from werkzeug.utils import secure_filename
-from time import time
+from time import monotonic, perf_counter
 from datetime import datetime, timedelta
+from db import ConnectionPool, PoolTimeout
+from backends import create_backend, DatabaseError, MySQLBackend
+from instrumentation import InstrumentedConnection, QueryStats, SlowQueryLog
+from catalog import CatalogIndex, CATALOG_COLUMNS
+from recommendations import RecommendationService, CoPurchaseEngine
+from order_store import migrate_legacy_orders, verify_order_store, OrderMigrationError, commit_inventory, insert_order_lines, \
+    ensure_order_medicine_link, partition_orders_by_month
+from migrations import apply_migrations, diff_schema, schema_is_current, MigrationError, \
+    MEDICINE_SEARCH_COLUMNS
+from rollups import rebuild_rollups, record_order_rollups, record_signup_rollups, \
+    monthly_sales, monthly_signups, top_products, total_revenue
+from datagen import generate_data
+from uploads import UploadProcessor, save_upload, record_upload
+from exports import EXPORT_REPORTS, EXPORT_FORMATS, ExportError, export_query, parquet_available, \
+    stream_csv, stream_gzip, stream_jsonl, stream_parquet
 
 
 # ==================== FLASK APP INITIALIZATION ====================
@@ -33,7 +49,12 @@ app.config['PRESCRIPTION_FOLDER'] = PRESCRIPTION_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
 
-# Database configuration
+# Database backend: 'mysql' uses db_config below; 'sqlite' uses the file
+# DB_SQLITE_PATH (':memory:' for a throwaway database) and needs no server
+app.config['DB_BACKEND'] = os.environ.get('DB_BACKEND', 'mysql')
+app.config['DB_SQLITE_PATH'] = os.environ.get('DB_SQLITE_PATH', 'medistore.db')
+
+# Database configuration (MySQL)
 db_config = {
     'host': 'localhost',
     'user': 'root',
@@ -41,20 +62,124 @@ db_config = {
     'database': 'test'
 }
 
+# Connection pool configuration
+app.config['DB_POOL_SIZE'] = 10          # idle connections kept open
+app.config['DB_POOL_MAX_OVERFLOW'] = 5   # extra connections allowed at peak
+app.config['DB_POOL_TIMEOUT'] = 30       # seconds to wait for a free connection
+app.config['DB_POOL_RECYCLE'] = 3600     # replace connections older than this (seconds)
+app.config['DB_POOL_PRE_PING'] = True    # check connections are alive on checkout
+app.config['DB_AUTO_MIGRATE'] = True     # apply pending schema migrations at startup
+
+# Query instrumentation
+app.config['SERVER_TIMING'] = True               # add Server-Timing headers with per-request DB time
+app.config['SLOW_QUERY_MS'] = 200                # statements slower than this are logged
+app.config['SLOW_QUERY_LOG'] = 'slow_queries.log'  # JSON-lines slow query log (None disables it)
+
+# Cache configuration
+app.config['SETTINGS_CACHE_TTL'] = 60    # seconds before re-checking the settings version
+app.config['HEADER_CACHE_TTL'] = 60      # seconds a cached navbar user/cart count stays valid
+app.config['HEADER_CACHE_SIZE'] = 10000  # most users kept in the navbar cache
+app.config['SITE_STATS_CACHE_TTL'] = 30  # seconds the home page totals are reused
+app.config['CATALOG_INDEX_TTL'] = 300    # seconds before the in-memory catalog is rebuilt
+app.config['CO_PURCHASE_TTL'] = 3600     # seconds before "bought together" data is re-mined
+app.config['EXPORT_CHUNK_ROWS'] = 1000  # rows fetched and written per chunk of a streamed export
+app.config['EXPORT_PARQUET_ROW_GROUP'] = 10000  # rows per Parquet row group
+
+# Upload post-processing (thumbnails, previews, metadata stripping)
+app.config['UPLOAD_WORKERS'] = 2                  # background threads processing uploads
+app.config['UPLOAD_THUMBNAIL_SIZE'] = (200, 200)  # bounding box of generated thumbnails
+app.config['UPLOAD_PREVIEW_SIZE'] = (1024, 1024)  # bounding box of previews and PDF first pages
+app.config['UPLOAD_CLAIM_TIMEOUT'] = 600          # seconds before an unfinished claim is retried
+
 
 # ==================== DATABASE CONNECTION AND HELPERS ====================
+slow_query_log = SlowQueryLog(app.config['SLOW_QUERY_LOG'], app.config['SLOW_QUERY_MS'])
+
+db_backend = create_backend(app.config['DB_BACKEND'], mysql_config=db_config,
+                            sqlite_path=app.config['DB_SQLITE_PATH'])
+
+db_pool = ConnectionPool(
+    db_backend.connect,
+    size=app.config['DB_POOL_SIZE'],
+    max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    recycle=app.config['DB_POOL_RECYCLE'],
+    pre_ping=app.config['DB_POOL_PRE_PING'],
+    ping=db_backend.ping
+)
+
 def get_db_connection():
     try:
-        connection = mysql.connector.connect(**db_config)
-        return connection
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        # close() on the returned connection hands it back to the pool
+        return db_pool.connection()
+    except PoolTimeout as e:
+        print(f"Error getting connection from pool: {e}")
+        return None
+    except DatabaseError as e:
+        print(f"Error connecting to the database: {e}")
         return None
 
+def get_db():
+    # One connection per request: every route and helper shares it, and
+    # close_db() hands it back to the pool when the request ends. Its
+    # cursors are timed into the request's QueryStats.
+    if 'db' not in g:
+        connection = get_db_connection()
+        if connection is None:
+            return None
+        g.db = InstrumentedConnection(connection, g.get('query_stats'), slow_query_log,
+                                      request.endpoint if has_request_context() else None)
+    return g.db
+
+@app.before_request
+def start_query_stats():
+    g.query_stats = QueryStats()
+    g.request_started = perf_counter()
+
+@app.after_request
+def add_server_timing(response):
+    # Server-Timing shows up in the browser's network panel next to each request
+    stats = g.get('query_stats')
+    if app.config['SERVER_TIMING'] and stats is not None:
+        elapsed = (perf_counter() - g.request_started) * 1000
+        response.headers.add('Server-Timing', f"{stats.server_timing()}, app;dur={elapsed:.1f}")
+    return response
+
+@app.teardown_appcontext
+def close_db(exception):
+    connection = g.pop('db', None)
+    if connection is not None:
+        connection.close()
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+# ==================== UPLOADS ====================
+# Requests only write the file durably and record it; thumbnails, previews
+# and metadata stripping happen on the upload worker pool (uploads.py)
+upload_processor = UploadProcessor(
+    get_db_connection,
+    workers=app.config['UPLOAD_WORKERS'],
+    thumbnail_size=app.config['UPLOAD_THUMBNAIL_SIZE'],
+    preview_size=app.config['UPLOAD_PREVIEW_SIZE'],
+    claim_timeout=app.config['UPLOAD_CLAIM_TIMEOUT']
+)
+
+def save_upload_file(file, folder):
+    # Saves under a unique name and fsyncs; returns the path on disk
+    return save_upload(file, folder, secure_filename(file.filename))
+
+def queue_upload(cursor, path):
+    # Record the upload as pending; it is handed to the worker pool when the
+    # request ends, so the route's commit is visible to the worker
+    g.setdefault('queued_uploads', []).append(record_upload(cursor, path))
+
+@app.teardown_request
+def submit_queued_uploads(exception):
+    for upload_id in g.pop('queued_uploads', []):
+        upload_processor.submit(upload_id)
+
 # ==================== DECORATORS ====================
 def login_required(f):
     @wraps(f)
@@ -74,43 +199,249 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# ==================== SETTINGS MANAGEMENT ====================
-def get_settings():
+# ==================== SCHEMA MIGRATIONS ====================
+# migrations.py owns every table and index. Pending migrations are applied
+# when the app starts (unless DB_AUTO_MIGRATE is off) and the live schema
+# is then checked against what the code expects.
+def init_schema():
     connection = get_db_connection()
-    if connection:
+    if not connection:
+        return
+    try:
+        if app.config['DB_AUTO_MIGRATE']:
+            apply_migrations(connection)
+        cursor = connection.cursor()
+        report = diff_schema(cursor)
+        cursor.close()
+        if not schema_is_current(report):
+            print("WARNING: database schema is out of date; run 'flask db-status' for details")
+    except (*DatabaseError, MigrationError) as e:
+        print(f"Error migrating database schema: {e}")
+    finally:
+        connection.close()
+
+# Bring the schema up to date before anything else touches the tables
+init_schema()
+
+@app.cli.command('db-migrate')
+def db_migrate_command():
+    """Apply pending schema migrations."""
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    try:
+        if not apply_migrations(connection):
+            print("Schema is up to date.")
+    except MigrationError as e:
+        print(f"Migration failed: {e}")
+    finally:
+        connection.close()
+
+@app.cli.command('db-status')
+def db_status_command():
+    """Show pending migrations and differences between the code and the live schema."""
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    cursor = connection.cursor()
+    report = diff_schema(cursor)
+    cursor.close()
+    connection.close()
+    
+    for version, name in report['pending']:
+        print(f"pending migration {version}: {name}")
+    for table in report['missing_tables']:
+        print(f"missing table: {table}")
+    for table, columns in report['missing_columns'].items():
+        print(f"missing columns in {table}: {', '.join(columns)}")
+    for name, table, columns in report['missing_indexes']:
+        print(f"missing index: {name} on {table} ({columns})")
+    if schema_is_current(report):
+        print("Schema is up to date.")
+
+# ==================== HEADER CONTEXT ====================
+# The storefront navbar only needs a few user columns and the cart count.
+# They are cached per user and injected into every template, and the
+# write paths that change them call invalidate_header_context().
+class HeaderContextCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if monotonic() >= entry[0]:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, context):
+        with self._lock:
+            self._entries[user_id] = (monotonic() + self.ttl, context)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+header_cache = HeaderContextCache(app.config['HEADER_CACHE_TTL'], app.config['HEADER_CACHE_SIZE'])
+
+def get_header_context():
+    user_id = session.get('user_id')
+    if not user_id:
+        return {'user': None, 'cart_count': 0}
+    
+    context = header_cache.get(user_id)
+    if context is not None:
+        return context
+    
+    connection = get_db()
+    if not connection:
+        return {'user': None, 'cart_count': 0}
+    
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT u.id, u.name, u.email, u.phone, u.image, u.role,
+               (SELECT COUNT(*) FROM cart c WHERE c.user_id = u.id) as cart_count
+        FROM users u
+        WHERE u.id = %s
+    """, (user_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    
+    if row:
+        cart_count = row.pop('cart_count')
+        context = {'user': row, 'cart_count': cart_count}
+    else:
+        context = {'user': None, 'cart_count': 0}
+    header_cache.put(user_id, context)
+    return context
+
+def invalidate_header_context(user_id):
+    header_cache.invalidate(user_id)
+
+@app.context_processor
+def inject_header_context():
+    # Values passed explicitly to render_template() still take precedence
+    return get_header_context()
+
+# ==================== SETTINGS MANAGEMENT ====================
+# Settings are read on almost every page, so they are served from an
+# in-process cache. Every write bumps the 'settings_version' row; once the
+# TTL runs out a worker compares that single row with its own copy and only
+# reloads the whole table when another worker has changed something.
+SETTINGS_VERSION_KEY = 'settings_version'
+
+class SettingsCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._settings = None
+        self._version = None
+        self._expires = 0
+
+    def get(self):
+        with self._lock:
+            if self._settings is not None and monotonic() < self._expires:
+                return dict(self._settings)
+            cached, cached_version = self._settings, self._version
+
+        connection = get_db()
+        if not connection:
+            # Serve stale settings rather than nothing while the database is down
+            return dict(cached or {})
+
         cursor = connection.cursor(dictionary=True)
-        
-        # Get current settings
-        cursor.execute("SELECT * FROM settings")
+        if cached is not None:
+            # TTL expired: only reload if another worker changed something
+            cursor.execute("SELECT setting_value FROM settings WHERE setting_key = %s", (SETTINGS_VERSION_KEY,))
+            row = cursor.fetchone()
+            version = row['setting_value'] if row else None
+            if version == cached_version:
+                cursor.close()
+                with self._lock:
+                    self._expires = monotonic() + self.ttl
+                return dict(cached)
+
+        cursor.execute("SELECT setting_key, setting_value FROM settings")
         settings_data = cursor.fetchall()
-        
+        cursor.close()
+
         # Convert to dictionary for easier access
         settings = {}
+        version = None
         for setting in settings_data:
-            settings[setting['setting_key']] = setting['setting_value']
-        
-        cursor.close()
-        connection.close()
-        
-        return settings
-    return {}
+            if setting['setting_key'] == SETTINGS_VERSION_KEY:
+                version = setting['setting_value']
+            else:
+                settings[setting['setting_key']] = setting['setting_value']
+
+        with self._lock:
+            self._settings, self._version = settings, version
+            self._expires = monotonic() + self.ttl
+        return dict(settings)
+
+    def write_through(self, updates, version):
+        # Apply a committed write locally so this worker never re-reads it.
+        # If the version skipped ahead another worker wrote too, so reload.
+        with self._lock:
+            try:
+                in_sequence = int(version) == int(self._version) + 1
+            except (TypeError, ValueError):
+                in_sequence = False
+            if self._settings is None or not in_sequence:
+                self._settings = None
+                self._expires = 0
+                return
+            self._settings.update(updates)
+            self._version = version
+            self._expires = monotonic() + self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._settings = None
+            self._version = None
+            self._expires = 0
+
+settings_cache = SettingsCache(app.config['SETTINGS_CACHE_TTL'])
+
+def get_settings():
+    return settings_cache.get()
+
+def save_settings(cursor, updates):
+    # Upsert the given keys and bump the version in the caller's transaction;
+    # returns the new version for SettingsCache.write_through()
+    placeholders = ', '.join(['(%s, %s)'] * len(updates))
+    params = [item for pair in updates.items() for item in pair]
+    cursor.execute(f"""
+        INSERT INTO settings (setting_key, setting_value)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)
+    """, params)
+    cursor.execute("""
+        INSERT INTO settings (setting_key, setting_value)
+        VALUES (%s, '1')
+        ON DUPLICATE KEY UPDATE setting_value = setting_value + 1
+    """, (SETTINGS_VERSION_KEY,))
+    cursor.execute("SELECT setting_value FROM settings WHERE setting_key = %s", (SETTINGS_VERSION_KEY,))
+    row = cursor.fetchone()
+    return row[0] if row else None
 
 def init_settings():
     connection = get_db_connection()
     if connection:
         cursor = connection.cursor()
         
-        # Create settings table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                setting_key VARCHAR(100) NOT NULL UNIQUE,
-                setting_value TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-        """)
-        
         # Insert default settings if they don't exist
         default_settings = {
             'site_name': 'test3',
@@ -120,7 +451,8 @@ def init_settings():
             'bkash_enabled': '1',
             'nagad_enabled': '1',
             'rocket_enabled': '1',
-            'cod_enabled': '1'
+            'cod_enabled': '1',
+            SETTINGS_VERSION_KEY: '0'
         }
         
         for key, value in default_settings.items():
@@ -136,6 +468,355 @@ def init_settings():
 # Initialize settings when the app starts
 init_settings()
 
+# ==================== SITE STATISTICS ====================
+# Row totals shown on the home page and admin dashboard live in a small
+# counters table. Insert and delete paths call bump_counter() inside their
+# own transaction, so reading the totals is a single primary-key scan of
+# four rows instead of four COUNT(*) over the full tables.
+SITE_COUNTERS = {
+    'total_users': 'users',
+    'total_medicines': 'medicines',
+    'total_orders': 'all_orders',
+    'total_prescriptions': 'prescriptions'
+}
+
+_site_stats_lock = threading.Lock()
+_site_stats = {'values': None, 'expires': 0}
+
+def init_site_counters():
+    connection = get_db_connection()
+    if connection:
+        cursor = connection.cursor()
+        
+        # Seed missing counters from the real tables (only counts once)
+        for key, table in SITE_COUNTERS.items():
+            cursor.execute(f"""
+                INSERT IGNORE INTO site_counters (counter_key, counter_value)
+                SELECT %s, COUNT(*) FROM {table}
+            """, (key,))
+        
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+def recount_site_counters(cursor):
+    # Re-derive every counter from the real tables (repairs any drift)
+    for key, table in SITE_COUNTERS.items():
+        cursor.execute(f"""
+            INSERT INTO site_counters (counter_key, counter_value)
+            SELECT %s, COUNT(*) FROM {table}
+            ON DUPLICATE KEY UPDATE counter_value = VALUES(counter_value)
+        """, (key,))
+
+def bump_counter(cursor, key, delta=1):
+    if delta:
+        cursor.execute("""
+            UPDATE site_counters 
+            SET counter_value = counter_value + %s 
+            WHERE counter_key = %s
+        """, (delta, key))
+
+def get_site_stats():
+    with _site_stats_lock:
+        if _site_stats['values'] is not None and monotonic() < _site_stats['expires']:
+            return dict(_site_stats['values'])
+    
+    stats = {key: 0 for key in SITE_COUNTERS}
+    connection = get_db()
+    if connection:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT counter_key, counter_value FROM site_counters")
+        for row in cursor.fetchall():
+            if row['counter_key'] in stats:
+                stats[row['counter_key']] = row['counter_value']
+        cursor.close()
+        
+        with _site_stats_lock:
+            _site_stats['values'] = stats
+            _site_stats['expires'] = monotonic() + app.config['SITE_STATS_CACHE_TTL']
+    return dict(stats)
+
+# Initialize counters when the app starts
+init_site_counters()
+
+@app.cli.command('recount-stats')
+def recount_stats_command():
+    """Recompute the site_counters table from the source tables."""
+    connection = get_db_connection()
+    if connection:
+        cursor = connection.cursor()
+        recount_site_counters(cursor)
+        connection.commit()
+        cursor.close()
+        connection.close()
+        print("Site counters recomputed.")
+    else:
+        print("Database connection error")
+
+# ==================== REPORT ROLLUPS ====================
+# Daily sales, per-product sales and signups are pre-aggregated in the
+# tables defined in rollups.py; order and user writes keep them current
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the report rollup tables from all_orders and users."""
+    connection = get_db_connection()
+    if connection:
+        cursor = connection.cursor()
+        rebuild_rollups(cursor)
+        connection.commit()
+        cursor.close()
+        connection.close()
+        print("Report rollups rebuilt.")
+    else:
+        print("Database connection error")
+
+# ==================== ORDER STORE MIGRATION ====================
+# all_orders is the canonical order table; orders and dborders become
+# compatibility views over it (see order_store.py)
+@app.cli.command('migrate-orders')
+@click.option('--force', is_flag=True, help='Keep the all_orders version of rows that disagree.')
+def migrate_orders_command(force):
+    """Replace the orders/dborders tables with views over all_orders."""
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    try:
+        migrate_legacy_orders(connection, force=force)
+        # Backfilled rows change the order total and the reports
+        cursor = connection.cursor()
+        recount_site_counters(cursor)
+        rebuild_rollups(cursor)
+        connection.commit()
+        cursor.close()
+    except OrderMigrationError as e:
+        print(f"Migration aborted: {e}")
+    finally:
+        connection.close()
+
+@app.cli.command('verify-orders')
+def verify_orders_command():
+    """Check that orders/dborders hold exactly the rows of all_orders."""
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    cursor = connection.cursor()
+    for table, result in verify_order_store(cursor).items():
+        print(f"{table}: {result['type']}, {result['count']} rows, "
+              f"{'OK' if result['matches'] else 'MISMATCH'}")
+    cursor.close()
+    connection.close()
+
+@app.cli.command('partition-orders')
+@click.option('--months-ahead', default=3, show_default=True, help='Future months to keep a partition ready for.')
+def partition_orders_command(months_ahead):
+    """Partition all_orders by month, or add the upcoming months' partitions."""
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    try:
+        partition_orders_by_month(connection, months_ahead=months_ahead)
+    except DatabaseError as e:
+        print(f"Partitioning failed: {e}")
+    finally:
+        connection.close()
+
+@app.cli.command('generate-data')
+@click.option('--scale', default=1.0, show_default=True,
+              help='Fraction of the full-size volumes (1M users, 200k medicines, 50M order lines, ...).')
+@click.option('--users', type=int, default=None, help='Users to add (overrides --scale).')
+@click.option('--medicines', type=int, default=None, help='Medicines to add (overrides --scale).')
+@click.option('--order-lines', type=int, default=None, help='Order lines to add (overrides --scale).')
+@click.option('--reviews', type=int, default=None, help='Reviews to add (overrides --scale).')
+@click.option('--carts', type=int, default=None, help='Cart rows to add (overrides --scale).')
+@click.option('--prescriptions', type=int, default=None, help='Prescriptions to add (overrides --scale).')
+@click.option('--days', default=730, show_default=True, help='Days of history the timestamps cover.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per multi-row INSERT.')
+@click.option('--seed', default=1, show_default=True, help='Random seed.')
+@click.option('--load-data', is_flag=True, help='Write through LOAD DATA LOCAL INFILE files (MySQL only).')
+def generate_data_command(scale, users, medicines, order_lines, reviews, carts, prescriptions, days,
+                          batch_size, seed, load_data):
+    """Bulk-load synthetic users, medicines, orders, reviews, carts and prescriptions."""
+    counts = {table: count for table, count in (('users', users), ('medicines', medicines),
+                                                ('order_lines', order_lines), ('reviews', reviews),
+                                                ('carts', carts), ('prescriptions', prescriptions))
+              if count is not None}
+    if load_data:
+        if app.config['DB_BACKEND'] != 'mysql':
+            print("--load-data needs the MySQL backend")
+            return
+        # LOAD DATA LOCAL has to be allowed when the connection is opened
+        connection = MySQLBackend({**db_config, 'allow_local_infile': True}).connect()
+    else:
+        connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    try:
+        written = generate_data(connection, scale=scale, counts=counts, days=days, batch_size=batch_size,
+                                seed=seed, load_data=load_data)
+        # Generated rows skip the write paths that keep these up to date
+        cursor = connection.cursor()
+        rebuild_rollups(cursor)
+        recount_site_counters(cursor)
+        connection.commit()
+        cursor.close()
+        print(f"Generated {sum(written.values())} rows; report rollups and site counters rebuilt.")
+    except DatabaseError as e:
+        connection.rollback()
+        print(f"Data generation failed: {e}")
+    finally:
+        connection.close()
+
+@app.cli.command('link-order-medicines')
+def link_order_medicines_command():
+    """Fill in medicine_id for order lines that are still unlinked."""
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    try:
+        updated = ensure_order_medicine_link(connection, log=lambda message: None)
+        print(f"Linked {updated} order lines to medicines.")
+    finally:
+        connection.close()
+
+@app.cli.command('process-uploads')
+def process_uploads_command():
+    """Process uploads still pending or abandoned, e.g. after a restart."""
+    statuses = {}
+    for upload_id in upload_processor.pending_ids():
+        status = upload_processor.process(upload_id)
+        statuses[status] = statuses.get(status, 0) + 1
+    statuses.pop(None, None)
+    if not statuses:
+        print("No pending uploads.")
+    for status, count in sorted(statuses.items()):
+        print(f"{status}: {count}")
+
+
+
+# ==================== KEYSET PAGINATION ====================
+# Admin lists page with "seek" cursors instead of LIMIT/OFFSET: each page
+# continues from the sort key of the last row shown, so page 10,000 costs
+# the same index range scan as page 1. Cursors are opaque URL-safe tokens.
+def encode_page_token(values):
+    encoded = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(encoded).encode('utf-8')).decode('ascii')
+
+def decode_page_token(token, keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        if len(values) != len(keys):
+            return None
+        decoded = []
+        for (column, kind), value in zip(keys, values):
+            decoded.append(datetime.fromisoformat(value) if kind == 'datetime' else int(value))
+        return decoded
+    except (ValueError, TypeError):
+        return None
+
+def _seek_predicate(keys, values, op):
+    # (a, b) < (x, y) expanded to "a < x OR (a = x AND b < y)", which
+    # every MySQL version can turn into an index range scan
+    clauses = []
+    params = []
+    for i, (column, _) in enumerate(keys):
+        parts = [f"{prev} = %s" for prev, _ in keys[:i]] + [f"{column} {op} %s"]
+        clauses.append("(" + " AND ".join(parts) + ")")
+        params.extend(values[:i] + [values[i]])
+    return "(" + " OR ".join(clauses) + ")", params
+
+def keyset_paginate(cursor, base_query, keys, descending=False, per_page=10, after=None, before=None,
+                    where=None, where_params=()):
+    # keys: [(column, 'int' | 'datetime'), ...] forming a unique sort order;
+    # where/where_params optionally filter the rows being paged
+    after_values = decode_page_token(after, keys) if after else None
+    before_values = decode_page_token(before, keys) if before else None
+    backwards = before_values is not None and after_values is None
+    
+    # Walking backwards flips both the comparison and the sort direction
+    scan_desc = descending != backwards
+    direction = 'DESC' if scan_desc else 'ASC'
+    conditions = [where] if where else []
+    params = list(where_params)
+    seek_values = before_values if backwards else after_values
+    if seek_values is not None:
+        predicate, seek_params = _seek_predicate(keys, seek_values, '<' if scan_desc else '>')
+        conditions.append(predicate)
+        params.extend(seek_params)
+    query = base_query
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY " + ", ".join(f"{column} {direction}" for column, _ in keys)
+    query += " LIMIT %s"
+    params.append(per_page + 1)
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    def token(row):
+        return encode_page_token([row[column] for column, _ in keys])
+    
+    next_token = prev_token = None
+    if rows:
+        if backwards:
+            next_token = token(rows[-1])
+            prev_token = token(rows[0]) if has_more else None
+        else:
+            next_token = token(rows[-1]) if has_more else None
+            prev_token = token(rows[0]) if seek_values is not None else None
+    return rows, next_token, prev_token
+
+def admin_list_total(cursor, table, counter_key, count_mode):
+    # 'estimate' reads the maintained site counter, 'exact' runs COUNT(*),
+    # 'none' skips the total entirely
+    if count_mode == 'none':
+        return None
+    if count_mode == 'exact':
+        cursor.execute(f"SELECT COUNT(*) as total FROM {table}")
+        return cursor.fetchone()['total']
+    return get_site_stats()[counter_key]
+
+def admin_list_page(table, counter_key, keys, descending=False):
+    # Shared body of the admin list routes; returns the template arguments
+    per_page = 10
+    page = max(1, request.args.get('page', 1, type=int))
+    after = request.args.get('after')
+    before = request.args.get('before')
+    count_mode = request.args.get('count', 'estimate')
+    if not after and not before:
+        page = 1
+    
+    connection = get_db()
+    if not connection:
+        return None
+    cursor = connection.cursor(dictionary=True)
+    
+    rows, next_token, prev_token = keyset_paginate(
+        cursor, f"SELECT * FROM {table}", keys,
+        descending=descending, per_page=per_page, after=after, before=before
+    )
+    total = admin_list_total(cursor, table, counter_key, count_mode)
+    cursor.close()
+    
+    total_pages = max(1, (total + per_page - 1) // per_page) if total is not None else None
+    if prev_token is None:
+        page = 1
+    return {
+        'rows': rows,
+        'current_page': page,
+        'total_pages': total_pages,
+        'next_token': next_token,
+        'prev_token': prev_token,
+        'count_mode': count_mode if count_mode != 'estimate' else None
+    }
 
 
 # ==================== ADMIN ROUTES ====================
@@ -144,30 +825,21 @@ init_settings()
 @login_required
 @admin_required
 def admin_dashboard():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
         # Get stats for dashboard
-        # Total Sales
-        cursor.execute("SELECT SUM(price) as total FROM all_orders")
-        sales_data = cursor.fetchone()
-        total_sales = sales_data['total'] if sales_data and sales_data['total'] else 0
-        
-        # Total Users
-        cursor.execute("SELECT COUNT(*) as total FROM users")
-        users_data = cursor.fetchone()
-        total_users = users_data['total']
-        
-        # Total Orders
-        cursor.execute("SELECT COUNT(*) as total FROM all_orders")
-        orders_data = cursor.fetchone()
-        total_orders = orders_data['total']
-        
-        # Total Medicines
-        cursor.execute("SELECT COUNT(*) as total FROM medicines")
-        medicines_data = cursor.fetchone()
-        total_medicines = medicines_data['total']
+        # Total Sales (summed from the daily rollup)
+        rollup_cursor = connection.cursor()
+        total_sales = total_revenue(rollup_cursor) or 0
+        rollup_cursor.close()
+        
+        # Total Users, Orders and Medicines
+        stats = get_site_stats()
+        total_users = stats['total_users']
+        total_orders = stats['total_orders']
+        total_medicines = stats['total_medicines']
         
         # Recent Activity
         cursor.execute("""
@@ -201,7 +873,6 @@ def admin_dashboard():
         new_orders = cursor.fetchall()
         
         cursor.close()
-        connection.close()
         
         return render_template('admin-dashboard.html', 
                               total_sales=total_sales,
@@ -221,30 +892,15 @@ def admin_dashboard():
 @login_required
 @admin_required
 def manage_users():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    offset = (page - 1) * per_page
-    
-    connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get total users count for pagination
-        cursor.execute("SELECT COUNT(*) as total FROM users")
-        total_users = cursor.fetchone()['total']
-        total_pages = (total_users + per_page - 1) // per_page
-        
-        # Get users with pagination
-        cursor.execute("SELECT * FROM users LIMIT %s OFFSET %s", (per_page, offset))
-        users = cursor.fetchall()
-        
-        cursor.close()
-        connection.close()
-        
+    page_data = admin_list_page('users', 'total_users', [('id', 'int')])
+    if page_data is not None:
         return render_template('admin-dashboard.html', 
-                              users=users,
-                              current_page=page,
-                              total_pages=total_pages,
+                              users=page_data['rows'],
+                              current_page=page_data['current_page'],
+                              total_pages=page_data['total_pages'],
+                              next_token=page_data['next_token'],
+                              prev_token=page_data['prev_token'],
+                              count_mode=page_data['count_mode'],
                               active_section='users',
                               # Add these to prevent errors in other sections
                               total_sales=0,
@@ -271,13 +927,11 @@ def add_user():
         image_path = None
         if image_file and image_file.filename != '':
             # Save the image file
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(image_path)
+            filename = os.path.basename(save_upload_file(image_file, app.config['UPLOAD_FOLDER']))
             # Convert to relative path for database
             image_path = f"/static/uploads/{filename}"
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             
@@ -286,6 +940,10 @@ def add_user():
                     INSERT INTO users (name, email, phone, password, address, role, image)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """, (name, email, phone, password, address, role, image_path))
+                record_signup_rollups(cursor, [cursor.lastrowid])
+                bump_counter(cursor, 'total_users')
+                if image_path:
+                    queue_upload(cursor, image_path)
                 
                 connection.commit()
                 flash('User added successfully!', 'success')
@@ -294,7 +952,6 @@ def add_user():
                 flash(f'Error adding user: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('manage_users'))
 
@@ -315,13 +972,11 @@ def edit_user(user_id):
         image_path = None
         if image_file and image_file.filename != '':
             # Save the image file
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(image_path)
+            filename = os.path.basename(save_upload_file(image_file, app.config['UPLOAD_FOLDER']))
             # Convert to relative path for database
             image_path = f"/static/uploads/{filename}"
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             
@@ -332,6 +987,7 @@ def edit_user(user_id):
                         SET name = %s, email = %s, phone = %s, address = %s, role = %s, image = %s
                         WHERE id = %s
                     """, (name, email, phone, address, role, image_path, user_id))
+                    queue_upload(cursor, image_path)
                 else:
                     cursor.execute("""
                         UPDATE users 
@@ -340,13 +996,13 @@ def edit_user(user_id):
                     """, (name, email, phone, address, role, user_id))
                 
                 connection.commit()
+                invalidate_header_context(user_id)
                 flash('User updated successfully!', 'success')
             except Exception as e:
                 connection.rollback()
                 flash(f'Error updating user: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('manage_users'))
 
@@ -355,20 +1011,22 @@ def edit_user(user_id):
 @login_required
 @admin_required
 def delete_user(user_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor()
         
         try:
+            record_signup_rollups(cursor, [user_id], -1)
             cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            bump_counter(cursor, 'total_users', -cursor.rowcount)
             connection.commit()
+            invalidate_header_context(user_id)
             flash('User deleted successfully!', 'success')
         except Exception as e:
             connection.rollback()
             flash(f'Error deleting user: {str(e)}', 'danger')
         finally:
             cursor.close()
-            connection.close()
     
     return redirect(url_for('manage_users'))
 
@@ -377,7 +1035,7 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def view_user(user_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -385,7 +1043,6 @@ def view_user(user_id):
         user = cursor.fetchone()
         
         cursor.close()
-        connection.close()
         
         if user:
             return render_template('admin-dashboard.html', 
@@ -405,13 +1062,12 @@ def view_user(user_id):
 @login_required
 @admin_required
 def get_user(user_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
         user = cursor.fetchone()
         cursor.close()
-        connection.close()
         
         if user:
             return jsonify(user)
@@ -424,30 +1080,15 @@ def get_user(user_id):
 @login_required
 @admin_required
 def manage_medicines():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    offset = (page - 1) * per_page
-    
-    connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get total medicines count for pagination
-        cursor.execute("SELECT COUNT(*) as total FROM medicines")
-        total_medicines = cursor.fetchone()['total']
-        total_pages = (total_medicines + per_page - 1) // per_page
-        
-        # Get medicines with pagination
-        cursor.execute("SELECT * FROM medicines LIMIT %s OFFSET %s", (per_page, offset))
-        medicines = cursor.fetchall()
-        
-        cursor.close()
-        connection.close()
-        
+    page_data = admin_list_page('medicines', 'total_medicines', [('id', 'int')])
+    if page_data is not None:
         return render_template('admin-dashboard.html', 
-                              medicines=medicines,
-                              current_page=page,
-                              total_pages=total_pages,
+                              medicines=page_data['rows'],
+                              current_page=page_data['current_page'],
+                              total_pages=page_data['total_pages'],
+                              next_token=page_data['next_token'],
+                              prev_token=page_data['prev_token'],
+                              count_mode=page_data['count_mode'],
                               active_section='medicines',
                               # Add these to prevent errors in other sections
                               total_sales=0,
@@ -474,13 +1115,11 @@ def add_medicine():
         image_path = None
         if image_file and image_file.filename != '':
             # Save the image file
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(image_path)
+            filename = os.path.basename(save_upload_file(image_file, app.config['UPLOAD_FOLDER']))
             # Convert to relative path for database
             image_path = f"/static/uploads/{filename}"
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             
@@ -489,15 +1128,19 @@ def add_medicine():
                     INSERT INTO medicines (name, price, stock_quantity, ratings, details, category, image)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """, (name, price, stock, rating, details, category, image_path))
+                medicine_id = cursor.lastrowid
+                bump_counter(cursor, 'total_medicines')
+                if image_path:
+                    queue_upload(cursor, image_path)
                 
                 connection.commit()
+                refresh_catalog([medicine_id])
                 flash('Medicine added successfully!', 'success')
             except Exception as e:
                 connection.rollback()
                 flash(f'Error adding medicine: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('manage_medicines'))
 
@@ -519,13 +1162,11 @@ def edit_medicine(medicine_id):
         image_path = None
         if image_file and image_file.filename != '':
             # Save the image file
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(image_path)
+            filename = os.path.basename(save_upload_file(image_file, app.config['UPLOAD_FOLDER']))
             # Convert to relative path for database
             image_path = f"/static/uploads/{filename}"
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             
@@ -536,6 +1177,7 @@ def edit_medicine(medicine_id):
                         SET name = %s, price = %s, stock_quantity = %s, ratings = %s, details = %s, category = %s, image = %s
                         WHERE id = %s
                     """, (name, price, stock, rating, details, category, image_path, medicine_id))
+                    queue_upload(cursor, image_path)
                 else:
                     cursor.execute("""
                         UPDATE medicines 
@@ -544,13 +1186,13 @@ def edit_medicine(medicine_id):
                     """, (name, price, stock, rating, details, category, medicine_id))
                 
                 connection.commit()
+                refresh_catalog([medicine_id])
                 flash('Medicine updated successfully!', 'success')
             except Exception as e:
                 connection.rollback()
                 flash(f'Error updating medicine: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('manage_medicines'))
 
@@ -559,20 +1201,21 @@ def edit_medicine(medicine_id):
 @login_required
 @admin_required
 def delete_medicine(medicine_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor()
         
         try:
             cursor.execute("DELETE FROM medicines WHERE id = %s", (medicine_id,))
+            bump_counter(cursor, 'total_medicines', -cursor.rowcount)
             connection.commit()
+            catalog_index.remove(medicine_id)
             flash('Medicine deleted successfully!', 'success')
         except Exception as e:
             connection.rollback()
             flash(f'Error deleting medicine: {str(e)}', 'danger')
         finally:
             cursor.close()
-            connection.close()
     
     return redirect(url_for('manage_medicines'))
 
@@ -581,7 +1224,7 @@ def delete_medicine(medicine_id):
 @login_required
 @admin_required
 def view_medicine(medicine_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -589,7 +1232,6 @@ def view_medicine(medicine_id):
         medicine = cursor.fetchone()
         
         cursor.close()
-        connection.close()
         
         if medicine:
             return render_template('admin-dashboard.html', 
@@ -609,13 +1251,12 @@ def view_medicine(medicine_id):
 @login_required
 @admin_required
 def get_medicine(medicine_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("SELECT * FROM medicines WHERE id = %s", (medicine_id,))
         medicine = cursor.fetchone()
         cursor.close()
-        connection.close()
         
         if medicine:
             return jsonify(medicine)
@@ -628,30 +1269,15 @@ def get_medicine(medicine_id):
 @login_required
 @admin_required
 def manage_orders():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    offset = (page - 1) * per_page
-    
-    connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get total orders count for pagination
-        cursor.execute("SELECT COUNT(*) as total FROM all_orders")
-        total_orders = cursor.fetchone()['total']
-        total_pages = (total_orders + per_page - 1) // per_page
-        
-        # Get orders with pagination
-        cursor.execute("SELECT * FROM all_orders ORDER BY created_at DESC LIMIT %s OFFSET %s", (per_page, offset))
-        orders = cursor.fetchall()
-        
-        cursor.close()
-        connection.close()
-        
+    page_data = admin_list_page('all_orders', 'total_orders', [('created_at', 'datetime'), ('id', 'int')], descending=True)
+    if page_data is not None:
         return render_template('admin-dashboard.html', 
-                              orders=orders,
-                              current_page=page,
-                              total_pages=total_pages,
+                              orders=page_data['rows'],
+                              current_page=page_data['current_page'],
+                              total_pages=page_data['total_pages'],
+                              next_token=page_data['next_token'],
+                              prev_token=page_data['prev_token'],
+                              count_mode=page_data['count_mode'],
                               active_section='orders',
                               # Add these to prevent errors in other sections
                               total_sales=0,
@@ -677,31 +1303,21 @@ def add_order():
         address = request.form.get('orderAddress')
         instructions = request.form.get('orderInstructions')
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             
             try:
                 # Insert into all_orders table
                 cursor.execute("""
-                    INSERT INTO all_orders (ordered_by, phone, email, address, product, quantity, price, payment_method, special_instruction, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (customer, phone, email, address, product, quantity, price, payment, instructions, status))
+                    INSERT INTO all_orders (ordered_by, phone, email, address, product, medicine_id, quantity, price, payment_method, special_instruction, status)
+                    VALUES (%s, %s, %s, %s, %s, (SELECT MIN(id) FROM medicines WHERE name = %s), %s, %s, %s, %s, %s)
+                """, (customer, phone, email, address, product, product, quantity, price, payment, instructions, status))
                 
                 # Get the last inserted ID
                 order_id = cursor.lastrowid
-                
-                # Insert into orders table
-                cursor.execute("""
-                    INSERT INTO orders (ordered_by, phone, email, address, product, quantity, price, payment_method, special_instruction, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (customer, phone, email, address, product, quantity, price, payment, instructions, status))
-                
-                # Insert into dborders table
-                cursor.execute("""
-                    INSERT INTO dborders (ordered_by, phone, email, address, product, quantity, price, payment_method, special_instruction, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (customer, phone, email, address, product, quantity, price, payment, instructions, status))
+                record_order_rollups(cursor, [order_id])
+                bump_counter(cursor, 'total_orders')
                 
                 connection.commit()
                 flash('Order added successfully!', 'success')
@@ -710,7 +1326,6 @@ def add_order():
                 flash(f'Error adding order: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('manage_orders'))
 
@@ -731,7 +1346,7 @@ def edit_order(order_id):
         address = request.form.get('orderAddress')
         instructions = request.form.get('orderInstructions')
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor(dictionary=True)
             
@@ -740,14 +1355,19 @@ def edit_order(order_id):
                 cursor.execute("SELECT * FROM all_orders WHERE id = %s", (order_id,))
                 original_order = cursor.fetchone()
                 
+                # Keep the existing link unless the product was renamed
+                medicine_id = original_order['medicine_id'] if original_order else None
+                if medicine_id is None or product != original_order['product']:
+                    cursor.execute("SELECT MIN(id) AS id FROM medicines WHERE name = %s", (product,))
+                    medicine_id = cursor.fetchone()['id']
+                
                 if original_order:
                     original_quantity = original_order['quantity']
                     quantity_diff = quantity - original_quantity
                     
                     # If quantity increased, decrease stock
-                    if quantity_diff > 0:
-                        # Find the medicine by name
-                        cursor.execute("SELECT * FROM medicines WHERE name = %s", (product,))
+                    if quantity_diff > 0 and medicine_id is not None:
+                        cursor.execute("SELECT * FROM medicines WHERE id = %s", (medicine_id,))
                         medicine = cursor.fetchone()
                         
                         if medicine:
@@ -758,38 +1378,26 @@ def edit_order(order_id):
                                 flash('Not enough stock available!', 'danger')
                                 connection.rollback()
                                 cursor.close()
-                                connection.close()
                                 return redirect(url_for('manage_orders'))
                 
-                # Update all_orders table
+                # Update all_orders table, swapping the old row for the new one in the rollups
+                record_order_rollups(cursor, [order_id], -1)
                 cursor.execute("""
                     UPDATE all_orders 
-                    SET ordered_by = %s, phone = %s, email = %s, address = %s, product = %s, quantity = %s, price = %s, payment_method = %s, special_instruction = %s, status = %s
-                    WHERE id = %s
-                """, (customer, phone, email, address, product, quantity, price, payment, instructions, status, order_id))
-                
-                # Update orders table
-                cursor.execute("""
-                    UPDATE orders 
-                    SET ordered_by = %s, phone = %s, email = %s, address = %s, product = %s, quantity = %s, price = %s, payment_method = %s, special_instruction = %s, status = %s
-                    WHERE id = %s
-                """, (customer, phone, email, address, product, quantity, price, payment, instructions, status, order_id))
-                
-                # Update dborders table
-                cursor.execute("""
-                    UPDATE dborders 
-                    SET ordered_by = %s, phone = %s, email = %s, address = %s, product = %s, quantity = %s, price = %s, payment_method = %s, special_instruction = %s, status = %s
+                    SET ordered_by = %s, phone = %s, email = %s, address = %s, product = %s, medicine_id = %s, quantity = %s, price = %s, payment_method = %s, special_instruction = %s, status = %s
                     WHERE id = %s
-                """, (customer, phone, email, address, product, quantity, price, payment, instructions, status, order_id))
+                """, (customer, phone, email, address, product, medicine_id, quantity, price, payment, instructions, status, order_id))
+                record_order_rollups(cursor, [order_id])
                 
                 connection.commit()
+                if medicine_id is not None:
+                    refresh_catalog([medicine_id])
                 flash('Order updated successfully!', 'success')
             except Exception as e:
                 connection.rollback()
                 flash(f'Error updating order: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('manage_orders'))
 
@@ -800,20 +1408,14 @@ def edit_order(order_id):
 def update_order_status(order_id):
     status = request.form.get('status')
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor()
         
         try:
-            # Update all_orders table
+            # Update all_orders table (orders and dborders are views over it)
             cursor.execute("UPDATE all_orders SET status = %s WHERE id = %s", (status, order_id))
             
-            # Update orders table
-            cursor.execute("UPDATE orders SET status = %s WHERE id = %s", (status, order_id))
-            
-            # Update dborders table
-            cursor.execute("UPDATE dborders SET status = %s WHERE id = %s", (status, order_id))
-            
             connection.commit()
             flash('Order status updated successfully!', 'success')
         except Exception as e:
@@ -821,7 +1423,6 @@ def update_order_status(order_id):
             flash(f'Error updating order status: {str(e)}', 'danger')
         finally:
             cursor.close()
-            connection.close()
     
     return redirect(url_for('manage_orders'))
 
@@ -830,19 +1431,15 @@ def update_order_status(order_id):
 @login_required
 @admin_required
 def delete_order(order_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor()
         
         try:
             # Delete from all_orders table
+            record_order_rollups(cursor, [order_id], -1)
             cursor.execute("DELETE FROM all_orders WHERE id = %s", (order_id,))
-            
-            # Delete from orders table
-            cursor.execute("DELETE FROM orders WHERE id = %s", (order_id,))
-            
-            # Delete from dborders table
-            cursor.execute("DELETE FROM dborders WHERE id = %s", (order_id,))
+            bump_counter(cursor, 'total_orders', -cursor.rowcount)
             
             connection.commit()
             flash('Order deleted successfully!', 'success')
@@ -851,7 +1448,6 @@ def delete_order(order_id):
             flash(f'Error deleting order: {str(e)}', 'danger')
         finally:
             cursor.close()
-            connection.close()
     
     return redirect(url_for('manage_orders'))
 
@@ -860,7 +1456,7 @@ def delete_order(order_id):
 @login_required
 @admin_required
 def view_order(order_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -868,7 +1464,6 @@ def view_order(order_id):
         order = cursor.fetchone()
         
         cursor.close()
-        connection.close()
         
         if order:
             return render_template('admin-dashboard.html', 
@@ -888,13 +1483,12 @@ def view_order(order_id):
 @login_required
 @admin_required
 def get_order(order_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("SELECT * FROM all_orders WHERE id = %s", (order_id,))
         order = cursor.fetchone()
         cursor.close()
-        connection.close()
         
         if order:
             return jsonify(order)
@@ -902,6 +1496,13 @@ def get_order(order_id):
             return jsonify({"error": "Order not found"}), 404
     return jsonify({"error": "Database connection error"}), 500
 
+# Database Pool Stats (AJAX)
+@app.route('/admin/db/pool')
+@login_required
+@admin_required
+def pool_stats():
+    return jsonify(db_pool.stats())
+
 
 # Settings
 @app.route('/admin/settings', methods=['GET', 'POST'])
@@ -920,33 +1521,32 @@ def settings():
         rocket_enabled = 'rocket' in request.form
         cod_enabled = 'cod' in request.form
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             
             try:
-                # Update or insert site settings
-                cursor.execute("""
-                    INSERT INTO settings (setting_key, setting_value)
-                    VALUES ('site_name', %s), ('site_email', %s), ('site_phone', %s), ('site_address', %s)
-                    ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)
-                """, (site_name, site_email, site_phone, site_address))
-                
-                # Update payment settings
-                cursor.execute("""
-                    INSERT INTO settings (setting_key, setting_value)
-                    VALUES ('bkash_enabled', %s), ('nagad_enabled', %s), ('rocket_enabled', %s), ('cod_enabled', %s)
-                    ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)
-                """, (str(int(bkash_enabled)), str(int(nagad_enabled)), str(int(rocket_enabled)), str(int(cod_enabled))))
+                # Update or insert site and payment settings
+                updates = {
+                    'site_name': site_name,
+                    'site_email': site_email,
+                    'site_phone': site_phone,
+                    'site_address': site_address,
+                    'bkash_enabled': str(int(bkash_enabled)),
+                    'nagad_enabled': str(int(nagad_enabled)),
+                    'rocket_enabled': str(int(rocket_enabled)),
+                    'cod_enabled': str(int(cod_enabled))
+                }
+                version = save_settings(cursor, updates)
                 
                 connection.commit()
+                settings_cache.write_through(updates, version)
                 flash('Settings updated successfully!', 'success')
             except Exception as e:
                 connection.rollback()
                 flash(f'Error updating settings: {str(e)}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
         return redirect(url_for('settings'))
     else:
@@ -963,45 +1563,27 @@ def settings():
 @login_required
 @admin_required
 def reports():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
+        # Charts are read from the pre-aggregated rollup tables
+        year = datetime.now().year
+        
         # Get sales data for the chart
-        cursor.execute("""
-            SELECT MONTH(created_at) as month, SUM(price) as total
-            FROM all_orders
-            WHERE YEAR(created_at) = YEAR(CURRENT_DATE)
-            GROUP BY MONTH(created_at)
-            ORDER BY month
-        """)
-        sales_data = cursor.fetchall()
+        sales_data = monthly_sales(cursor, year)
         
         # Get top selling medicines
-        cursor.execute("""
-            SELECT product, SUM(quantity) as total_sold
-            FROM all_orders
-            GROUP BY product
-            ORDER BY total_sold DESC
-            LIMIT 5
-        """)
-        top_medicines = cursor.fetchall()
+        top_medicines = top_products(cursor, 5)
         
         # Get user growth data
-        cursor.execute("""
-            SELECT MONTH(created_at) as month, COUNT(*) as total
-            FROM users
-            WHERE YEAR(created_at) = YEAR(CURRENT_DATE)
-            GROUP BY MONTH(created_at)
-            ORDER BY month
-        """)
-        user_growth = cursor.fetchall()
+        user_growth = monthly_signups(cursor, year)
         
         # Create a complete array for all 12 months for user growth
         user_growth_array = [0] * 12
         for item in user_growth:
             if 1 <= item['month'] <= 12:
-                user_growth_array[item['month'] - 1] = item['total']
+                user_growth_array[item['month'] - 1] = int(item['total'])
         
         # Prepare medicine data for the chart
         medicine_names = []
@@ -1017,7 +1599,6 @@ def reports():
             medicine_sales = [245, 187, 132, 98, 76]
         
         cursor.close()
-        connection.close()
         
         return render_template('admin-dashboard.html', 
                               sales_data=sales_data,
@@ -1037,158 +1618,74 @@ def reports():
 @login_required
 @admin_required
 def export_report(report_type):
+    report = EXPORT_REPORTS.get(report_type)
+    if report is None:
+        flash('Invalid report type', 'danger')
+        return redirect(url_for('reports'))
+    
+    # Optional format and filters, e.g. ?format=csv.gz&start=2024-01-01&status=Delivered&columns=id,price
+    export_format = request.args.get('format', 'csv')
+    columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+    statuses = [s.strip() for s in request.args.get('status', '').split(',') if s.strip()]
+    if export_format not in EXPORT_FORMATS:
+        flash('Invalid export format', 'danger')
+        return redirect(url_for('reports'))
+    if export_format == 'parquet' and not parquet_available():
+        flash('Parquet export is not available on this server', 'danger')
+        return redirect(url_for('reports'))
+    try:
+        query, params, columns = export_query(
+            report, columns,
+            request.args.get('start') or None, request.args.get('end') or None, statuses
+        )
+    except ExportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports'))
+    
+    # The export gets its own connection: the rows are streamed after this
+    # view returns, when the request's connection has already gone back
     connection = get_db_connection()
     if connection:
-        cursor = connection.cursor(dictionary=True)
-        
-        if report_type == 'sales':
-            # Get sales data
-            cursor.execute("""
-                SELECT id, ordered_by, phone, email, product, quantity, price, payment_method, status, created_at
-                FROM all_orders
-                ORDER BY created_at DESC
-            """)
-            data = cursor.fetchall()
-            
-            # Create CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow(['Order ID', 'Customer', 'Phone', 'Email', 'Product', 'Quantity', 'Price', 'Payment Method', 'Status', 'Date'])
-            
-            # Write data
-            for row in data:
-                writer.writerow([
-                    row['id'],
-                    row['ordered_by'],
-                    row['phone'],
-                    row['email'],
-                    row['product'],
-                    row['quantity'],
-                    row['price'],
-                    row['payment_method'],
-                    row['status'],
-                    row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-                ])
-            
-            filename = f"sales_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-        elif report_type == 'users':
-            # Get users data
-            cursor.execute("""
-                SELECT id, name, email, phone, address, role, created_at
-                FROM users
-                ORDER BY created_at DESC
-            """)
-            data = cursor.fetchall()
-            
-            # Create CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow(['User ID', 'Name', 'Email', 'Phone', 'Address', 'Role', 'Registration Date'])
-            
-            # Write data
-            for row in data:
-                writer.writerow([
-                    row['id'],
-                    row['name'],
-                    row['email'],
-                    row['phone'],
-                    row['address'],
-                    row['role'],
-                    row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-                ])
-            
-            filename = f"users_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-        elif report_type == 'medicines':
-            # Get medicines data
-            cursor.execute("""
-                SELECT id, name, price, stock_quantity, sold_quantity, ratings, category, details
-                FROM medicines
-                ORDER BY name ASC
-            """)
-            data = cursor.fetchall()
-            
-            # Create CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow(['Medicine ID', 'Name', 'Price', 'Stock Quantity', 'Sold Quantity', 'Rating', 'Category', 'Details'])
-            
-            # Write data
-            for row in data:
-                writer.writerow([
-                    row['id'],
-                    row['name'],
-                    row['price'],
-                    row['stock_quantity'],
-                    row['sold_quantity'],
-                    row['ratings'],
-                    row['category'],
-                    row['details']
-                ])
-            
-            filename = f"medicines_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-        elif report_type == 'orders':
-            # Get orders data
-            cursor.execute("""
-                SELECT id, ordered_by, phone, email, product, quantity, price, payment_method, status, created_at
-                FROM all_orders
-                ORDER BY created_at DESC
-            """)
-            data = cursor.fetchall()
-            
-            # Create CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow(['Order ID', 'Customer', 'Phone', 'Email', 'Product', 'Quantity', 'Price', 'Payment Method', 'Status', 'Date'])
-            
-            # Write data
-            for row in data:
-                writer.writerow([
-                    row['id'],
-                    row['ordered_by'],
-                    row['phone'],
-                    row['email'],
-                    row['product'],
-                    row['quantity'],
-                    row['price'],
-                    row['payment_method'],
-                    row['status'],
-                    row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-                ])
-            
-            filename = f"orders_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-        else:
-            flash('Invalid report type', 'danger')
-            return redirect(url_for('reports'))
-        
-        cursor.close()
-        connection.close()
-        
-        # Create response
-        output.seek(0)
+        connection = InstrumentedConnection(connection, None, slow_query_log, request.endpoint)
+        # Unbuffered cursor: rows stay on the server until fetched
+        cursor = connection.cursor(buffered=False)
+        try:
+            cursor.execute(query, params)
+        except DatabaseError as e:
+            cursor.close()
+            connection.close()
+            print(f"Error exporting {report_type} report: {e}")
+            return "Database error", 500
         
-        # Create a temporary file
-        temp_file = io.BytesIO()
-        temp_file.write(output.getvalue().encode('utf-8'))
-        temp_file.seek(0)
+        def release():
+            try:
+                cursor.close()
+            except DatabaseError:
+                pass
+            connection.close()
         
-        return send_file(
-            temp_file,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+        chunk_rows = app.config['EXPORT_CHUNK_ROWS']
+        if export_format == 'jsonl':
+            body = stream_jsonl(cursor, columns, chunk_rows)
+        elif export_format == 'parquet':
+            body = stream_parquet(cursor, columns, app.config['EXPORT_PARQUET_ROW_GROUP'])
+        else:
+            headers = [header for column, header in report['columns'] if column in columns]
+            body = stream_csv(cursor, headers, chunk_rows)
+            if export_format == 'csv.gz':
+                body = stream_gzip(body)
+        
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        response = Response(
+            body,
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
+        # Runs when the server closes the response, even if the body was
+        # never iterated (HEAD requests, clients gone before the first chunk)
+        response.call_on_close(release)
+        return response
     
     return "Database connection error", 500
 
@@ -1201,16 +1698,24 @@ def update_admin_profile():
     image_file = request.files.get('adminProfileImage')
     image_path = None
     if image_file and image_file.filename != '':
-        # Create a unique filename
-        filename = secure_filename(image_file.filename)
-        # Add a timestamp to make it unique
-        filename = f"{int(time())}_{filename}"
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        image_file.save(image_path)
+        # Saved under a unique (timestamped) filename
+        filename = os.path.basename(save_upload_file(image_file, app.config['UPLOAD_FOLDER']))
         # Convert to relative path for database and session
         image_path = f"/static/uploads/{filename}"
         # Update session with new image path
         session['admin_image'] = image_path
+        
+        connection = get_db()
+        if connection:
+            cursor = connection.cursor()
+            try:
+                queue_upload(cursor, image_path)
+                connection.commit()
+            except DatabaseError as e:
+                connection.rollback()
+                print(f"Error recording admin profile image: {e}")
+            finally:
+                cursor.close()
     
     name = request.form.get('adminName')
     email = request.form.get('adminEmail')
@@ -1236,17 +1741,17 @@ def login():
         email = request.form['email']
         password = request.form['password']
         
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor(dictionary=True)
             cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
             user = cursor.fetchone()
             cursor.close()
-            connection.close()
             
             if user and user['password'] == password:  # In production, use password hashing
                 session['user_id'] = user['id']
                 session['user_name'] = user['name']
+                session['email'] = user['email']
                 session['role'] = user.get('role', 'user')  # Default to 'user' if role not set
                 flash('Login successful!', 'success')
                 
@@ -1280,7 +1785,7 @@ def signup():
             return redirect(url_for('index'))
         
         # Check if email already exists
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor(dictionary=True)
             cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
@@ -1289,7 +1794,6 @@ def signup():
             if existing_user:
                 flash('Email already registered', 'danger')
                 cursor.close()
-                connection.close()
                 return redirect(url_for('index'))
             
             # Insert new user
@@ -1298,13 +1802,14 @@ def signup():
                     INSERT INTO users (name, email, phone, password) 
                     VALUES (%s, %s, %s, %s)
                 """, (name, email, phone, password))  # In production, hash the password
+                record_signup_rollups(cursor, [cursor.lastrowid])
+                bump_counter(cursor, 'total_users')
                 connection.commit()
                 flash('Registration successful! Please login.', 'success')
-            except Error as e:
+            except DatabaseError as e:
                 flash(f'Error: {e}', 'danger')
             finally:
                 cursor.close()
-                connection.close()
         
     return redirect(url_for('index'))
 
@@ -1330,7 +1835,7 @@ def admin_logout():
 # Home route
 @app.route('/')
 def index():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -1357,74 +1862,24 @@ def index():
         """)
         reviews = cursor.fetchall()
         
-        # Get user info if logged in
-        user = None
-        cart_count = 0
-        if 'user_id' in session:
-            cursor.execute("SELECT * FROM users WHERE id = %s", (session['user_id'],))
-            user = cursor.fetchone()
-            
-            # Get cart count
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM cart 
-                WHERE user_id = %s
-            """, (session['user_id'],))
-            cart_count = cursor.fetchone()['count']
-        
-        # Get statistics
-        cursor.execute("SELECT COUNT(*) as total FROM users")
-        total_users = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COUNT(*) as total FROM medicines")
-        total_medicines = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COUNT(*) as total FROM all_orders")
-        total_orders = cursor.fetchone()['total']
-        
-        cursor.execute("SELECT COUNT(*) as total FROM prescriptions")
-        total_prescriptions = cursor.fetchone()['total']
-        
         cursor.close()
-        connection.close()
+        
+        # Get statistics (total_users, total_medicines, total_orders, total_prescriptions)
+        stats = get_site_stats()
         
         return render_template('index.html', 
                               top_products=top_products, 
                               categories=categories, 
-                              reviews=reviews,
-                              user=user,
-                              cart_count=cart_count,
-                              total_users=total_users,
-                              total_medicines=total_medicines,
-                              total_orders=total_orders,
-                              total_prescriptions=total_prescriptions)
-    return "Database connection error", 500
-
-
-# Medicine Details route
-@app.route('/medicine_details/<int:medicine_id>')
-def medicine_details(medicine_id):
-    # Get cart count for the header
-    cart_count = 0
-    user_id = session.get('user_id')
-    user = None
-    
-    if user_id:
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            # Get user info
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            
-            # Get cart count
-            cursor.execute("SELECT COUNT(*) as count FROM cart WHERE user_id = %s", (user_id,))
-            cart_count = cursor.fetchone()['count']
-            
-            cursor.close()
-            connection.close()
-    
+                              reviews=reviews,
+                              **stats)
+    return "Database connection error", 500
+
+
+# Medicine Details route
+@app.route('/medicine_details/<int:medicine_id>')
+def medicine_details(medicine_id):
     # Get medicine details
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("SELECT * FROM medicines WHERE id = %s", (medicine_id,))
@@ -1432,87 +1887,180 @@ def medicine_details(medicine_id):
         
         # Get recommended medicines
         if medicine:
-            recommended_medicines = []
-            
-            # First try to get from the same category
-            if medicine['category']:
-                cursor.execute("""
-                    SELECT * FROM medicines 
-                    WHERE category = %s AND id != %s 
-                    ORDER BY RAND() 
-                    LIMIT 4
-                """, (medicine['category'], medicine_id))
-                recommended_medicines = cursor.fetchall()
-                print(f"Found {len(recommended_medicines)} medicines in same category: {medicine['category']}")
-            
-            # If we don't have enough, get random medicines
-            if len(recommended_medicines) < 4:
-                needed = 4 - len(recommended_medicines)
-                exclude_ids = [medicine_id] + [med['id'] for med in recommended_medicines]
-                placeholders = ','.join(['%s'] * len(exclude_ids))
-                cursor.execute(f"""
-                    SELECT * FROM medicines 
-                    WHERE id NOT IN ({placeholders})
-                    ORDER BY RAND() 
-                    LIMIT %s
-                """, exclude_ids + [needed])
-                additional_medicines = cursor.fetchall()
-                recommended_medicines.extend(additional_medicines)
-                print(f"Added {len(additional_medicines)} random medicines")
-            
-            print(f"Total recommended medicines: {len(recommended_medicines)}")
+            # Frequently bought together first, then same category, then random
+            recommended_medicines = recommender.for_medicine(medicine, k=4)
             
             cursor.close()
-            connection.close()
             
             return render_template('view-details.html', 
                                   medicine=medicine, 
-                                  recommended_medicines=recommended_medicines,
-                                  cart_count=cart_count, 
-                                  user=user)
+                                  recommended_medicines=recommended_medicines)
         else:
             cursor.close()
-            connection.close()
             flash('Medicine not found', 'danger')
             return redirect(url_for('medicines'))
     
     return "Database connection error", 500
 
-# Medicines by category route
-@app.route('/medicines/<category>')
-def medicines_by_category(category):
-    # This is a placeholder since we're not building the page now
+# Medicine search helpers
+# Searches go through a FULLTEXT index on (name, category, details) in
+# boolean mode; every word must match and is treated as a prefix.
+FULLTEXT_MIN_TOKEN = 3  # InnoDB innodb_ft_min_token_size default
+
+def fulltext_search_terms(search):
+    # "para 500mg" -> "+para* +500mg*"; boolean operators typed by the user are dropped
+    words = re.findall(r'\w+', search.lower())
+    return ' '.join(f"+{word}*" for word in words if len(word) >= FULLTEXT_MIN_TOKEN)
+
+# In-memory catalog index for filtered listings and facet counts
+def load_catalog_rows():
     connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM medicines WHERE category = %s", (category,))
-        medicines = cursor.fetchall()
+    if not connection:
+        return None
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM medicines ORDER BY id")
+        return cursor.fetchall()
+    except DatabaseError as e:
+        print(f"Error loading catalog index: {e}")
+        return None
+    finally:
         cursor.close()
         connection.close()
-        
-        return f"Medicines in {category} category: {len(medicines)} items"
-    
-    return "Category not found", 404
+
+catalog_index = CatalogIndex(load_catalog_rows, ttl=app.config['CATALOG_INDEX_TTL'])
+
+# "Frequently bought together" data mined from order history
+CHECKOUT_WINDOW = timedelta(seconds=2)  # rows of one checkout are inserted within this window
+
+def load_order_baskets():
+    # Rows from the same customer and address placed within
+    # CHECKOUT_WINDOW of each other form one basket.
+    connection = get_db_connection()
+    if not connection:
+        return None
+    cursor = connection.cursor()
+    baskets = []
+    try:
+        cursor.execute("""
+            SELECT email, address, created_at, medicine_id
+            FROM all_orders
+            ORDER BY email, address, created_at
+        """)
+        current_key = None
+        basket_start = None
+        basket = []
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for email, address, created_at, medicine_id in rows:
+                key = (email, address)
+                if key != current_key or created_at is None or basket_start is None \
+                        or created_at - basket_start > CHECKOUT_WINDOW:
+                    if len(basket) > 1:
+                        baskets.append(basket)
+                    current_key, basket_start, basket = key, created_at, []
+                if medicine_id is not None:
+                    basket.append(medicine_id)
+        if len(basket) > 1:
+            baskets.append(basket)
+        return baskets
+    except DatabaseError as e:
+        print(f"Error loading order baskets: {e}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+co_purchase = CoPurchaseEngine(load_order_baskets, ttl=app.config['CO_PURCHASE_TTL'])
+
+# Suggestions: co-purchases first, then the catalog index's category pools
+recommender = RecommendationService(catalog_index, co_purchase)
+
+def warm_caches():
+    # Independent, but both scan a whole table; one after the other keeps
+    # startup from running two full scans against the database at once
+    catalog_index.rebuild()
+    co_purchase.rebuild()
+
+# Warm the in-memory indexes in the background when the app starts
+threading.Thread(target=warm_caches, daemon=True).start()
+
+def refresh_catalog(medicine_ids):
+    # Re-read the given medicines after a committed write; ids that no
+    # longer exist are dropped from the index. During a rebuild (including
+    # the first one) the index queues these changes for the new snapshot.
+    medicine_ids = [int(medicine_id) for medicine_id in medicine_ids]
+    if not medicine_ids:
+        return
+    connection = get_db()
+    if not connection:
+        return
+    cursor = connection.cursor(dictionary=True)
+    placeholders = ', '.join(['%s'] * len(medicine_ids))
+    cursor.execute(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM medicines WHERE id IN ({placeholders})", medicine_ids)
+    found = set()
+    for row in cursor.fetchall():
+        catalog_index.upsert(row)
+        found.add(row['id'])
+    cursor.close()
+    for medicine_id in medicine_ids:
+        if medicine_id not in found:
+            catalog_index.remove(medicine_id)
 
 # Medicines page route
 @app.route('/medicines')
 @app.route('/medicines/<category>')
 def medicines(category=None):
-    connection = get_db_connection()
+    # Get filter parameters
+    search = request.args.get('search', '')
+    price_range = request.args.get('price_range', 'all')
+    availability = request.args.get('availability', 'all')
+    rating = request.args.get('rating', 'all')
+    page = request.args.get('page', 1, type=int)
+    per_page = 12  # Number of items per page
+    
+    # Plain filtered listings are answered from the in-memory catalog index;
+    # text searches go to the FULLTEXT index below
+    if not search and catalog_index.ensure_loaded():
+        min_rating = float(rating) if rating != 'all' else None
+        medicines, total, facets = catalog_index.query(
+            category=category if category and category != 'all' else None,
+            price_range=price_range,
+            availability=availability,
+            min_rating=min_rating,
+            page=page,
+            per_page=per_page
+        )
+        total_pages = (total + per_page - 1) // per_page
+        
+        # Calculate pagination range
+        start_page = max(1, page - 2)
+        end_page = min(total_pages + 1, page + 3)
+        page_range = range(start_page, end_page)
+        
+        return render_template('medicines.html', 
+                              medicines=medicines,
+                              categories=catalog_index.categories(),
+                              facets=facets,
+                              current_category=category,
+                              search=search,
+                              price_range=price_range,
+                              availability=availability,
+                              rating=rating,
+                              page=page,
+                              total_pages=total_pages,
+                              page_range=page_range)
+    
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
-        # Get filter parameters
-        search = request.args.get('search', '')
-        price_range = request.args.get('price_range', 'all')
-        availability = request.args.get('availability', 'all')
-        rating = request.args.get('rating', 'all')
-        page = request.args.get('page', 1, type=int)
-        per_page = 12  # Number of items per page
-        
         # Build the base query
         query = "SELECT * FROM medicines WHERE 1=1"
         params = []
+        order_by = ""
         
         # Add category filter if provided and not 'all'
         if category and category != 'all':
@@ -1520,10 +2068,28 @@ def medicines(category=None):
             query += " AND LOWER(category) = LOWER(%s)"
             params.append(category.strip())
         
-        # Add search filter
+        # Add search filter (full-text, ranked by relevance)
         if search:
-            query += " AND name LIKE %s"
-            params.append(f"%{search}%")
+            fulltext = fulltext_search_terms(search) if db_backend.fulltext else None
+            words = re.findall(r'\w+', search)
+            if fulltext:
+                # The relevance placeholder comes first in the statement
+                query = query.replace("SELECT *", f"SELECT *, MATCH({MEDICINE_SEARCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE) as relevance", 1)
+                params.insert(0, fulltext)
+                query += f" AND MATCH({MEDICINE_SEARCH_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)"
+                params.append(fulltext)
+                order_by = " ORDER BY relevance DESC, sold_quantity DESC"
+            elif not db_backend.fulltext and words:
+                # No full-text index (SQLite): every word must occur in one of the columns
+                search_columns = MEDICINE_SEARCH_COLUMNS.split(', ')
+                for word in words:
+                    query += " AND (" + " OR ".join(f"{column} LIKE %s" for column in search_columns) + ")"
+                    params.extend([f"%{word}%"] * len(search_columns))
+                order_by = " ORDER BY sold_quantity DESC"
+            else:
+                # Terms too short for the full-text index: prefix match on name
+                query += " AND name LIKE %s"
+                params.append(f"{search.strip()}%")
         
         # Add price range filter
         if price_range != 'all':
@@ -1557,8 +2123,9 @@ def medicines(category=None):
         total = cursor.fetchone()['total']
         total_pages = (total + per_page - 1) // per_page
         
-        # Add pagination
+        # Add ordering and pagination
         offset = (page - 1) * per_page
+        query += order_by
         query += " LIMIT %s OFFSET %s"
         params.extend([per_page, offset])
         
@@ -1566,30 +2133,18 @@ def medicines(category=None):
         medicines = cursor.fetchall()
         
         # Get categories for filter dropdown
-        cursor.execute("SELECT DISTINCT category FROM medicines")
-        categories = cursor.fetchall()
+        if catalog_index.ready:
+            categories = catalog_index.categories()
+        else:
+            cursor.execute("SELECT DISTINCT category FROM medicines")
+            categories = cursor.fetchall()
         
         # Calculate pagination range
         start_page = max(1, page - 2)
         end_page = min(total_pages + 1, page + 3)
         page_range = range(start_page, end_page)
         
-        # Get user info if logged in
-        user = None
-        cart_count = 0
-        if 'user_id' in session:
-            cursor.execute("SELECT * FROM users WHERE id = %s", (session['user_id'],))
-            user = cursor.fetchone()
-            
-            # Get cart count
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM cart 
-                WHERE user_id = %s
-            """, (session['user_id'],))
-            cart_count = cursor.fetchone()['count']
-        
         cursor.close()
-        connection.close()
         
         return render_template('medicines.html', 
                               medicines=medicines,
@@ -1601,35 +2156,14 @@ def medicines(category=None):
                               rating=rating,
                               page=page,
                               total_pages=total_pages,
-                              page_range=page_range,
-                              user=user,
-                              cart_count=cart_count)
+                              page_range=page_range)
     return "Database connection error", 500
 
 @app.route('/test_categories')
 def test_categories():
-    connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get all categories
-        cursor.execute("SELECT DISTINCT category FROM medicines")
-        categories = cursor.fetchall()
-        
-        # Get medicines count per category
-        category_counts = []
-        for cat in categories:
-            cursor.execute("SELECT COUNT(*) as count FROM medicines WHERE category = %s", (cat['category'],))
-            count = cursor.fetchone()['count']
-            category_counts.append({
-                'category': cat['category'],
-                'count': count
-            })
-        
-        cursor.close()
-        connection.close()
-        
-        return jsonify(category_counts)
+    # Medicines count per category straight from the catalog index
+    if catalog_index.ensure_loaded():
+        return jsonify(catalog_index.categories())
     return "Database connection error", 500
 
 
@@ -1640,7 +2174,7 @@ def buy_now():
     medicine_id = request.form['medicine_id']
     quantity = request.form.get('quantity', 1, type=int)
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("SELECT * FROM medicines WHERE id = %s", (medicine_id,))
@@ -1654,7 +2188,6 @@ def buy_now():
             flash('Not enough stock available', 'danger')
             return redirect(url_for('medicines'))
         cursor.close()
-        connection.close()
         
         flash('Proceeding to checkout', 'success')
         return redirect(url_for('checkout', medicine_id=medicine_id, quantity=quantity))
@@ -1690,7 +2223,7 @@ def add_to_cart():
             flash('Invalid request', 'danger')
             return redirect(url_for('medicines'))
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -1700,7 +2233,6 @@ def add_to_cart():
         
         if not medicine:
             cursor.close()
-            connection.close()
             if is_ajax:
                 return jsonify({'success': False, 'message': 'Medicine not found'})
             else:
@@ -1709,7 +2241,6 @@ def add_to_cart():
         
         if medicine['stock_quantity'] < quantity:
             cursor.close()
-            connection.close()
             if is_ajax:
                 return jsonify({'success': False, 'message': 'Not enough stock available'})
             else:
@@ -1725,7 +2256,6 @@ def add_to_cart():
             new_quantity = existing_item['quantity'] + quantity
             if new_quantity > medicine['stock_quantity']:
                 cursor.close()
-                connection.close()
                 if is_ajax:
                     return jsonify({'success': False, 'message': 'Not enough stock available'})
                 else:
@@ -1749,8 +2279,8 @@ def add_to_cart():
         cart_count = cursor.fetchone()['count']
         
         connection.commit()
+        invalidate_header_context(user_id)
         cursor.close()
-        connection.close()
         
         if is_ajax:
             return jsonify({
@@ -1772,7 +2302,7 @@ def add_to_cart():
 @app.route('/cart')
 @login_required
 def cart():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -1799,38 +2329,32 @@ def cart():
         tax = subtotal * tax_rate
         total = subtotal + delivery_fee + tax
         
-        # Get recommendations (medicines not in cart)
-        if cart_items:
-            cart_medicine_ids = [item['id'] for item in cart_items]
-            placeholders = ', '.join(['%s'] * len(cart_medicine_ids))
-            cursor.execute(f"""
-                SELECT * FROM medicines 
-                WHERE id NOT IN ({placeholders})
-                ORDER BY sold_quantity DESC 
-                LIMIT 4
-            """, cart_medicine_ids)
-        else:
-            cursor.execute("""
-                SELECT * FROM medicines 
-                ORDER BY sold_quantity DESC 
-                LIMIT 4
-            """)
-        recommendations = cursor.fetchall()
+        # Get recommendations (medicines not in cart): frequently bought
+        # together with the cart first, topped up with best sellers
+        cart_medicine_ids = [item['id'] for item in cart_items]
+        recommendations = recommender.bought_together(cart_medicine_ids, k=4)
+        if len(recommendations) < 4:
+            exclude_ids = cart_medicine_ids + [item['id'] for item in recommendations]
+            if exclude_ids:
+                placeholders = ', '.join(['%s'] * len(exclude_ids))
+                cursor.execute(f"""
+                    SELECT * FROM medicines 
+                    WHERE id NOT IN ({placeholders})
+                    ORDER BY sold_quantity DESC 
+                    LIMIT %s
+                """, exclude_ids + [4 - len(recommendations)])
+            else:
+                cursor.execute("""
+                    SELECT * FROM medicines 
+                    ORDER BY sold_quantity DESC 
+                    LIMIT 4
+                """)
+            recommendations.extend(cursor.fetchall())
         
         # Get recently viewed (placeholder - random medicines for now)
-        cursor.execute("""
-            SELECT * FROM medicines 
-            ORDER BY RAND() 
-            LIMIT 6
-        """)
-        recently_viewed = cursor.fetchall()
-        
-        # Get user info
-        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
+        recently_viewed = recommender.random_picks(k=6)
         
         cursor.close()
-        connection.close()
         
         return render_template('cart.html', 
                               cart_items=cart_items,
@@ -1839,8 +2363,7 @@ def cart():
                               tax=tax,
                               total=total,
                               recommendations=recommendations,
-                              recently_viewed=recently_viewed,
-                              user=user)
+                              recently_viewed=recently_viewed)
     return "Database connection error", 500
 
 # Update cart route
@@ -1851,7 +2374,7 @@ def update_cart():
     action = request.form.get('action')
     user_id = session['user_id']
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -1898,6 +2421,7 @@ def update_cart():
                 WHERE id = %s AND user_id = %s
             """, (cart_id, user_id))
             connection.commit()
+            invalidate_header_context(user_id)
             flash('Item removed from cart', 'success')
             
         elif action == 'clear':
@@ -1907,10 +2431,10 @@ def update_cart():
                 WHERE user_id = %s
             """, (user_id,))
             connection.commit()
+            invalidate_header_context(user_id)
             flash('Cart cleared successfully', 'success')
         
         cursor.close()
-        connection.close()
         return redirect(url_for('cart'))
     
     flash('Database connection error', 'danger')
@@ -1923,7 +2447,7 @@ def add_to_cart_from_recommendations():
     medicine_id = request.form.get('medicine_id')
     user_id = session['user_id']
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -1949,8 +2473,8 @@ def add_to_cart_from_recommendations():
             """, (user_id, medicine_id))
         
         connection.commit()
+        invalidate_header_context(user_id)
         cursor.close()
-        connection.close()
         
         flash('Item added to cart!', 'success')
     else:
@@ -1973,7 +2497,7 @@ def checkout(medicine_id=None, quantity=1):
         flash('You have already placed an order. Please start a new order.', 'info')
         return redirect(url_for('medicines'))
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2094,7 +2618,6 @@ def checkout(medicine_id=None, quantity=1):
         total = subtotal + delivery_fee + tax - discount
         
         cursor.close()
-        connection.close()
         
         return render_template('checkout.html', 
                               cart_items=cart_items,
@@ -2114,7 +2637,7 @@ def checkout(medicine_id=None, quantity=1):
 @app.route('/place_order', methods=['POST'])
 @login_required
 def place_order():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2169,11 +2692,26 @@ def place_order():
             flash('No items in order', 'danger')
             return redirect(url_for('cart'))
         
+        # Parse every line before any stock is taken
+        try:
+            if not len(item_ids) == len(item_names) == len(item_prices) == len(item_quantities):
+                raise ValueError("order lines are incomplete")
+            lines = [
+                (int(item_id), item_name, Decimal(item_price), int(item_quantity))
+                for item_id, item_name, item_price, item_quantity
+                in zip(item_ids, item_names, item_prices, item_quantities)
+            ]
+            if any(item_quantity < 1 or not item_price.is_finite() or item_price < 0
+                   for _, _, item_price, item_quantity in lines):
+                raise ValueError("invalid price or quantity")
+        except (ValueError, ArithmeticError):
+            cursor.close()
+            flash('Invalid order details', 'danger')
+            return redirect(url_for('cart'))
+        
         # Calculate subtotal
         subtotal = Decimal('0.00')
-        for i in range(len(item_ids)):
-            item_price = Decimal(item_prices[i])
-            item_quantity = int(item_quantities[i])
+        for _, _, item_price, item_quantity in lines:
             subtotal += item_price * item_quantity
         
         # Calculate tax (5%)
@@ -2183,76 +2721,58 @@ def place_order():
         # Calculate total amount
         total_amount = subtotal + delivery_fee + tax
         
-        # Create orders
-        order_ids = []
-        for i in range(len(item_ids)):
-            item_id = item_ids[i]
-            item_name = item_names[i]
-            item_price = Decimal(item_prices[i])
-            item_quantity = int(item_quantities[i])
+        try:
+            # Take stock for every line first; the row locks it holds keep the
+            # whole checkout in one transaction with the order inserts below
+            shortages = commit_inventory(connection, [(item_id, item_quantity)
+                                                      for item_id, _, _, item_quantity in lines])
+            if shortages:
+                connection.rollback()
+                cursor.close()
+                names = {item_id: item_name for item_id, item_name, _, _ in lines}
+                details = ', '.join(
+                    f"{names.get(line['medicine_id'], 'Unknown item')} "
+                    f"({'no longer available' if line['available'] is None else str(line['available']) + ' left'})"
+                    for line in shortages
+                )
+                flash(f'Not enough stock for: {details}', 'danger')
+                return redirect(url_for('cart'))
             
-            # Calculate item total (including proportional delivery and tax)
-            item_subtotal = item_price * item_quantity
-            item_delivery_share = (item_subtotal / subtotal) * delivery_fee if subtotal > 0 else Decimal('0.00')
-            item_tax_share = (item_subtotal / subtotal) * tax if subtotal > 0 else Decimal('0.00')
-            item_total = item_subtotal + item_delivery_share + item_tax_share
+            # Build one order row per line
+            order_rows = []
+            for item_id, item_name, item_price, item_quantity in lines:
+                # Calculate item total (including proportional delivery and tax)
+                item_subtotal = item_price * item_quantity
+                item_delivery_share = (item_subtotal / subtotal) * delivery_fee if subtotal > 0 else Decimal('0.00')
+                item_tax_share = (item_subtotal / subtotal) * tax if subtotal > 0 else Decimal('0.00')
+                item_total = item_subtotal + item_delivery_share + item_tax_share
+                
+                order_rows.append((
+                    f"{first_name} {last_name}", phone, email, 
+                    f"{address}, {city}, {postal_code}", item_name, item_id,
+                    item_quantity, item_total, payment_method, instructions, 'Pending'
+                ))
             
-            # Create order in all_orders table
-            cursor.execute("""
-                INSERT INTO all_orders (
-                    ordered_by, phone, email, address, product, 
-                    quantity, price, payment_method, special_instruction, status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                f"{first_name} {last_name}", phone, email, 
-                f"{address}, {city}, {postal_code}", item_name,
-                item_quantity, item_total, payment_method, instructions, 'Pending'
-            ))
-            order_id = cursor.lastrowid
-            order_ids.append(order_id)
+            # Write all lines in one multi-row INSERT
+            order_ids = insert_order_lines(connection, order_rows)
+            record_order_rollups(cursor, order_ids)
             
-            # Also insert into orders and dborders tables
-            cursor.execute("""
-                INSERT INTO orders (
-                    ordered_by, phone, email, address, product, 
-                    quantity, price, payment_method, special_instruction, status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                f"{first_name} {last_name}", phone, email, 
-                f"{address}, {city}, {postal_code}", item_name,
-                item_quantity, item_total, payment_method, instructions, 'Pending'
-            ))
+            bump_counter(cursor, 'total_orders', len(order_ids))
             
-            cursor.execute("""
-                INSERT INTO dborders (
-                    ordered_by, phone, email, address, product, 
-                    quantity, price, payment_method, special_instruction, status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                f"{first_name} {last_name}", phone, email, 
-                f"{address}, {city}, {postal_code}", item_name,
-                item_quantity, item_total, payment_method, instructions, 'Pending'
-            ))
+            # If the order was from cart, clear the cart
+            if source == 'cart':
+                cursor.execute("DELETE FROM cart WHERE user_id = %s", (user_id,))
             
-            # Update medicine stock
-            cursor.execute("SELECT stock_quantity, sold_quantity FROM medicines WHERE id = %s", (item_id,))
-            medicine = cursor.fetchone()
-            if medicine:
-                new_stock = medicine['stock_quantity'] - item_quantity
-                new_sold = medicine['sold_quantity'] + item_quantity
-                cursor.execute("""
-                    UPDATE medicines 
-                    SET stock_quantity = %s, sold_quantity = %s 
-                    WHERE id = %s
-                """, (new_stock, new_sold, item_id))
-        
-        # If the order was from cart, clear the cart
-        if source == 'cart':
-            cursor.execute("DELETE FROM cart WHERE user_id = %s", (user_id,))
-        
-        connection.commit()
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            cursor.close()
+            flash(f'Error placing order: {str(e)}', 'danger')
+            return redirect(url_for('cart'))
+        invalidate_header_context(user_id)
+        refresh_catalog(item_ids)
+        co_purchase.add_basket(item_ids)
         cursor.close()
-        connection.close()
         
         # Mark that order was just placed
         session['order_just_placed'] = True
@@ -2268,7 +2788,7 @@ def place_order():
 @app.route('/order_confirmation/<order_ids>')
 @login_required
 def order_confirmation(order_ids):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2303,7 +2823,6 @@ def order_confirmation(order_ids):
         user = cursor.fetchone()
         
         cursor.close()
-        connection.close()
         
         return render_template('order-confirmation.html', 
                               orders=orders,
@@ -2316,7 +2835,7 @@ def order_confirmation(order_ids):
 @app.route('/invoice/<order_ids>')
 @login_required
 def invoice(order_ids):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2383,7 +2902,6 @@ def invoice(order_ids):
         }
         
         cursor.close()
-        connection.close()
         
         return render_template('invoice.html', 
                               orders=orders,
@@ -2423,7 +2941,7 @@ def change_password():
         flash('New passwords do not match', 'danger')
         return redirect(url_for('dashboard'))
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -2441,7 +2959,6 @@ def change_password():
             flash('Current password is incorrect', 'danger')
         
         cursor.close()
-        connection.close()
     
     return redirect(url_for('dashboard'))
 
@@ -2457,7 +2974,7 @@ def submit_review():
         flash('All fields are required', 'danger')
         return redirect(url_for('dashboard'))
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor()
         
@@ -2475,7 +2992,6 @@ def submit_review():
             flash(f'Error submitting review: {str(e)}', 'danger')
         finally:
             cursor.close()
-            connection.close()
     
     return redirect(url_for('dashboard'))
 
@@ -2484,7 +3000,7 @@ def submit_review():
 @app.route('/reorder_order/<int:order_id>', methods=['GET', 'POST'])
 @login_required
 def reorder_order(order_id):
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         
@@ -2493,13 +3009,12 @@ def reorder_order(order_id):
         order = cursor.fetchone()
         
         if order:
-            # Get medicine by name
-            cursor.execute("SELECT * FROM medicines WHERE name = %s", (order['product'],))
+            # Get the ordered medicine
+            cursor.execute("SELECT id FROM medicines WHERE id = %s", (order['medicine_id'],))
             medicine = cursor.fetchone()
             
             if medicine:
                 cursor.close()
-                connection.close()
                 
                 # Redirect to checkout with medicine details
                 return redirect(url_for('checkout', medicine_id=medicine['id'], quantity=order['quantity']))
@@ -2509,7 +3024,6 @@ def reorder_order(order_id):
             flash('Order not found', 'danger')
         
         cursor.close()
-        connection.close()
     
     return redirect(url_for('dashboard'))
 
@@ -2518,7 +3032,7 @@ def reorder_order(order_id):
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2527,22 +3041,24 @@ def dashboard():
         cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
         user = cursor.fetchone()
         
-        # Get user's orders from dborders table
-        cursor.execute("""
-            SELECT * FROM dborders 
-            WHERE email = %s 
-            ORDER BY created_at DESC
-            LIMIT 5
-        """, (user['email'],))
-        recent_orders = cursor.fetchall()
-        
-        # Get all user's orders
+        # Recent orders and order statistics in one query; the full history
+        # is paged in lazily through order_history()
         cursor.execute("""
-            SELECT * FROM dborders 
-            WHERE email = %s 
-            ORDER BY created_at DESC
-        """, (user['email'],))
-        all_orders = cursor.fetchall()
+            SELECT o.*, s.order_count, s.order_total
+            FROM (
+                SELECT COUNT(*) AS order_count, SUM(price) AS order_total
+                FROM all_orders WHERE email = %s
+            ) s
+            LEFT JOIN (
+                SELECT * FROM all_orders
+                WHERE email = %s
+                ORDER BY created_at DESC, id DESC
+                LIMIT 5
+            ) o ON 1 = 1
+            ORDER BY o.created_at DESC, o.id DESC
+        """, (user['email'], user['email']))
+        rows = cursor.fetchall()
+        recent_orders = [row for row in rows if row['id'] is not None]
         
         # Get user's prescriptions
         cursor.execute("""
@@ -2553,15 +3069,8 @@ def dashboard():
         prescriptions = cursor.fetchall()
         
         # Calculate statistics
-        cursor.execute("""
-            SELECT COUNT(*) as total_orders, SUM(price) as total_spent 
-            FROM dborders 
-            WHERE email = %s
-        """, (user['email'],))
-        order_stats = cursor.fetchone()
-        
-        total_orders = order_stats['total_orders'] or 0
-        total_spent = order_stats['total_spent'] or Decimal('0.00')
+        total_orders = rows[0]['order_count'] or 0
+        total_spent = rows[0]['order_total'] or Decimal('0.00')
         
         # Get wishlist count (placeholder for now)
         wishlist_count = 8  # This would come from a wishlist table
@@ -2570,16 +3079,11 @@ def dashboard():
         cursor.execute("""
             SELECT DISTINCT m.* 
             FROM medicines m
-            JOIN dborders o ON m.name = o.product
+            JOIN all_orders o ON m.id = o.medicine_id
             WHERE o.email = %s
         """, (user['email'],))
         user_medicines = cursor.fetchall()
         
-        # Get cart count
-        cursor.execute("SELECT COUNT(*) as count FROM cart WHERE user_id = %s", (user_id,))
-        cart_count_result = cursor.fetchone()
-        cart_count = cart_count_result['count'] if cart_count_result else 0
-        
         # Get active tab from session and clear it
         active_tab = session.pop('active_tab', None)
         
@@ -2590,22 +3094,16 @@ def dashboard():
         for order in recent_orders:
             order['estimated_delivery'] = (order['created_at'] + timedelta(days=3)).strftime('%d %b %Y')
         
-        for order in all_orders:
-            order['estimated_delivery'] = (order['created_at'] + timedelta(days=3)).strftime('%d %b %Y')
-        
         cursor.close()
-        connection.close()
         
         return render_template('dashboard.html', 
                               user=user,
                               recent_orders=recent_orders,
-                              all_orders=all_orders,
                               prescriptions=prescriptions,
                               total_orders=total_orders,
                               total_spent=total_spent,
                               wishlist_count=wishlist_count,
                               user_medicines=user_medicines,
-                              cart_count=cart_count,
                               active_tab=active_tab,
                               show_review_modal=show_review_modal)
     return "Database connection error", 500
@@ -2614,7 +3112,7 @@ def dashboard():
 @app.route('/update_profile', methods=['POST'])
 @login_required
 def update_profile():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2632,12 +3130,8 @@ def update_profile():
             if file.filename != '':
                 # Check if the file is allowed
                 if file and allowed_file(file.filename):
-                    # Create a secure filename
-                    filename = secure_filename(file.filename)
                     # Save the file and get the path
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    profile_image = file_path
+                    profile_image = save_upload_file(file, app.config['UPLOAD_FOLDER'])
                 else:
                     flash('Invalid file type. Only images are allowed.', 'danger')
                     return redirect(url_for('dashboard'))
@@ -2654,13 +3148,16 @@ def update_profile():
         update_params.append(user_id)
         
         cursor.execute(update_query, update_params)
+        if profile_image:
+            queue_upload(cursor, profile_image)
         connection.commit()
+        invalidate_header_context(user_id)
         
         # Update session data
         session['user_name'] = name
+        session['email'] = email
         
         cursor.close()
-        connection.close()
         
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('dashboard'))
@@ -2669,6 +3166,45 @@ def update_profile():
     return redirect(url_for('dashboard'))
 
 
+# Order history page for the dashboard's Orders and Invoices tabs
+ORDER_HISTORY_KEYS = [('created_at', 'datetime'), ('id', 'int')]
+
+@app.route('/dashboard/orders')
+@login_required
+def order_history():
+    per_page = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    connection = get_db()
+    if connection:
+        cursor = connection.cursor(dictionary=True)
+        # Read the email fresh: the navbar cache may be stale or hold no user
+        cursor.execute("SELECT email FROM users WHERE id = %s", (session['user_id'],))
+        user = cursor.fetchone()
+        if user is None:
+            cursor.close()
+            return jsonify({"error": "User not found"}), 404
+        rows, next_token, _ = keyset_paginate(
+            cursor,
+            "SELECT id, created_at, quantity, price, status, payment_method FROM all_orders",
+            ORDER_HISTORY_KEYS, descending=True, per_page=per_page,
+            after=request.args.get('after'),
+            where="email = %s", where_params=[user['email']]
+        )
+        cursor.close()
+        
+        orders = [{
+            'id': row['id'],
+            'date': row['created_at'].strftime('%d %b %Y'),
+            'estimated_delivery': (row['created_at'] + timedelta(days=3)).strftime('%d %b %Y'),
+            'quantity': row['quantity'],
+            'price': "%.2f" % float(row['price'] or 0),
+            'status': row['status'],
+            'payment_method': row['payment_method'],
+            'invoice_url': url_for('invoice', order_ids=row['id']),
+            'reorder_url': url_for('reorder_order', order_id=row['id'])
+        } for row in rows]
+        return jsonify({'orders': orders, 'next': next_token})
+    return jsonify({"error": "Database connection error"}), 500
+
 @app.route('/set_active_tab', methods=['POST'])
 @login_required
 def set_active_tab():
@@ -2679,11 +3215,11 @@ def set_active_tab():
 @app.route('/reorder_most_recent', methods=['POST'])
 @login_required
 def reorder_most_recent():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         cursor.execute("""
-            SELECT * FROM dborders 
+            SELECT * FROM all_orders 
             WHERE email = %s 
             ORDER BY created_at DESC 
             LIMIT 1
@@ -2691,13 +3227,12 @@ def reorder_most_recent():
         order = cursor.fetchone()
         
         if order:
-            # Get the medicine by name
-            cursor.execute("SELECT * FROM medicines WHERE name = %s", (order['product'],))
+            # Get the ordered medicine
+            cursor.execute("SELECT id FROM medicines WHERE id = %s", (order['medicine_id'],))
             medicine = cursor.fetchone()
             
             if medicine:
                 cursor.close()
-                connection.close()
                 return redirect(url_for('checkout', medicine_id=medicine['id'], quantity=order['quantity']))
             else:
                 flash('Medicine not found', 'danger')
@@ -2705,7 +3240,6 @@ def reorder_most_recent():
             flash('No recent orders found', 'danger')
         
         cursor.close()
-        connection.close()
     
     return redirect(url_for('dashboard'))
 
@@ -2722,7 +3256,7 @@ def reorder_most_recent():
 @app.route('/upload_prescription', methods=['POST'])
 @login_required
 def upload_prescription():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2741,11 +3275,8 @@ def upload_prescription():
             if file.filename != '':
                 # Check if the file is allowed
                 if file and allowed_file(file.filename):
-                    # Create a secure filename
-                    filename = secure_filename(file.filename)
                     # Save the file and get the path
-                    file_path = os.path.join(app.config['PRESCRIPTION_FOLDER'], filename)
-                    file.save(file_path)
+                    file_path = save_upload_file(file, app.config['PRESCRIPTION_FOLDER'])
                     
                     # Insert prescription into database
                     cursor.execute("""
@@ -2757,6 +3288,8 @@ def upload_prescription():
                         user_id, patient_name, patient_age, patient_phone,
                         patient_email, patient_address, file_path, special_instructions
                     ))
+                    bump_counter(cursor, 'total_prescriptions')
+                    queue_upload(cursor, file_path)
                     connection.commit()
                     
                     flash('Prescription uploaded successfully!', 'success')
@@ -2768,7 +3301,6 @@ def upload_prescription():
             flash('No file selected', 'danger')
         
         cursor.close()
-        connection.close()
         
         return redirect(url_for('dashboard'))
     
@@ -2780,7 +3312,7 @@ def upload_prescription():
 @app.route('/create_order_from_prescription', methods=['POST'])
 @login_required
 def create_order_from_prescription():
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
@@ -2797,7 +3329,7 @@ def create_order_from_prescription():
         cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
         user = cursor.fetchone()
         
-        # Create order in all three tables
+        # Create the order
         order_price = Decimal('0.00')  # Price will be determined later by admin
         
         # Insert into all_orders
@@ -2812,30 +3344,8 @@ def create_order_from_prescription():
             "Cash on Delivery", special_instructions, "Pending"
         ))
         all_order_id = cursor.lastrowid
-        
-        # Insert into orders
-        cursor.execute("""
-            INSERT INTO orders (
-                ordered_by, phone, email, address, product, 
-                quantity, price, payment_method, special_instruction, status
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            patient_name, patient_phone, patient_email, patient_address,
-            f"Prescription Order #{prescription_id}", 1, order_price,
-            "Cash on Delivery", special_instructions, "Pending"
-        ))
-        
-        # Insert into dborders
-        cursor.execute("""
-            INSERT INTO dborders (
-                ordered_by, phone, email, address, product, 
-                quantity, price, payment_method, special_instruction, status
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            patient_name, patient_phone, patient_email, patient_address,
-            f"Prescription Order #{prescription_id}", 1, order_price,
-            "Cash on Delivery", special_instructions, "Pending"
-        ))
+        record_order_rollups(cursor, [all_order_id])
+        bump_counter(cursor, 'total_orders')
         
         # Update prescription status
         cursor.execute("""
@@ -2846,7 +3356,6 @@ def create_order_from_prescription():
         
         connection.commit()
         cursor.close()
-        connection.close()
         
         flash('Order created from prescription successfully!', 'success')
         return redirect(url_for('dashboard'))
@@ -2858,49 +3367,12 @@ def create_order_from_prescription():
 # About page
 @app.route('/about')
 def about():
-    # Get cart count for the header
-    cart_count = 0
-    user = None
-    user_id = session.get('user_id')
-    
-    if user_id:
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            
-            if user:
-                cursor.execute("SELECT COUNT(*) as count FROM cart WHERE user_id = %s", (user_id,))
-                cart_count = cursor.fetchone()['count']
-            
-            cursor.close()
-            connection.close()
-    
-    return render_template('about.html', cart_count=cart_count, user=user)
+    # The navbar user and cart count come from inject_header_context()
+    return render_template('about.html')
 # Contact page
 @app.route('/contact', methods=['GET', 'POST'])
 def contact():
-    # Get cart count for the header
-    cart_count = 0
-    user_id = session.get('user_id')
-    user = None
-    
-    if user_id:
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            # Get user info
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            
-            # Get cart count
-            cursor.execute("SELECT COUNT(*) as count FROM cart WHERE user_id = %s", (user_id,))
-            cart_count = cursor.fetchone()['count']
-            
-            cursor.close()
-            connection.close()
-    
+    # The navbar user and cart count come from inject_header_context()
     # Handle form submission
     if request.method == 'POST':
         name = request.form.get('name')
@@ -2911,7 +3383,7 @@ def contact():
         newsletter = request.form.get('newsletter') == 'on'
         
         # Save to database
-        connection = get_db_connection()
+        connection = get_db()
         if connection:
             cursor = connection.cursor()
             cursor.execute("""
@@ -2921,37 +3393,17 @@ def contact():
             """, (name, email, phone, subject, message, newsletter))
             connection.commit()
             cursor.close()
-            connection.close()
             
             flash('Your message has been sent successfully!', 'success')
             return redirect(url_for('contact'))
     
-    return render_template('contact.html', cart_count=cart_count, user=user)
+    return render_template('contact.html')
 
 # Services page
 @app.route('/services')
 def services():
-    # Get cart count for the header
-    cart_count = 0
-    user_id = session.get('user_id')
-    user = None
-    
-    if user_id:
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            # Get user info
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            
-            # Get cart count
-            cursor.execute("SELECT COUNT(*) as count FROM cart WHERE user_id = %s", (user_id,))
-            cart_count = cursor.fetchone()['count']
-            
-            cursor.close()
-            connection.close()
-    
-    return render_template('services.html', cart_count=cart_count, user=user)
+    # The navbar user and cart count come from inject_header_context()
+    return render_template('services.html')
 
 # Newsletter subscription
 @app.route('/subscribe', methods=['POST'])
@@ -2974,7 +3426,7 @@ def subscribe():
             flash('Please provide a valid email address', 'danger')
             return redirect(request.referrer or url_for('index'))
     
-    connection = get_db_connection()
+    connection = get_db()
     if connection:
         cursor = connection.cursor()
         
@@ -2984,7 +3436,6 @@ def subscribe():
         
         if existing_subscriber:
             cursor.close()
-            connection.close()
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({'success': False, 'message': 'This email is already subscribed'})
             else:
@@ -2999,7 +3450,6 @@ def subscribe():
         
         connection.commit()
         cursor.close()
-        connection.close()
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({'success': True, 'message': 'Thank you for subscribing to our newsletter!'})
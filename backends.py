@@ -0,0 +1,423 @@
+# ==================== DATABASE BACKENDS ====================
+# The app talks to the database through DB-API connections shaped like
+# mysql.connector's: cursor(dictionary=True) for dict rows, %s
+# placeholders and MySQL SQL. Two backends provide them:
+#
+#   MySQLBackend   production; mysql.connector connections as they are
+#   SQLiteBackend  a file or an in-memory database, for CI, benchmarks and
+#                  single-node deployments without a MySQL server
+#
+# SQLite connections are wrapped so the app's SQL runs unchanged: the
+# cursor rewrites placeholders, INSERT IGNORE, ON DUPLICATE KEY UPDATE,
+# SELECT ... FOR UPDATE, CREATE TABLE options and inline index definitions
+# into their SQLite forms, and MySQL functions the app uses (NOW, CURDATE,
+# MONTH, LEFT, ...) are registered as SQL functions. The few things that
+# cannot be rewritten statement by statement (schema introspection, joins
+# in UPDATE, FULLTEXT search, partitioning) check dialect_of() instead.
+import re
+import sqlite3
+import zlib
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+# mysql-connector is only needed for the MySQL backend
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
+
+MYSQL = 'mysql'
+SQLITE = 'sqlite'
+
+# Base classes of the errors either driver raises
+if mysql is not None:
+    DatabaseError = (mysql.connector.Error, sqlite3.Error)
+else:
+    DatabaseError = (sqlite3.Error,)
+
+
+def dialect_of(connection_or_cursor):
+    """MYSQL or SQLITE for a connection or cursor from either backend."""
+    return getattr(connection_or_cursor, 'dialect', MYSQL)
+
+
+# ==================== MYSQL ====================
+class MySQLBackend:
+    dialect = MYSQL
+    fulltext = True
+    partitioning = True
+
+    def __init__(self, config):
+        if mysql is None:
+            raise RuntimeError("the MySQL backend needs the mysql-connector-python package")
+        self.config = config
+
+    def connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def ping(self, raw):
+        raw.ping(reconnect=False)
+
+
+# ==================== SQLITE ====================
+# Stored values come back as the types mysql.connector returns
+def _convert_decimal(value):
+    try:
+        return Decimal(value.decode())
+    except InvalidOperation:
+        return value.decode()
+
+
+def _convert_datetime(value):
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+def _convert_date(value):
+    try:
+        return date.fromisoformat(value.decode()[:10])
+    except ValueError:
+        return value.decode()
+
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DECIMAL', _convert_decimal)
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('DATE', _convert_date)
+
+
+def _date_part(value, start, end):
+    if value is None:
+        return None
+    return int(str(value)[start:end])
+
+
+def _concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+
+# name -> (number of arguments, implementation); -1 means variadic
+SQLITE_FUNCTIONS = {
+    'NOW': (0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+    'CURDATE': (0, lambda: date.today().isoformat()),
+    'YEAR': (1, lambda value: _date_part(value, 0, 4)),
+    'MONTH': (1, lambda value: _date_part(value, 5, 7)),
+    # LEFT is a keyword in SQLite, so translate() renames calls to it
+    'MYSQL_LEFT': (2, lambda value, length: None if value is None else str(value)[:length]),
+    'CRC32': (1, lambda value: None if value is None else zlib.crc32(str(value).encode('utf-8'))),
+    'CONCAT_WS': (-1, _concat_ws),
+}
+
+
+# ---------- statement rewriting ----------
+_PLACEHOLDER = re.compile(r"%(s|%)")
+_INSERT_IGNORE = re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+_WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+_GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+_VALUES_FUNCTION = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+_NULL_SAFE_EQUAL = re.compile(r"<=>")
+_LEFT_FUNCTION = re.compile(r"\bLEFT\s*\(", re.IGNORECASE)
+_FOR_UPDATE = re.compile(r"\bFOR\s+UPDATE\s*$", re.IGNORECASE)
+_RENAME_TABLE = re.compile(r"^\s*RENAME\s+TABLE\s+(\w+)\s+TO\s+(\w+)\s*$", re.IGNORECASE)
+_REPLACE_VIEW = re.compile(r"^\s*CREATE\s+OR\s+REPLACE\s+VIEW\s+(\w+)\s+AS\s", re.IGNORECASE)
+_ADD_INDEX = re.compile(r"^\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\((.*)\)\s*$",
+                        re.IGNORECASE | re.DOTALL)
+_CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\(", re.IGNORECASE)
+_INLINE_INDEX = re.compile(r"^(UNIQUE\s+|FULLTEXT\s+)?(?:INDEX|KEY)\s+(\w+)\s*\((.*)\)$", re.IGNORECASE | re.DOTALL)
+_AUTO_INCREMENT_KEY = re.compile(r"\b(?:BIG)?INT(?:EGER)?(?:\s+UNSIGNED)?\s+(?:NOT\s+NULL\s+)?AUTO_INCREMENT\s+PRIMARY\s+KEY\b",
+                                 re.IGNORECASE)
+_ON_UPDATE_TIMESTAMP = re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", re.IGNORECASE)
+_DEFAULT_TIMESTAMP = re.compile(r"\bDEFAULT\s+CURRENT_TIMESTAMP\b", re.IGNORECASE)
+_TEXT_TYPE = re.compile(r"^(\w+\s+(?:(?:VAR)?CHAR\(\d+\)|(?:TINY|MEDIUM|LONG)?TEXT))(?!\w)", re.IGNORECASE)
+
+
+def _split_definitions(body):
+    # Split a CREATE TABLE body on the commas that are not inside parentheses
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == ',' and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current.append(char)
+    parts.append(''.join(current).strip())
+    return [part for part in parts if part]
+
+
+def _create_table(sql, table):
+    """CREATE TABLE in SQLite form plus CREATE INDEX statements for its inline keys.
+
+    AUTO_INCREMENT keys become INTEGER PRIMARY KEY AUTOINCREMENT, text
+    columns compare case-insensitively like MySQL's default collation and
+    CURRENT_TIMESTAMP defaults use local time like MySQL does. ON UPDATE
+    CURRENT_TIMESTAMP and table options are dropped. FULLTEXT keys are
+    dropped too; SQLite has no equivalent.
+    """
+    start = sql.index('(')
+    end = sql.rindex(')')
+    columns, indexes = [], []
+    for definition in _split_definitions(sql[start + 1:end]):
+        match = _INLINE_INDEX.match(definition)
+        if match:
+            kind, name, key_columns = match.groups()
+            if kind and kind.strip().upper() == 'FULLTEXT':
+                continue
+            unique = 'UNIQUE ' if kind else ''
+            indexes.append(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({key_columns})")
+            continue
+        definition = _AUTO_INCREMENT_KEY.sub('INTEGER PRIMARY KEY AUTOINCREMENT', definition)
+        definition = _ON_UPDATE_TIMESTAMP.sub('', definition)
+        definition = _DEFAULT_TIMESTAMP.sub("DEFAULT (datetime('now', 'localtime'))", definition)
+        definition = _TEXT_TYPE.sub(r'\1 COLLATE NOCASE', definition)
+        columns.append(definition)
+    create = sql[:start + 1] + '\n    ' + ',\n    '.join(columns) + '\n)'
+    return [create] + indexes
+
+
+def translate(sql, params):
+    """Rewrite one MySQL statement as a list of SQLite statements.
+
+    Returns (statements, lock) where lock is True for SELECT ... FOR
+    UPDATE, which SQLite expresses by taking the write lock up front.
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8')
+    if params is not None:
+        sql = _PLACEHOLDER.sub(lambda match: '?' if match.group(1) == 's' else '%', sql)
+
+    match = _CREATE_TABLE.match(sql)
+    if match:
+        return _create_table(sql, match.group(1)), False
+    match = _ADD_INDEX.match(sql)
+    if match:
+        table, unique, name, columns = match.groups()
+        return [f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"], False
+    match = _RENAME_TABLE.match(sql)
+    if match:
+        return [f"ALTER TABLE {match.group(1)} RENAME TO {match.group(2)}"], False
+    match = _REPLACE_VIEW.match(sql)
+    if match:
+        return [f"DROP VIEW IF EXISTS {match.group(1)}", _REPLACE_VIEW.sub(r'CREATE VIEW \1 AS ', sql)], False
+
+    sql = _INSERT_IGNORE.sub('INSERT OR IGNORE', sql)
+    if _ON_DUPLICATE.search(sql):
+        head, updates = _ON_DUPLICATE.split(sql, 1)
+        if _SELECT.search(head) and not _WHERE.search(head):
+            # SQLite reads ON after INSERT ... SELECT ... FROM t as a join
+            # constraint unless the SELECT has a WHERE clause
+            parts = _GROUP_BY.split(head, 1)
+            head = parts[0] + ' WHERE true ' + (' GROUP BY' + parts[1] if len(parts) > 1 else '')
+        sql = head + 'ON CONFLICT DO UPDATE SET' + _VALUES_FUNCTION.sub(r'excluded.\1', updates)
+    sql = _NULL_SAFE_EQUAL.sub('IS', sql)
+    sql = _LEFT_FUNCTION.sub('MYSQL_LEFT(', sql)
+    lock = bool(_FOR_UPDATE.search(sql))
+    if lock:
+        sql = _FOR_UPDATE.sub('', sql)
+    return [sql], lock
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts the app's MySQL statements."""
+
+    dialect = SQLITE
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._raw.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, operation, params=None):
+        statements, lock = translate(operation, params)
+        if lock and not self._connection._raw.in_transaction:
+            self._cursor.execute("BEGIN IMMEDIATE")
+        for statement in statements[:-1]:
+            self._cursor.execute(statement)
+        if params is None:
+            self._cursor.execute(statements[-1])
+        else:
+            self._cursor.execute(statements[-1], tuple(params))
+
+    def executemany(self, operation, seq_params):
+        statements, _ = translate(operation, ())
+        self._cursor.executemany(statements[-1], [tuple(params) for params in seq_params])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(self._cursor.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class SQLiteConnection:
+    """sqlite3 connection with mysql.connector's cursor() signature."""
+
+    dialect = SQLITE
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        # buffered does not apply: sqlite3 cursors always step lazily
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    @property
+    def in_transaction(self):
+        # Checked by the pool, which rolls back before reusing a connection
+        return self._raw.in_transaction
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+    def ping(self):
+        self._raw.execute("SELECT 1")
+
+
+class SQLiteBackend:
+    """File or in-memory SQLite database.
+
+    ``path`` is a file name or ':memory:'. An in-memory database is shared
+    by every connection of this backend (it lives as long as the backend)
+    and suits tests; use a file for anything concurrent, where WAL mode
+    lets readers run alongside the single writer.
+    """
+
+    dialect = SQLITE
+    fulltext = False
+    partitioning = False
+    _memory_ids = iter(range(1, 1 << 62))
+
+    def __init__(self, path=':memory:', timeout=30):
+        self.timeout = timeout
+        self._keeper = None
+        if path == ':memory:':
+            self.database = f"file:memdb{next(self._memory_ids)}?mode=memory&cache=shared"
+            self._uri = True
+            self._keeper = self._open()
+        else:
+            self.database = path
+            self._uri = False
+            raw = self._open()
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.close()
+
+    def _open(self):
+        raw = sqlite3.connect(self.database, timeout=self.timeout, uri=self._uri,
+                              detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        raw.execute("PRAGMA foreign_keys=ON")
+        for name, (arguments, function) in SQLITE_FUNCTIONS.items():
+            raw.create_function(name, arguments, function, deterministic=name not in ('NOW', 'CURDATE'))
+        return raw
+
+    def connect(self):
+        return SQLiteConnection(self._open())
+
+    def ping(self, raw):
+        raw.ping()
+
+
+def create_backend(name, mysql_config=None, sqlite_path=':memory:'):
+    if name == MYSQL:
+        return MySQLBackend(mysql_config)
+    if name == SQLITE:
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"unknown database backend: {name}")
+
+
+# ==================== INTROSPECTION ====================
+# information_schema on MySQL, sqlite_master and PRAGMAs on SQLite
+def table_type(cursor, name):
+    """'BASE TABLE', 'VIEW' or None when the name does not exist."""
+    if dialect_of(cursor) == SQLITE:
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = %s AND type IN ('table', 'view')", (name,))
+        row = cursor.fetchone()
+        return {'table': 'BASE TABLE', 'view': 'VIEW'}[row[0]] if row else None
+    cursor.execute("""
+        SELECT TABLE_TYPE FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def table_columns(cursor):
+    """{table: {column, ...}} for every table and view."""
+    if dialect_of(cursor) == SQLITE:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")
+        tables = [row[0] for row in cursor.fetchall()]
+        columns = {}
+        for table in tables:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns[table] = {row[1] for row in cursor.fetchall()}
+        return columns
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+    """)
+    columns = {}
+    for table, column in cursor.fetchall():
+        columns.setdefault(table, set()).add(column)
+    return columns
+
+
+def table_indexes(cursor, table):
+    """{index name: (column, ...)} for one table, the primary key included."""
+    indexes = {}
+    if dialect_of(cursor) == SQLITE:
+        cursor.execute(f"PRAGMA table_info({table})")
+        primary = sorted((row[5], row[1]) for row in cursor.fetchall() if row[5])
+        if primary:
+            indexes['PRIMARY'] = tuple(column for _, column in primary)
+        cursor.execute(f"PRAGMA index_list({table})")
+        for name in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"PRAGMA index_info({name})")
+            indexes[name] = tuple(row[2] for row in sorted(cursor.fetchall()))
+        return indexes
+    cursor.execute("""
+        SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    for index, column in cursor.fetchall():
+        indexes.setdefault(index, []).append(column)
+    return {index: tuple(columns) for index, columns in indexes.items()}
@@ -0,0 +1,514 @@
+# ==================== STOREFRONT BENCHMARK ====================
+# Reproducible load test for the storefront and checkout. ``seed`` fills
+# the configured (local!) database with bench medicines and users; ``run``
+# logs a number of virtual users in and drives a weighted mix of browsing,
+# cart and checkout requests for a fixed time, then reports throughput and
+# p50/p95/p99 latency per route. Results are written as JSON so a later
+# run can be compared against a stored baseline:
+#
+#   python bench.py seed --medicines 2000 --users 50
+#   python bench.py run --duration 60 --concurrency 8 --out baseline.json
+#   ... change something ...
+#   python bench.py run --duration 60 --concurrency 8 --compare baseline.json
+#
+# By default requests go through Flask's test client in this process, which
+# measures the application and database without network noise. Pass
+# --base-url to load a running server over HTTP instead. Without a MySQL
+# server, point both commands at SQLite (see backends.py):
+#
+#   DB_BACKEND=sqlite DB_SQLITE_PATH=bench.db python bench.py seed
+import json
+import math
+import random
+import re
+import subprocess
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+from time import perf_counter
+
+import click
+
+from catalog import PRICE_BUCKETS, AVAILABILITY_BANDS
+
+BENCH_EMAIL = 'bench{}@bench.local'
+BENCH_PASSWORD = 'bench'
+BENCH_MEDICINE = 'Bench Medicine {:05d}'
+BENCH_CATEGORIES = ('Pain Relief', 'Antibiotics', 'Vitamins', 'Diabetes', 'Cardiac',
+                    'Skin Care', 'Baby Care', 'Allergy', 'Digestive', 'First Aid')
+BENCH_SEARCHES = ('pain', 'vitamin', 'bench', 'care', 'tablet', 'syrup')
+# Medicines the traffic buys from keep at least this much stock
+BENCH_STOCK = 1000000
+
+# operation -> (route label, relative weight)
+TRAFFIC_MIX = {
+    'home': ('/', 15),
+    'medicines': ('/medicines', 25),
+    'medicine_details': ('/medicine_details/<id>', 25),
+    'add_to_cart': ('/add_to_cart', 12),
+    'cart': ('/cart', 10),
+    'checkout': ('/checkout', 7),
+    'place_order': ('/place_order', 6),
+}
+
+PERCENTILES = (50, 95, 99)
+_SERVER_TIMING_DB = re.compile(r'(?:^|,)\s*db;dur=([\d.]+)')
+
+
+# ==================== SEEDING ====================
+def seed_database(connection, medicines, users, rng):
+    """Top the bench medicines and users up to the requested counts.
+
+    Most medicines get effectively unlimited stock so checkouts never run
+    dry; a few are low or out of stock so the availability filters have
+    something to separate. Returns (medicines added, users added).
+    """
+    # app.py connects to the database on import, so it is only loaded when needed
+    from app import bump_counter
+    from rollups import record_signup_rollups
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM medicines WHERE name LIKE 'Bench Medicine %'")
+    have = cursor.fetchone()[0]
+    medicine_rows = []
+    for i in range(have, medicines):
+        roll = rng.random()
+        stock = BENCH_STOCK if roll < 0.8 else rng.randint(1, 10) if roll < 0.95 else 0
+        category = rng.choice(BENCH_CATEGORIES)
+        medicine_rows.append((
+            BENCH_MEDICINE.format(i), round(rng.uniform(10, 900), 2), stock, rng.randint(0, 5000),
+            round(rng.uniform(1, 5), 1), f"{category} {rng.choice(('tablet', 'syrup', 'capsule'))} for benchmarking",
+            category
+        ))
+    if medicine_rows:
+        cursor.executemany("""
+            INSERT INTO medicines (name, price, stock_quantity, sold_quantity, ratings, details, category)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, medicine_rows)
+        bump_counter(cursor, 'total_medicines', len(medicine_rows))
+
+    emails = [BENCH_EMAIL.format(i) for i in range(users)]
+    cursor.execute(f"SELECT email FROM users WHERE email IN ({', '.join(['%s'] * len(emails))})", emails)
+    existing = {row[0] for row in cursor.fetchall()}
+    user_rows = [
+        (f"Bench User {i}", email, f"01{i:09d}", BENCH_PASSWORD,
+         f"House {i}, Road {i % 20}, {'Dhaka' if i % 2 == 0 else 'Chittagong'}")
+        for i, email in enumerate(emails) if email not in existing
+    ]
+    if user_rows:
+        cursor.executemany("""
+            INSERT INTO users (name, email, phone, password, address)
+            VALUES (%s, %s, %s, %s, %s)
+        """, user_rows)
+        new_emails = [row[1] for row in user_rows]
+        cursor.execute(f"SELECT id FROM users WHERE email IN ({', '.join(['%s'] * len(new_emails))})", new_emails)
+        record_signup_rollups(cursor, [row[0] for row in cursor.fetchall()])
+        bump_counter(cursor, 'total_users', len(user_rows))
+
+    connection.commit()
+    cursor.close()
+    return len(medicine_rows), len(user_rows)
+
+
+def load_catalog(connection):
+    # (id, name, price) of the bench medicines checkouts can always buy, and the categories
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT id, name, price FROM medicines
+        WHERE name LIKE 'Bench Medicine %%' AND stock_quantity >= %s
+    """, (BENCH_STOCK // 2,))
+    medicines = [(row[0], row[1], str(row[2])) for row in cursor.fetchall()]
+    cursor.execute("SELECT DISTINCT category FROM medicines WHERE category IS NOT NULL")
+    categories = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return medicines, categories
+
+
+def missing_users(connection, emails):
+    # The bench users among ``emails`` that have not been seeded
+    cursor = connection.cursor()
+    cursor.execute("SELECT email FROM users WHERE email LIKE %s", (BENCH_EMAIL.format('%%'),))
+    seeded = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return [email for email in emails if email not in seeded]
+
+
+# ==================== CLIENTS ====================
+class TestClient:
+    """Requests through Flask's test client, in this process."""
+
+    def __init__(self, flask_app):
+        self._client = flask_app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        return response.status_code, response.headers.get('Server-Timing')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time each request on its own instead of following redirects
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """Requests over HTTP to a running server, with its own cookie jar."""
+
+    def __init__(self, base_url, timeout=30):
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self._base_url + path, data=body, method=method)
+        try:
+            with self._opener.open(req, timeout=self._timeout) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('Server-Timing')
+        except (urllib.error.URLError, OSError) as e:
+            print(f"Error requesting {path}: {e}")
+            return 0, None
+
+
+# ==================== TRAFFIC ====================
+class VirtualUser:
+    """One logged-in shopper choosing weighted operations at random."""
+
+    def __init__(self, client, email, medicines, categories, rng):
+        self.client = client
+        self.email = email
+        self.medicines = medicines
+        self.categories = categories
+        self.rng = rng
+        self.cart = {}  # medicine id -> (name, price, quantity), mirrors the server cart
+
+    def login(self):
+        status, _ = self.client.request('POST', '/login', {'email': self.email, 'password': BENCH_PASSWORD})
+        return status < 400
+
+    def home(self):
+        return 'GET', '/', None
+
+    def medicines_page(self):
+        params = {}
+        if self.rng.random() < 0.15:
+            params['search'] = self.rng.choice(BENCH_SEARCHES)
+        if self.rng.random() < 0.5:
+            params['price_range'] = self.rng.choice(list(PRICE_BUCKETS))
+        if self.rng.random() < 0.3:
+            params['availability'] = self.rng.choice(list(AVAILABILITY_BANDS))
+        if self.rng.random() < 0.3:
+            params['rating'] = self.rng.choice(('2', '3', '4'))
+        if self.rng.random() < 0.3:
+            params['page'] = self.rng.randint(2, 5)
+        path = '/medicines'
+        if self.categories and self.rng.random() < 0.4:
+            path += '/' + urllib.parse.quote(self.rng.choice(self.categories))
+        if params:
+            path += '?' + urllib.parse.urlencode(params)
+        return 'GET', path, None
+
+    def medicine_details(self):
+        medicine_id = self.rng.choice(self.medicines)[0]
+        return 'GET', f'/medicine_details/{medicine_id}', None
+
+    def add_to_cart(self):
+        medicine_id, name, price = self.rng.choice(self.medicines)
+        quantity = self.rng.randint(1, 3)
+        previous = self.cart.get(medicine_id, (name, price, 0))[2]
+        self.cart[medicine_id] = (name, price, previous + quantity)
+        return 'POST', '/add_to_cart', {'medicine_id': medicine_id, 'quantity': quantity}
+
+    def cart_page(self):
+        return 'GET', '/cart', None
+
+    def checkout(self):
+        return 'GET', '/checkout', None
+
+    def place_order(self):
+        if self.cart:
+            lines, source = self.cart, 'cart'
+        else:
+            medicine_id, name, price = self.rng.choice(self.medicines)
+            lines, source = {medicine_id: (name, price, 1)}, 'direct'
+        self.cart = {}
+        return 'POST', '/place_order', {
+            'firstName': 'Bench', 'lastName': 'User', 'email': self.email, 'phone': '01700000000',
+            'address': 'House 1, Road 1', 'city': self.rng.choice(('Dhaka', 'Chittagong')),
+            'postalCode': '1200', 'paymentMethod': 'cod', 'deliveryOption': 'standard', 'source': source,
+            'item_id': [str(medicine_id) for medicine_id in lines],
+            'item_name': [line[0] for line in lines.values()],
+            'item_price': [line[1] for line in lines.values()],
+            'item_quantity': [str(line[2]) for line in lines.values()],
+        }
+
+    OPERATIONS = {
+        'home': home,
+        'medicines': medicines_page,
+        'medicine_details': medicine_details,
+        'add_to_cart': add_to_cart,
+        'cart': cart_page,
+        'checkout': checkout,
+        'place_order': place_order,
+    }
+
+    def step(self, operation):
+        # Issue one request; returns (elapsed seconds, status, DB milliseconds or None)
+        method, path, data = self.OPERATIONS[operation](self)
+        start = perf_counter()
+        status, server_timing = self.client.request(method, path, data)
+        elapsed = perf_counter() - start
+        db_ms = None
+        if server_timing:
+            match = _SERVER_TIMING_DB.search(server_timing)
+            if match:
+                db_ms = float(match.group(1))
+        return elapsed, status, db_ms
+
+
+def _worker(user, operations, weights, barrier, timing, samples):
+    # Log in, wait for everyone, then loop until the deadline; samples
+    # taken during the warmup are dropped. A failed login aborts the run:
+    # the cart and checkout routes would only measure login redirects.
+    if not user.login():
+        print(f"Error logging in as {user.email}")
+        barrier.abort()
+        return
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        return
+    while True:
+        operation = user.rng.choices(operations, weights)[0]
+        elapsed, status, db_ms = user.step(operation)
+        now = perf_counter()
+        if now >= timing['deadline']:
+            break
+        if now >= timing['measure_from']:
+            samples.append((operation, elapsed, status, db_ms))
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, duration):
+    routes = {}
+    for operation, (label, _) in TRAFFIC_MIX.items():
+        rows = [sample for sample in samples if sample[0] == operation]
+        if not rows:
+            continue
+        latencies = sorted(sample[1] * 1000 for sample in rows)
+        db_times = [sample[3] for sample in rows if sample[3] is not None]
+        summary = {
+            'requests': len(rows),
+            'errors': sum(1 for sample in rows if sample[2] == 0 or sample[2] >= 400),
+            'rps': round(len(rows) / duration, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+        }
+        for p in PERCENTILES:
+            summary[f'p{p}_ms'] = round(percentile(latencies, p), 2)
+        summary['max_ms'] = round(latencies[-1], 2)
+        summary['db_ms_mean'] = round(sum(db_times) / len(db_times), 2) if db_times else None
+        routes[label] = summary
+    return {
+        'total': {
+            'requests': len(samples),
+            'errors': sum(route['errors'] for route in routes.values()),
+            'rps': round(len(samples) / duration, 2),
+        },
+        'routes': routes,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(make_client, users, medicines, categories, duration, warmup, seed):
+    # Returns the summarized results, or None when a virtual user could not log in
+    rng = random.Random(seed)
+    operations = list(TRAFFIC_MIX)
+    weights = [TRAFFIC_MIX[operation][1] for operation in operations]
+    barrier = threading.Barrier(len(users) + 1)
+    timing = {'measure_from': float('inf'), 'deadline': float('inf')}
+    per_worker = [[] for _ in users]
+    threads = [
+        threading.Thread(target=_worker, daemon=True, args=(
+            VirtualUser(make_client(), email, medicines, categories, random.Random(rng.random())),
+            operations, weights, barrier, timing, samples))
+        for email, samples in zip(users, per_worker)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        return None
+    start = perf_counter()
+    timing['measure_from'] = start + warmup
+    timing['deadline'] = start + warmup + duration
+    for thread in threads:
+        thread.join()
+    return summarize([sample for samples in per_worker for sample in samples], duration)
+
+
+# ==================== REPORTING ====================
+def print_results(results):
+    print(f"{'route':<24}{'requests':>9}{'errors':>8}{'rps':>9}"
+          + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'db ms':>9}")
+    for label, route in results['routes'].items():
+        db_ms = route['db_ms_mean']
+        print(f"{label:<24}{route['requests']:>9}{route['errors']:>8}{route['rps']:>9.1f}"
+              + ''.join(f"{route[f'p{p}_ms']:>10.1f}" for p in PERCENTILES)
+              + (f"{db_ms:>9.1f}" if db_ms is not None else f"{'-':>9}"))
+    total = results['total']
+    print(f"{'total':<24}{total['requests']:>9}{total['errors']:>8}{total['rps']:>9.1f}")
+
+
+def _change(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def compare_results(baseline, results, max_regression=None):
+    """Print per-route changes against a baseline; returns the regressed routes.
+
+    A route regresses when its p95 grows, or its throughput drops, by more
+    than ``max_regression`` percent.
+    """
+    regressions = []
+    print(f"\n{'route':<24}{'rps':>18}" + ''.join(f"{f'p{p} ms':>20}" for p in PERCENTILES))
+    for label, route in results['routes'].items():
+        before = baseline['routes'].get(label)
+        if before is None:
+            print(f"{label:<24}  (not in baseline)")
+            continue
+        cells = []
+        for key in ['rps'] + [f'p{p}_ms' for p in PERCENTILES]:
+            change = _change(before[key], route[key])
+            cells.append(f"{before[key]:.1f}->{route[key]:.1f} "
+                         + (f"{change:+.0f}%" if change is not None else ''))
+        print(f"{label:<24}{cells[0]:>18}" + ''.join(f"{cell:>20}" for cell in cells[1:]))
+        if max_regression is not None:
+            p95_change = _change(before['p95_ms'], route['p95_ms'])
+            rps_change = _change(before['rps'], route['rps'])
+            if (p95_change is not None and p95_change > max_regression) or \
+                    (rps_change is not None and -rps_change > max_regression):
+                regressions.append(label)
+    return regressions
+
+
+# ==================== COMMANDS ====================
+@click.group()
+def cli():
+    """Seed a local database and benchmark the storefront."""
+
+
+@cli.command()
+@click.option('--medicines', default=2000, show_default=True, help='Bench medicines to have in the catalog.')
+@click.option('--users', default=50, show_default=True, help='Bench users to have (one per virtual user).')
+@click.option('--seed', default=1, show_default=True, help='Random seed for the generated rows.')
+def seed(medicines, users, seed):
+    """Insert bench medicines and users into the configured database."""
+    from app import get_db_connection
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    added_medicines, added_users = seed_database(connection, medicines, users, random.Random(seed))
+    connection.close()
+    # A server that is already running sees the new medicines once its
+    # catalog index is rebuilt (CATALOG_INDEX_TTL)
+    print(f"Added {added_medicines} medicines and {added_users} users.")
+
+
+@cli.command()
+@click.option('--duration', default=30.0, show_default=True, help='Measured seconds.')
+@click.option('--warmup', default=5.0, show_default=True, help='Seconds of traffic before measuring.')
+@click.option('--concurrency', default=8, show_default=True, help='Virtual users running at once.')
+@click.option('--base-url', default=None, help='Load a running server instead of the in-process app.')
+@click.option('--seed', default=1, show_default=True, help='Random seed for the traffic.')
+@click.option('--out', type=click.Path(dir_okay=False), default=None, help='Write the results to this JSON file.')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Baseline results JSON to compare against.')
+@click.option('--max-regression', type=float, default=None,
+              help='Exit non-zero when a route p95 or rps is this many percent worse than the baseline.')
+def run(duration, warmup, concurrency, base_url, seed, out, compare, max_regression):
+    """Drive mixed storefront traffic and report latency per route."""
+    from app import app as flask_app, get_db_connection
+    connection = get_db_connection()
+    if not connection:
+        print("Database connection error")
+        return
+    users = [BENCH_EMAIL.format(i) for i in range(concurrency)]
+    medicines, categories = load_catalog(connection)
+    missing = missing_users(connection, users)
+    connection.close()
+    if not medicines:
+        print("No bench medicines found; run `python bench.py seed` first.")
+        raise SystemExit(1)
+    if missing:
+        # Every virtual user logs in as its own bench user
+        print(f"{len(missing)} of {concurrency} bench users are missing; "
+              f"run `python bench.py seed --users {concurrency}` first.")
+        raise SystemExit(1)
+    if base_url:
+        make_client = lambda: HttpClient(base_url)
+    else:
+        make_client = lambda: TestClient(flask_app)
+
+    started = datetime.now()
+    results = run_benchmark(make_client, users, medicines, categories, duration, warmup, seed)
+    if results is None:
+        print("Aborted: not every virtual user could log in.")
+        raise SystemExit(1)
+    results['meta'] = {
+        'started': started.isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'target': base_url or 'in-process',
+        'duration_s': duration,
+        'warmup_s': warmup,
+        'concurrency': concurrency,
+        'seed': seed,
+        'mix': {label: weight for label, weight in TRAFFIC_MIX.values()},
+    }
+    print_results(results)
+
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {out}")
+
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, max_regression)
+        if regressions:
+            print(f"Regressed beyond {max_regression}%: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
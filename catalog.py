@@ -0,0 +1,414 @@
+# ==================== IN-MEMORY CATALOG INDEX ====================
+# Keeps a slim copy of the medicines table in memory together with one
+# bitset (a Python int, bit N = slot N) per category, price bucket,
+# availability band and rating threshold. A filtered listing is the AND
+# of a few bitsets, and facet counts are popcounts, so /medicines can be
+# served without touching MySQL. Slots follow id order, which is the
+# order the old SQL listing returned rows in.
+import random
+import threading
+from time import monotonic
+
+
+# Columns the listing page needs; details and other large columns stay in MySQL
+CATALOG_COLUMNS = ('id', 'name', 'price', 'ratings', 'sold_quantity', 'stock_quantity', 'image', 'category')
+
+# Same boundaries as the SQL filters in app.medicines() (BETWEEN is inclusive)
+PRICE_BUCKETS = {
+    'under100': lambda price: price < 100,
+    '100to300': lambda price: 100 <= price <= 300,
+    '300to500': lambda price: 300 <= price <= 500,
+    'over500': lambda price: price > 500,
+}
+
+AVAILABILITY_BANDS = {
+    'in_stock': lambda stock: stock > 10,
+    'low_stock': lambda stock: 0 < stock <= 10,
+    'out_of_stock': lambda stock: stock == 0,
+}
+
+RATING_THRESHOLDS = (1, 2, 3, 4, 5)
+
+# Byte -> number of set bits, used to skip whole blocks when paging
+_POPCOUNT_TABLE = bytes(bin(i).count('1') for i in range(256))
+
+
+def _popcount(bits):
+    try:
+        return bits.bit_count()
+    except AttributeError:  # Python < 3.10
+        return bin(bits).count('1')
+
+
+def category_key(category):
+    return str(category or '').strip().lower()
+
+
+class RandomPool:
+    """A set of ids with O(1) add/remove and O(k) uniform sampling."""
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        # Move the last item into the hole so the list stays dense
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def sample(self, k, exclude=()):
+        take = min(len(self.items), k + len(exclude))
+        if take <= 0:
+            return []
+        picks = random.sample(self.items, take)
+        return [item for item in picks if item not in exclude][:k]
+
+
+class _Snapshot:
+    def __init__(self):
+        self.rows = []              # slot -> row dict, None for deleted slots
+        self.slots = {}             # medicine id -> slot
+        self.all_bits = 0
+        self.category_bits = {}     # category key -> bitset
+        self.category_names = {}    # category key -> display name
+        self.price_bits = {name: 0 for name in PRICE_BUCKETS}
+        self.availability_bits = {name: 0 for name in AVAILABILITY_BANDS}
+        self.rating_bits = {threshold: 0 for threshold in RATING_THRESHOLDS}
+        self.category_pools = {}    # category key -> RandomPool of medicine ids
+        self.all_pool = RandomPool()
+
+    @classmethod
+    def build(cls, rows):
+        snapshot = cls()
+        rows = sorted(rows, key=lambda row: row['id'])
+        nbytes = len(rows) // 8 + 1
+        masks = {}
+
+        def mark(key, slot):
+            mask = masks.get(key)
+            if mask is None:
+                mask = masks[key] = bytearray(nbytes)
+            mask[slot >> 3] |= 1 << (slot & 7)
+
+        for slot, row in enumerate(rows):
+            row = {column: row.get(column) for column in CATALOG_COLUMNS}
+            snapshot.rows.append(row)
+            snapshot.slots[row['id']] = slot
+            snapshot._pool_add(row)
+            for key in snapshot._keys_for(row):
+                mark(key, slot)
+            mark(('all',), slot)
+
+        # Build each bitset from a byte mask in one go; OR-ing bits one at a
+        # time would be quadratic in the catalog size
+        for key, mask in masks.items():
+            bits = int.from_bytes(mask, 'little')
+            snapshot._set_bits(key, bits)
+        return snapshot
+
+    def _keys_for(self, row):
+        key = category_key(row['category'])
+        self.category_names.setdefault(key, row['category'])
+        yield ('category', key)
+        price = row['price']
+        if price is not None:
+            for name, test in PRICE_BUCKETS.items():
+                if test(price):
+                    yield ('price', name)
+        stock = row['stock_quantity']
+        if stock is not None:
+            for name, test in AVAILABILITY_BANDS.items():
+                if test(stock):
+                    yield ('availability', name)
+        ratings = row['ratings']
+        if ratings is not None:
+            for threshold in RATING_THRESHOLDS:
+                if ratings >= threshold:
+                    yield ('rating', threshold)
+
+    def _bits_map(self, kind):
+        return {
+            'category': self.category_bits,
+            'price': self.price_bits,
+            'availability': self.availability_bits,
+            'rating': self.rating_bits,
+        }[kind]
+
+    def _set_bits(self, key, bits):
+        if key[0] == 'all':
+            self.all_bits = bits
+        else:
+            self._bits_map(key[0])[key[1]] = bits
+
+    def _pool_add(self, row):
+        key = category_key(row['category'])
+        pool = self.category_pools.get(key)
+        if pool is None:
+            pool = self.category_pools[key] = RandomPool()
+        pool.add(row['id'])
+        self.all_pool.add(row['id'])
+
+    def _pool_discard(self, row):
+        pool = self.category_pools.get(category_key(row['category']))
+        if pool is not None:
+            pool.discard(row['id'])
+        self.all_pool.discard(row['id'])
+
+    # ---------- incremental maintenance ----------
+    def upsert(self, row):
+        row = {column: row.get(column) for column in CATALOG_COLUMNS}
+        slot = self.slots.get(row['id'])
+        if slot is None:
+            slot = len(self.rows)
+            self.rows.append(row)
+            self.slots[row['id']] = slot
+        else:
+            self._clear(slot)
+            self._pool_discard(self.rows[slot])
+            self.rows[slot] = row
+        self._pool_add(row)
+        bit = 1 << slot
+        self.all_bits |= bit
+        for kind, value in self._keys_for(row):
+            bits_map = self._bits_map(kind)
+            bits_map[value] = bits_map.get(value, 0) | bit
+
+    def remove(self, medicine_id):
+        slot = self.slots.pop(medicine_id, None)
+        if slot is not None:
+            self._clear(slot)
+            self._pool_discard(self.rows[slot])
+            self.rows[slot] = None
+
+    def _clear(self, slot):
+        mask = ~(1 << slot)
+        self.all_bits &= mask
+        for bits_map in (self.category_bits, self.price_bits, self.availability_bits, self.rating_bits):
+            for key, bits in bits_map.items():
+                if bits >> slot & 1:
+                    bits_map[key] = bits & mask
+
+    # ---------- queries ----------
+    def slots_in_range(self, bits, offset, limit):
+        # Return the slots of set bits number offset .. offset+limit-1
+        if bits <= 0 or limit <= 0:
+            return []
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        counts = data.translate(_POPCOUNT_TABLE)
+
+        # Skip whole 1 KiB blocks (summed in C), then single bytes
+        block = 1024
+        position = 0
+        while position < len(counts):
+            block_count = sum(counts[position:position + block])
+            if block_count > offset:
+                break
+            offset -= block_count
+            position += block
+        while position < len(counts) and counts[position] <= offset:
+            offset -= counts[position]
+            position += 1
+
+        result = []
+        while position < len(data) and len(result) < limit:
+            byte = data[position]
+            for bit in range(8):
+                if byte >> bit & 1:
+                    if offset:
+                        offset -= 1
+                    else:
+                        result.append(position * 8 + bit)
+                        if len(result) == limit:
+                            break
+            position += 1
+        return result
+
+
+class CatalogIndex:
+    """Thread-safe facade over a catalog snapshot.
+
+    ``loader`` returns the rows of the medicines table (or None when the
+    database is unavailable). The snapshot is rebuilt in the background
+    once it is older than ``ttl`` seconds; writes made through
+    upsert()/remove() in the meantime are replayed onto the new snapshot.
+    """
+
+    def __init__(self, loader, ttl=300):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._loaded_at = 0
+        self._rebuilding = False
+        self._pending = []
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def ensure_loaded(self):
+        if self._snapshot is None:
+            self.rebuild()
+        elif monotonic() - self._loaded_at > self.ttl:
+            self.rebuild_async()
+        return self._snapshot is not None
+
+    def rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._pending = []
+        try:
+            rows = self._loader()
+            if rows is None:
+                return
+            snapshot = _Snapshot.build(rows)
+            with self._lock:
+                for op, arg in self._pending:
+                    getattr(snapshot, op)(arg)
+                self._snapshot = snapshot
+                self._loaded_at = monotonic()
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._pending = []
+
+    def rebuild_async(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+        threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def upsert(self, row):
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append(('upsert', row))
+            if self._snapshot is not None:
+                self._snapshot.upsert(row)
+
+    def remove(self, medicine_id):
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append(('remove', medicine_id))
+            if self._snapshot is not None:
+                self._snapshot.remove(medicine_id)
+
+    def snapshot_rows(self, category=None):
+        # All live rows, optionally limited to one category (used by recommendations)
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return []
+            if category is None:
+                return [row for row in snapshot.rows if row is not None]
+            bits = snapshot.category_bits.get(category_key(category), 0) & snapshot.all_bits
+            return [snapshot.rows[slot] for slot in snapshot.slots_in_range(bits, 0, _popcount(bits))]
+
+    def sample(self, category=None, k=4, exclude_ids=()):
+        # k random rows from one category's pool (or the whole catalog)
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return []
+            if category is None:
+                pool = snapshot.all_pool
+            else:
+                pool = snapshot.category_pools.get(category_key(category))
+                if pool is None:
+                    return []
+            return [dict(snapshot.rows[snapshot.slots[medicine_id]])
+                    for medicine_id in pool.sample(k, set(exclude_ids))]
+
+    def get_rows(self, medicine_ids):
+        # Rows for the given ids in the given order; unknown ids are skipped
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return []
+            return [dict(snapshot.rows[snapshot.slots[medicine_id]])
+                    for medicine_id in medicine_ids if medicine_id in snapshot.slots]
+
+    def categories(self):
+        # Distinct categories with their live item counts, like SELECT DISTINCT category
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return []
+            return [
+                {'category': snapshot.category_names[key], 'count': _popcount(bits & snapshot.all_bits)}
+                for key, bits in snapshot.category_bits.items()
+                if bits & snapshot.all_bits
+            ]
+
+    def query(self, category=None, price_range='all', availability='all', min_rating=None,
+              page=1, per_page=12):
+        """Return (rows, total, facets) for one listing page."""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return [], 0, {}
+
+            filters = {}
+            if category:
+                filters['category'] = snapshot.category_bits.get(category_key(category), 0)
+            if price_range in PRICE_BUCKETS:
+                filters['price'] = snapshot.price_bits[price_range]
+            if availability in AVAILABILITY_BANDS:
+                filters['availability'] = snapshot.availability_bits[availability]
+            if min_rating is not None:
+                filters['rating'] = self._rating_bits(snapshot, min_rating)
+
+            def combined(exclude=None):
+                bits = snapshot.all_bits
+                for kind, kind_bits in filters.items():
+                    if kind != exclude:
+                        bits &= kind_bits
+                return bits
+
+            matched = combined()
+            total = _popcount(matched)
+            offset = max(0, (page - 1) * per_page)
+            rows = [dict(snapshot.rows[slot]) for slot in snapshot.slots_in_range(matched, offset, per_page)]
+
+            # Each facet is counted with every other active filter applied
+            base = combined('category')
+            facets = {'category': {
+                snapshot.category_names[key]: _popcount(base & bits)
+                for key, bits in snapshot.category_bits.items()
+                if bits & snapshot.all_bits
+            }}
+            base = combined('price')
+            facets['price_range'] = {name: _popcount(base & bits) for name, bits in snapshot.price_bits.items()}
+            base = combined('availability')
+            facets['availability'] = {name: _popcount(base & bits) for name, bits in snapshot.availability_bits.items()}
+            base = combined('rating')
+            facets['rating'] = {str(t): _popcount(base & bits) for t, bits in snapshot.rating_bits.items()}
+            return rows, total, facets
+
+    @staticmethod
+    def _rating_bits(snapshot, min_rating):
+        if min_rating in snapshot.rating_bits:
+            return snapshot.rating_bits[min_rating]
+        # Non-standard threshold: narrow down with the next integer bitset below it
+        floor = max([t for t in RATING_THRESHOLDS if t <= min_rating], default=None)
+        bits = snapshot.rating_bits[floor] if floor is not None else snapshot.all_bits
+        result = 0
+        for slot in snapshot.slots_in_range(bits, 0, _popcount(bits)):
+            ratings = snapshot.rows[slot]['ratings']
+            if ratings is not None and ratings >= min_rating:
+                result |= 1 << slot
+        return result
@@ -175,6 +175,117 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Order history: the Orders and Invoices tabs page in their rows from
+    // /dashboard/orders when they first scroll into view
+    function escapeHtml(value) {
+        const div = document.createElement('div');
+        div.textContent = value == null ? '' : String(value);
+        return div.innerHTML;
+    }
+    
+    const historyRenderers = {
+        orders: (order) => `
+            <tr>
+                <td class="order-id">#ORD-${order.id}</td>
+                <td>${escapeHtml(order.date)}</td>
+                <td>${order.quantity} items</td>
+                <td>৳${order.price}</td>
+                <td><span class="order-status status-${escapeHtml(String(order.status).toLowerCase())}">${escapeHtml(order.status)}</span></td>
+                <td>
+                    <div class="order-actions">
+                        <a href="${order.invoice_url}" class="order-btn">View</a>
+                        <a href="${order.invoice_url}" class="order-btn">Invoice</a>
+                        <form action="${order.reorder_url}" method="post" style="display: inline;">
+                            <button type="submit" class="order-btn">Reorder</button>
+                        </form>
+                    </div>
+                </td>
+            </tr>`,
+        invoices: (order) => `
+            <div class="invoice-card">
+                <div class="invoice-header">
+                    <div class="invoice-number">#INV-${order.id}</div>
+                    <div class="invoice-date">${escapeHtml(order.date)}</div>
+                </div>
+                <div class="invoice-details">
+                    <div class="invoice-row">
+                        <span>Order ID:</span>
+                        <span>#ORD-${order.id}</span>
+                    </div>
+                    <div class="invoice-row">
+                        <span>Payment Method:</span>
+                        <span>${escapeHtml(order.payment_method)}</span>
+                    </div>
+                    <div class="invoice-row">
+                        <span>Items:</span>
+                        <span>${order.quantity} items</span>
+                    </div>
+                    <div class="invoice-row">
+                        <span>Delivery:</span>
+                        <span>৳0</span>
+                    </div>
+                    <div class="invoice-row total">
+                        <span>Total:</span>
+                        <span>৳${order.price}</span>
+                    </div>
+                </div>
+                <div class="invoice-actions">
+                    <a href="${order.invoice_url}" class="invoice-btn">View</a>
+                    <a href="${order.invoice_url}" class="invoice-btn secondary">Download</a>
+                </div>
+            </div>`
+    };
+    
+    document.querySelectorAll('.order-history').forEach(container => {
+        const view = container.getAttribute('data-history-view');
+        const button = document.querySelector(`.load-more-btn[data-history-target="${view}"]`);
+        let nextToken = null;
+        let loading = false;
+        let finished = false;
+        
+        function loadPage() {
+            if (loading || finished) return;
+            loading = true;
+            button.disabled = true;
+            button.textContent = 'Loading...';
+            
+            const url = new URL(container.getAttribute('data-history-url'), window.location.origin);
+            if (nextToken) url.searchParams.set('after', nextToken);
+            
+            fetch(url)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.error) throw new Error(data.error);
+                    container.insertAdjacentHTML('beforeend', data.orders.map(historyRenderers[view]).join(''));
+                    nextToken = data.next;
+                    finished = !nextToken;
+                    if (finished) {
+                        button.style.display = 'none';
+                        if (!container.children.length) {
+                            button.insertAdjacentHTML('afterend', '<p>No orders yet.</p>');
+                        }
+                    }
+                })
+                .catch(() => showToast('Could not load your orders'))
+                .finally(() => {
+                    loading = false;
+                    button.disabled = false;
+                    button.textContent = 'Load More';
+                });
+        }
+        
+        button.addEventListener('click', loadPage);
+        
+        // Fires when the tab is shown and whenever the button scrolls into view
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadPage();
+            }).observe(button);
+        } else {
+            loadPage();
+        }
+    });
+    
     // Toast notification
     function showToast(message) {
         const toast = document.getElementById('toast');
@@ -0,0 +1,443 @@
+# ==================== SYNTHETIC DATA GENERATOR ====================
+# Fills the database with realistic volumes for scale testing: users,
+# medicines, order lines, reviews, carts and prescriptions. Rows are
+# generated in Python and written in large multi-row batches (or, on
+# MySQL, through LOAD DATA LOCAL INFILE files), committing per batch so
+# undo logs stay small.
+#
+# The data is skewed the way a real store is: medicine popularity and
+# customer activity follow Zipf-like distributions, orders grow over the
+# covered period with weekly and daily peaks, and a checkout holds one to
+# a few lines with the same customer and time. Generated rows bypass the
+# write paths that maintain the report rollups and site counters; run
+# rebuild_rollups() and recount_site_counters() afterwards (the
+# generate-data command does).
+import os
+import random
+import tempfile
+from array import array
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+from time import perf_counter
+
+from backends import dialect_of, SQLITE
+
+# Target volumes for a full-size run; generate_data() takes a scale factor
+FULL_SCALE = {
+    'users': 1000000,
+    'medicines': 200000,
+    'order_lines': 50000000,
+    'reviews': 2000000,
+    'carts': 500000,
+    'prescriptions': 300000,
+}
+
+FIRST_NAMES = ('Rahim', 'Karim', 'Fatema', 'Ayesha', 'Nusrat', 'Tanvir', 'Sadia', 'Imran', 'Farhana', 'Rafiq',
+               'Mitu', 'Hasan', 'Shirin', 'Arif', 'Jannat', 'Sohel', 'Rumana', 'Kamal', 'Nasrin', 'Sabbir')
+LAST_NAMES = ('Ahmed', 'Hossain', 'Islam', 'Rahman', 'Khan', 'Chowdhury', 'Akter', 'Uddin', 'Sarker', 'Begum',
+              'Miah', 'Das', 'Roy', 'Karim', 'Haque', 'Alam', 'Talukder', 'Sheikh', 'Biswas', 'Mollah')
+# Dhaka takes most of the weight so both delivery zones are exercised
+CITIES = ('Dhaka',) * 6 + ('Chittagong', 'Sylhet', 'Rajshahi', 'Khulna')
+
+# category -> relative share of the catalog
+CATEGORIES = {
+    'Pain Relief': 14, 'Antibiotics': 10, 'Vitamins': 12, 'Diabetes': 8, 'Cardiac': 8, 'Skin Care': 9,
+    'Baby Care': 6, 'Allergy': 7, 'Digestive': 8, 'First Aid': 5, 'Respiratory': 7, 'Eye Care': 3,
+    'Women Health': 3,
+}
+NAME_STEMS = ('Napa', 'Ace', 'Seclo', 'Maxpro', 'Fexo', 'Rupa', 'Tofen', 'Monas', 'Zimax', 'Ceevit',
+              'Alatrol', 'Losectil', 'Bizoran', 'Amdocal', 'Glucomin', 'Calbo', 'Flexi', 'Neoceptin',
+              'Osartil', 'Filwel')
+NAME_SUFFIXES = ('', ' Plus', ' Extra', ' Forte', ' XR', ' Kids', ' Max', ' DS')
+FORMS = ('Tablet', 'Capsule', 'Syrup', 'Suspension', 'Cream', 'Drops', 'Injection', 'Gel')
+STRENGTHS = (5, 10, 20, 25, 50, 100, 150, 200, 250, 400, 500, 650, 1000)
+
+PAYMENT_METHODS = {'cod': 60, 'bkash': 20, 'nagad': 10, 'card': 10}
+LINES_PER_CHECKOUT = {1: 55, 2: 25, 3: 12, 4: 8}
+LINE_QUANTITIES = {1: 70, 2: 15, 3: 8, 4: 4, 5: 3}
+REVIEW_RATINGS = {1: 3, 2: 4, 3: 10, 4: 30, 5: 53}
+REVIEW_QUOTES = ('Works as expected.', 'Fast delivery, genuine product.', 'Helped a lot.',
+                 'Good value for money.', 'Packaging could be better.', 'Will order again.',
+                 'Did not notice much difference.', 'Recommended by my doctor, happy with it.')
+PRESCRIPTION_STATUSES = {'Pending': 15, 'Processing': 10, 'Approved': 65, 'Rejected': 10}
+
+# Share of orders placed per hour of the day (evenings are busiest)
+HOUR_WEIGHTS = (2, 1, 1, 1, 1, 2, 3, 5, 6, 7, 8, 8, 8, 7, 7, 7, 8, 9, 10, 11, 11, 9, 6, 4)
+# Monday .. Sunday; Friday and Saturday are the weekend here
+WEEKDAY_WEIGHTS = (10, 10, 10, 10, 13, 12, 10)
+
+
+def zipf_cumulative(n, exponent=1.0):
+    """Cumulative weights for random.choices(): item i has weight 1 / (i + 1) ** exponent."""
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def _cumulative(weights):
+    return list(accumulate(weights))
+
+
+class TimeSampler:
+    """Random datetimes in [end - days, end) with growth and daily/weekly peaks.
+
+    ``growth`` is how many times busier the last day is than the first;
+    the daily weight ramps linearly between them. Times are drawn from
+    hour slots weighted by day and hour of day.
+    """
+
+    def __init__(self, rng, end, days, growth=3.0):
+        self.rng = rng
+        self.start = datetime(end.year, end.month, end.day) - timedelta(days=days - 1)
+        self.end = end
+        self.end_stamp = end.timestamp()
+        self.slot_starts = []
+        weights = []
+        for day in range(days):
+            day_start = self.start + timedelta(days=day)
+            day_weight = (1 + (growth - 1) * day / max(days - 1, 1)) * WEEKDAY_WEIGHTS[day_start.weekday()]
+            for hour, hour_weight in enumerate(HOUR_WEIGHTS):
+                slot = day_start + timedelta(hours=hour)
+                if slot >= end:
+                    break
+                self.slot_starts.append(slot.timestamp())
+                weights.append(day_weight * hour_weight)
+        self.slots = range(len(self.slot_starts))
+        self.slot_weights = _cumulative(weights)
+
+    def sample_stamps(self, k):
+        # POSIX timestamps; cheaper to compare than datetimes
+        starts, last, random_ = self.slot_starts, self.end_stamp - 1, self.rng.random
+        return [min(starts[slot] + random_() * 3600, last)
+                for slot in self.rng.choices(self.slots, cum_weights=self.slot_weights, k=k)]
+
+    def sample(self, k):
+        return [datetime.fromtimestamp(int(stamp)) for stamp in self.sample_stamps(k)]
+
+
+# ==================== WRITERS ====================
+def _tsv_value(value):
+    # One field of a LOAD DATA file (default FIELDS/LINES/ESCAPED BY settings)
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    return str(value)
+
+
+class BulkWriter:
+    """Writes batches of rows with multi-row INSERTs or LOAD DATA LOCAL INFILE.
+
+    LOAD DATA needs a MySQL connection opened with allow_local_infile=True
+    and local_infile enabled on the server; batches are spooled to a
+    temporary file of ``file_rows`` rows before each load.
+    """
+
+    def __init__(self, connection, load_data=False, file_rows=500000, log=print):
+        if load_data and dialect_of(connection) == SQLITE:
+            raise ValueError("LOAD DATA is only available on MySQL")
+        self.connection = connection
+        self.load_data = load_data
+        self.file_rows = file_rows
+        self.log = log
+
+    def write(self, table, columns, batches):
+        """Write every row of ``batches`` (an iterable of row lists); returns the row count."""
+        started = perf_counter()
+        if self.load_data:
+            written = self._load(table, columns, batches)
+        else:
+            written = self._insert(table, columns, batches)
+        elapsed = perf_counter() - started
+        self.log(f"{table}: {written} rows in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} rows/s)")
+        return written
+
+    def _insert(self, table, columns, batches):
+        cursor = self.connection.cursor()
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        written = 0
+        try:
+            for rows in batches:
+                # mysql.connector turns executemany() of an INSERT into one multi-row statement
+                cursor.executemany(sql, rows)
+                self.connection.commit()
+                written += len(rows)
+        finally:
+            cursor.close()
+        return written
+
+    def _load(self, table, columns, batches):
+        cursor = self.connection.cursor()
+        written = 0
+        spool = None
+
+        def flush():
+            spool.close()
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+                CHARACTER SET utf8mb4 ({', '.join(columns)})
+            """, (spool.name,))
+            self.connection.commit()
+            os.unlink(spool.name)
+
+        try:
+            spooled = 0
+            for rows in batches:
+                if spool is None:
+                    spool = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False)
+                    spooled = 0
+                spool.write(''.join('\t'.join(_tsv_value(value) for value in row) + '\n' for row in rows))
+                spooled += len(rows)
+                written += len(rows)
+                if spooled >= self.file_rows:
+                    flush()
+                    spool = None
+            if spool is not None:
+                flush()
+                spool = None
+        finally:
+            if spool is not None:
+                spool.close()
+                os.unlink(spool.name)
+            cursor.close()
+        return written
+
+
+# ==================== GENERATORS ====================
+def _batched(count, batch_size):
+    # Sizes of the batches that make up count rows
+    while count > 0:
+        size = min(batch_size, count)
+        yield size
+        count -= size
+
+
+def _new_ids(connection, table, after):
+    # Ids of the rows inserted after id ``after``, in insertion order
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT id FROM {table} WHERE id > %s ORDER BY id", (after,))
+    ids = array('q', (row[0] for row in cursor.fetchall()))
+    cursor.close()
+    return ids
+
+
+def _max_id(connection, table):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    value = cursor.fetchone()[0]
+    cursor.close()
+    return int(value)
+
+
+def user_fields(n):
+    """(name, email, phone, address) of generated user number n; derived, not stored."""
+    first = FIRST_NAMES[n % len(FIRST_NAMES)]
+    last = LAST_NAMES[(n // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    city = CITIES[(n * 7) % len(CITIES)]
+    return (f"{first} {last}", f"{first}.{last}.{n}@example.com".lower(), f"01{n % 1000000000:09d}",
+            f"House {n % 200 + 1}, Road {n % 40 + 1}, {city}")
+
+
+def user_rows(count, first_number, times, batch_size):
+    for size in _batched(count, batch_size):
+        rows = []
+        for when in times.sample(size):
+            name, email, phone, address = user_fields(first_number)
+            rows.append((name, email, phone, 'password', address, 'user', when))
+            first_number += 1
+        yield rows
+
+
+def medicine_rows(count, rng, times, batch_size, names, prices, popularity, total_sales):
+    # Fills names/prices while yielding batches; the most popular medicines
+    # come first, and sold_quantity follows their share of total_sales
+    categories = list(CATEGORIES)
+    category_weights = _cumulative(CATEGORIES.values())
+    total_weight = popularity[-1] if popularity else 1
+    index = 0
+    for size in _batched(count, batch_size):
+        rows = []
+        for category, when in zip(rng.choices(categories, cum_weights=category_weights, k=size), times.sample(size)):
+            name = (f"{rng.choice(NAME_STEMS)}{rng.choice(NAME_SUFFIXES)} "
+                    f"{rng.choice(STRENGTHS)}mg {rng.choice(FORMS)}")
+            price = Decimal(str(round(min(max(rng.lognormvariate(4.5, 0.9), 5), 5000), 2)))
+            share = (popularity[index] - (popularity[index - 1] if index else 0)) / total_weight
+            stock = 0 if rng.random() < 0.03 else rng.randint(1, 10) if rng.random() < 0.07 else rng.randint(20, 2000)
+            rows.append((name, price, stock, int(total_sales * share), round(rng.uniform(2.5, 5), 1),
+                         f"{name} for {category.lower()}.", category, when))
+            names.append(name)
+            prices.append(price)
+            index += 1
+        yield rows
+
+
+def _order_lines(rng, times, user_ids, first_number, user_signups, medicine_ids, names, prices, chunk=4096):
+    # Endless stream of order line rows, one checkout after another; the
+    # random draws are made a chunk of checkouts at a time
+    users = range(len(user_ids))
+    user_weights = zipf_cumulative(len(user_ids), 0.8)
+    medicines = range(len(medicine_ids))
+    medicine_weights = zipf_cumulative(len(medicine_ids), 1.1)
+    line_counts = list(LINES_PER_CHECKOUT)
+    line_weights = _cumulative(LINES_PER_CHECKOUT.values())
+    payments = list(PAYMENT_METHODS)
+    payment_weights = _cumulative(PAYMENT_METHODS.values())
+    quantities = list(LINE_QUANTITIES)
+    quantity_weights = _cumulative(LINE_QUANTITIES.values())
+    end = times.end_stamp
+    random_ = rng.random
+    while True:
+        customers = rng.choices(users, cum_weights=user_weights, k=chunk)
+        stamps = times.sample_stamps(chunk)
+        lines = rng.choices(line_counts, cum_weights=line_weights, k=chunk)
+        methods = rng.choices(payments, cum_weights=payment_weights, k=chunk)
+        total = sum(lines)
+        picks = iter(rng.choices(medicines, cum_weights=medicine_weights, k=total))
+        amounts = iter(rng.choices(quantities, cum_weights=quantity_weights, k=total))
+        for customer, stamp, line_count, payment in zip(customers, stamps, lines, methods):
+            signup = user_signups[customer]
+            if stamp < signup:
+                # A customer cannot order before signing up
+                stamp = signup + (end - signup) * random_()
+            age = (end - stamp) / 86400
+            if random_() < 0.03:
+                status = 'Cancelled'
+            elif age < 1:
+                status = 'Pending'
+            elif age < 3:
+                status = 'Processing'
+            elif age < 5:
+                status = 'Out for Delivery'
+            else:
+                status = 'Delivered'
+            when = datetime.fromtimestamp(int(stamp))
+            name, email, phone, address = user_fields(first_number + customer)
+            for _ in range(line_count):
+                medicine = next(picks)
+                quantity = next(amounts)
+                yield (name, phone, email, address, names[medicine], medicine_ids[medicine], quantity,
+                       prices[medicine] * quantity, payment, '', status, when)
+
+
+def order_line_rows(count, rng, times, batch_size, user_ids, first_number, user_signups, medicine_ids, names,
+                    prices):
+    lines = _order_lines(rng, times, user_ids, first_number, user_signups, medicine_ids, names, prices)
+    for size in _batched(count, batch_size):
+        yield list(islice(lines, size))
+
+
+def review_rows(count, rng, times, batch_size, user_ids, medicine_ids):
+    user_weights = zipf_cumulative(len(user_ids), 0.8)
+    medicine_weights = zipf_cumulative(len(medicine_ids), 1.1)
+    ratings = list(REVIEW_RATINGS)
+    rating_weights = _cumulative(REVIEW_RATINGS.values())
+    for size in _batched(count, batch_size):
+        yield list(zip(
+            rng.choices(user_ids, cum_weights=user_weights, k=size),
+            rng.choices(medicine_ids, cum_weights=medicine_weights, k=size),
+            rng.choices(ratings, cum_weights=rating_weights, k=size),
+            (rng.choice(REVIEW_QUOTES) for _ in range(size)),
+            times.sample(size),
+        ))
+
+
+def cart_rows(count, rng, times, batch_size, user_ids, medicine_ids):
+    user_weights = zipf_cumulative(len(user_ids), 0.8)
+    medicine_weights = zipf_cumulative(len(medicine_ids), 1.1)
+    for size in _batched(count, batch_size):
+        yield list(zip(
+            rng.choices(user_ids, cum_weights=user_weights, k=size),
+            rng.choices(medicine_ids, cum_weights=medicine_weights, k=size),
+            (rng.randint(1, 3) for _ in range(size)),
+            times.sample(size),
+        ))
+
+
+def prescription_rows(count, rng, times, batch_size, user_ids, first_number):
+    users = range(len(user_ids))
+    statuses = list(PRESCRIPTION_STATUSES)
+    status_weights = _cumulative(PRESCRIPTION_STATUSES.values())
+    for size in _batched(count, batch_size):
+        rows = []
+        for customer, status, when in zip(rng.choices(users, k=size),
+                                          rng.choices(statuses, cum_weights=status_weights, k=size),
+                                          times.sample(size)):
+            name, email, phone, address = user_fields(first_number + customer)
+            rows.append((user_ids[customer], name, rng.randint(1, 90), phone, email, address,
+                         f"static/prescriptions/generated_{customer}.jpg", '', status, when))
+        yield rows
+
+
+# ==================== DRIVER ====================
+def generate_data(connection, scale=1.0, counts=None, days=730, batch_size=5000, seed=1,
+                  load_data=False, log=print):
+    """Generate FULL_SCALE * scale rows per table (``counts`` overrides single tables).
+
+    New users and medicines are added next to existing rows; order lines,
+    reviews, carts and prescriptions only reference the generated ones.
+    Returns {table: rows written}.
+    """
+    counts = {**{table: int(total * scale) for table, total in FULL_SCALE.items()}, **(counts or {})}
+    rng = random.Random(seed)
+    end = datetime.now().replace(microsecond=0)
+    times = TimeSampler(rng, end, days)
+    writer = BulkWriter(connection, load_data=load_data, log=log)
+    written = {}
+
+    mysql_session = dialect_of(connection) != SQLITE
+    if mysql_session:
+        # Skip per-row constraint checks for the bulk load; every reference is generated valid
+        cursor = connection.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        cursor.close()
+    try:
+        # Users: signup times are kept to keep orders after signups
+        first_user = _max_id(connection, 'users')
+        written['users'] = writer.write(
+            'users', ('name', 'email', 'phone', 'password', 'address', 'role', 'created_at'),
+            user_rows(counts['users'], first_user + 1, times, batch_size))
+        user_ids = _new_ids(connection, 'users', first_user)
+        cursor = connection.cursor()
+        cursor.execute("SELECT created_at FROM users WHERE id > %s ORDER BY id", (first_user,))
+        user_signups = array('d', (row[0].timestamp() for row in cursor.fetchall()))
+        cursor.close()
+
+        first_medicine = _max_id(connection, 'medicines')
+        names, prices = [], []
+        popularity = zipf_cumulative(counts['medicines'], 1.1)
+        written['medicines'] = writer.write(
+            'medicines', ('name', 'price', 'stock_quantity', 'sold_quantity', 'ratings', 'details', 'category',
+                          'created_at'),
+            medicine_rows(counts['medicines'], rng, times, batch_size, names, prices, popularity,
+                          counts['order_lines'] * 1.6))
+        medicine_ids = _new_ids(connection, 'medicines', first_medicine)
+
+        if not user_ids or not medicine_ids:
+            log("No users or medicines generated; skipping orders, reviews, carts and prescriptions.")
+            return written
+
+        # Order lines and prescriptions carry the customer's details by user number
+        written['all_orders'] = writer.write(
+            'all_orders', ('ordered_by', 'phone', 'email', 'address', 'product', 'medicine_id', 'quantity', 'price',
+                           'payment_method', 'special_instruction', 'status', 'created_at'),
+            order_line_rows(counts['order_lines'], rng, times, batch_size, user_ids, first_user + 1, user_signups,
+                            medicine_ids, names, prices))
+        written['reviews'] = writer.write(
+            'reviews', ('user_id', 'medicine_id', 'ratings', 'quote', 'review_date'),
+            review_rows(counts['reviews'], rng, times, batch_size, user_ids, medicine_ids))
+        written['cart'] = writer.write(
+            'cart', ('user_id', 'medicine_id', 'quantity', 'created_at'),
+            cart_rows(counts['carts'], rng, times, batch_size, user_ids, medicine_ids))
+        written['prescriptions'] = writer.write(
+            'prescriptions', ('user_id', 'patient_name', 'patient_age', 'patient_phone', 'patient_email',
+                              'patient_address', 'image_path', 'special_instructions', 'status', 'created_at'),
+            prescription_rows(counts['prescriptions'], rng, times, batch_size, user_ids, first_user + 1))
+        return written
+    finally:
+        if mysql_session:
+            cursor = connection.cursor()
+            cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+            cursor.close()
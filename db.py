@@ -0,0 +1,175 @@
+# ==================== DATABASE CONNECTION POOL ====================
+# A small thread-safe connection pool used by app.py.  Connections handed
+# out by the pool look like ordinary driver connections, except that
+# close() returns them to the pool instead of tearing down the socket.
+import threading
+from collections import deque
+from time import time, monotonic
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class PooledConnection:
+    """Proxy around a raw driver connection checked out from a ConnectionPool."""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def close(self):
+        # Hand the connection back instead of closing it; safe to call twice
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self._created_at)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"connection already returned to pool ({name})")
+        return getattr(self._raw, name)
+
+    def __del__(self):
+        # Routes that return early without closing must not leak pool slots
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Fixed-size pool with overflow, health checks and stale-connection recycling.
+
+    ``connect`` is a zero-argument factory returning a new raw connection.
+    Up to ``size`` idle connections are kept; up to ``max_overflow`` extra
+    connections may be opened under load and are closed when returned.
+    Connections older than ``recycle`` seconds are replaced on checkout,
+    and when ``pre_ping`` is set each checkout is verified with ``ping``.
+    """
+
+    def __init__(self, connect, size=10, max_overflow=5, timeout=30, recycle=3600,
+                 pre_ping=True, ping=None):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._ping = ping or (lambda raw: raw.ping(reconnect=False))
+
+        self._idle = deque()
+        self._open = 0
+        self._checked_out = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._counters = {
+            'created': 0,
+            'checkouts': 0,
+            'recycled': 0,
+            'invalidated': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    # ---------- checkout / release ----------
+    def connection(self):
+        deadline = monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    raw = None
+                    break
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"connection pool exhausted ({self._open} open, timeout {self.timeout}s)")
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+
+        try:
+            if raw is not None:
+                raw, created_at = self._validate(raw, created_at)
+            if raw is None:
+                raw, created_at = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._checked_out += 1
+            self._counters['checkouts'] += 1
+        return PooledConnection(self, raw, created_at)
+
+    def _new_connection(self):
+        raw = self._connect()
+        with self._cond:
+            self._counters['created'] += 1
+        return raw, time()
+
+    def _validate(self, raw, created_at):
+        # Returns (None, None) when the idle connection must be replaced
+        if self.recycle is not None and time() - created_at > self.recycle:
+            self._discard(raw)
+            with self._cond:
+                self._counters['recycled'] += 1
+            return None, None
+        if self.pre_ping:
+            try:
+                self._ping(raw)
+            except Exception:
+                self._discard(raw)
+                with self._cond:
+                    self._counters['invalidated'] += 1
+                return None, None
+        return raw, created_at
+
+    def _release(self, raw, created_at):
+        healthy = True
+        try:
+            # Never hand the next request someone else's open transaction
+            if getattr(raw, 'in_transaction', False):
+                raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._checked_out -= 1
+            keep = healthy and len(self._idle) < self.size
+            if keep:
+                self._idle.append((raw, created_at))
+            else:
+                self._open -= 1
+                if not healthy:
+                    self._counters['invalidated'] += 1
+            self._cond.notify()
+        if not keep:
+            self._discard(raw)
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    # ---------- maintenance ----------
+    def stats(self):
+        with self._cond:
+            data = {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'overflow': max(0, self._open - self.size),
+            }
+            data.update(self._counters)
+        return data
@@ -0,0 +1,240 @@
+# ==================== REPORT EXPORTS ====================
+# Admin exports are streamed: rows are read from an unbuffered
+# (server-side) cursor a chunk at a time and written straight to the
+# response, so memory stays flat and the download starts at once no
+# matter how large the table is. Besides plain CSV, reports can be
+# downloaded as gzipped CSV, JSON Lines or Parquet, with date, status
+# and column filters pushed down into the SQL.
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Parquet support is optional
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# report type -> table, sort order, filterable columns and
+# (column, CSV header) pairs
+EXPORT_REPORTS = {
+    'sales': {
+        'table': 'all_orders',
+        'order_by': 'created_at DESC',
+        'date_column': 'created_at',
+        'status_column': 'status',
+        'columns': [
+            ('id', 'Order ID'), ('ordered_by', 'Customer'), ('phone', 'Phone'), ('email', 'Email'),
+            ('product', 'Product'), ('quantity', 'Quantity'), ('price', 'Price'),
+            ('payment_method', 'Payment Method'), ('status', 'Status'), ('created_at', 'Date'),
+        ],
+    },
+    'users': {
+        'table': 'users',
+        'order_by': 'created_at DESC',
+        'date_column': 'created_at',
+        'status_column': None,
+        'columns': [
+            ('id', 'User ID'), ('name', 'Name'), ('email', 'Email'), ('phone', 'Phone'),
+            ('address', 'Address'), ('role', 'Role'), ('created_at', 'Registration Date'),
+        ],
+    },
+    'medicines': {
+        'table': 'medicines',
+        'order_by': 'name ASC',
+        'date_column': None,
+        'status_column': None,
+        'columns': [
+            ('id', 'Medicine ID'), ('name', 'Name'), ('price', 'Price'),
+            ('stock_quantity', 'Stock Quantity'), ('sold_quantity', 'Sold Quantity'),
+            ('ratings', 'Rating'), ('category', 'Category'), ('details', 'Details'),
+        ],
+    },
+}
+# The orders export is the same dump as the sales one
+EXPORT_REPORTS['orders'] = EXPORT_REPORTS['sales']
+
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parquet_available():
+    return pyarrow is not None
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ExportError(f"{name} must be a date like 2024-01-31")
+
+
+def export_query(report, columns=None, start=None, end=None, statuses=None):
+    """Build the SELECT for a report and return (sql, params, columns).
+
+    ``columns`` limits the output to a subset of the report's columns (in
+    the report's order). ``start``/``end`` are inclusive YYYY-MM-DD dates
+    applied as a half-open range on the date column so an index on it can
+    be used; ``statuses`` is a list of allowed status values. Filters a
+    report has no column for are ignored.
+    """
+    available = [column for column, _ in report['columns']]
+    if columns:
+        unknown = [column for column in columns if column not in available]
+        if unknown:
+            raise ExportError(f"Unknown columns: {', '.join(unknown)}")
+        columns = [column for column in available if column in columns]
+    else:
+        columns = available
+
+    conditions = []
+    params = []
+    date_column = report['date_column']
+    if date_column and start:
+        conditions.append(f"{date_column} >= %s")
+        params.append(_parse_date(start, 'start'))
+    if date_column and end:
+        conditions.append(f"{date_column} < %s")
+        params.append(_parse_date(end, 'end') + timedelta(days=1))
+    if report['status_column'] and statuses:
+        conditions.append(f"{report['status_column']} IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+
+    sql = f"SELECT {', '.join(columns)} FROM {report['table']}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {report['order_by']}"
+    return sql, params, columns
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def stream_csv(cursor, headers, chunk_rows=1000):
+    """Yield CSV text for the rows of an executed cursor, chunk by chunk.
+
+    The stream functions never close the cursor: a generator that is
+    never iterated (HEAD, early disconnect) would not run its cleanup.
+    Release it from the response instead (Response.call_on_close).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The header goes out before the first fetch so the download starts at once
+    writer.writerow(headers)
+    while True:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        for row in rows:
+            writer.writerow([_csv_value(value) for value in row])
+
+
+def stream_gzip(chunks, level=6):
+    # gzip-compress a stream of text chunks (wbits=31 writes the gzip header)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def stream_jsonl(cursor, columns, chunk_rows=1000):
+    """Yield one JSON object per row; decimals are written as strings."""
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=_json_value) + '\n' for row in rows)
+
+
+class _ChunkSink:
+    # Write-only file object that hands written bytes back in pieces;
+    # tell() keeps counting so the Parquet footer offsets stay correct
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_parquet(cursor, columns, chunk_rows=10000):
+    """Yield a Parquet file written one row group per chunk of rows.
+
+    Decimals are stored as float64. The schema is inferred from the
+    first chunk; columns that are entirely NULL there are typed as
+    strings.
+    """
+    if pyarrow is None:
+        raise ExportError("Parquet export needs the pyarrow package")
+    sink = _ChunkSink()
+    writer = None
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        data = {column: [] for column in columns}
+        for row in rows:
+            for column, value in zip(columns, row):
+                data[column].append(float(value) if isinstance(value, Decimal) else value)
+        if writer is None:
+            table = pyarrow.table(data)
+            schema = pyarrow.schema([
+                field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        writer.write_table(pyarrow.table(data, schema=schema))
+        yield sink.drain()
+    if writer is None:
+        writer = pyarrow.parquet.ParquetWriter(
+            sink, pyarrow.schema([(column, pyarrow.string()) for column in columns]))
+    writer.close()
+    yield sink.drain()
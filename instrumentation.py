@@ -0,0 +1,169 @@
+# ==================== QUERY INSTRUMENTATION ====================
+# Connections handed to routes are wrapped so every cursor they open is
+# timed. Per request we keep the number of statements, the time spent in
+# the database (execute plus fetch), the rows fetched and the slowest
+# statement; app.py turns them into Server-Timing headers. Statements
+# slower than the configured threshold are appended to a JSON-lines slow
+# query log together with a normalized fingerprint of the SQL, so the
+# same query with different parameters groups together.
+import json
+import re
+import threading
+from datetime import datetime
+from time import perf_counter
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"(VALUES\s*\(\?\))(?:\s*,\s*\(\?\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize SQL so statements that differ only in values compare equal.
+
+    Literals and %s placeholders become ?, IN lists and multi-row VALUES
+    collapse to a single (?) and whitespace is squeezed:
+    "SELECT * FROM t WHERE id IN (%s, %s) AND x = 'a'" ->
+    "SELECT * FROM t WHERE id IN (?) AND x = ?"
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?)', sql)
+    sql = _VALUES_LIST.sub(r'\1', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """Database work done while serving one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.duration = 0.0
+        self.slowest_sql = None
+        self.slowest_duration = 0.0
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.duration += duration
+        if duration > self.slowest_duration:
+            self.slowest_duration = duration
+            self.slowest_sql = sql
+
+    def record_fetch(self, rows, duration):
+        self.rows += rows
+        self.duration += duration
+
+    def server_timing(self):
+        # Value for the Server-Timing header (durations in milliseconds)
+        metrics = [f'db;dur={self.duration * 1000:.1f};desc="{self.queries} queries, {self.rows} rows"']
+        if self.slowest_sql is not None:
+            metrics.append(f'db-slowest;dur={self.slowest_duration * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+class SlowQueryLog:
+    """Appends statements slower than ``threshold_ms`` to ``path`` as JSON lines."""
+
+    def __init__(self, path, threshold_ms=200):
+        self.path = path
+        self.threshold = threshold_ms / 1000.0
+        self._lock = threading.Lock()
+
+    def record(self, sql, params, duration, rows=None, route=None):
+        if self.path is None or duration < self.threshold:
+            return
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'duration_ms': round(duration * 1000, 1),
+            'fingerprint': fingerprint(sql),
+            'sql': _WHITESPACE.sub(' ', sql if isinstance(sql, str) else sql.decode('utf-8', 'replace')).strip(),
+            'params': len(params) if params is not None else 0,
+            'rows': rows,
+            'route': route,
+        }
+        line = json.dumps(entry) + '\n'
+        try:
+            with self._lock:
+                with open(self.path, 'a', encoding='utf-8') as log:
+                    log.write(line)
+        except OSError as e:
+            print(f"Error writing slow query log: {e}")
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute/fetch calls into a QueryStats."""
+
+    def __init__(self, cursor, stats, slow_log=None, route=None):
+        self._cursor = cursor
+        self._stats = stats
+        self._slow_log = slow_log
+        self._route = route
+
+    def _timed(self, sql, params, call):
+        start = perf_counter()
+        try:
+            return call()
+        finally:
+            duration = perf_counter() - start
+            if self._stats is not None:
+                self._stats.record_query(sql, duration)
+            if self._slow_log is not None:
+                self._slow_log.record(sql, params, duration, self._cursor.rowcount, self._route)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        if params is None:
+            return self._timed(operation, params, lambda: self._cursor.execute(operation, *args, **kwargs))
+        return self._timed(operation, params,
+                           lambda: self._cursor.execute(operation, params, *args, **kwargs))
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        return self._timed(operation, seq_params,
+                           lambda: self._cursor.executemany(operation, seq_params, *args, **kwargs))
+
+    def _fetch(self, call, count):
+        start = perf_counter()
+        result = call()
+        if self._stats is not None:
+            self._stats.record_fetch(count(result), perf_counter() - start)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone, lambda row: 0 if row is None else 1)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch(lambda: self._cursor.fetchmany(*args, **kwargs), len)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall, len)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors report to ``stats`` and ``slow_log``."""
+
+    def __init__(self, connection, stats=None, slow_log=None, route=None):
+        self._connection = connection
+        self._stats = stats
+        self._slow_log = slow_log
+        self._route = route
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs),
+                                  self._stats, self._slow_log, self._route)
+
+    def close(self):
+        self._connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
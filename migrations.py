@@ -0,0 +1,415 @@
+# ==================== SCHEMA MIGRATIONS ====================
+# The database schema is owned by the numbered migrations below. Applied
+# versions are recorded in schema_migrations; apply_migrations() runs the
+# pending ones in order and diff_schema() compares the live database with
+# the tables, columns and indexes the code expects. MySQL commits
+# implicitly around DDL, so every migration is written to be idempotent:
+# a run that fails half way can simply be repeated. Every app process
+# migrates at startup, so runs are serialized: MySQL holds a named lock
+# for the whole run, SQLite takes the database write lock per migration,
+# and the applied versions are re-read under the lock. The same migrations
+# build a SQLite database (see backends.py), minus the FULLTEXT index.
+import re
+
+from backends import dialect_of, table_columns, table_indexes, SQLITE
+from order_store import ensure_order_medicine_link, ensure_time_indexes, TIME_INDEXES, \
+    ORDER_MEDICINE_INDEX
+from rollups import ROLLUP_TABLES, init_rollup_tables
+from uploads import UPLOAD_TABLES, init_upload_tables, ensure_upload_claims
+
+# Seconds to wait for another process's migration run on MySQL
+MIGRATION_LOCK_TIMEOUT = 300
+
+# Full-text index used by the medicine search
+MEDICINE_SEARCH_COLUMNS = 'name, category, details'
+MEDICINE_SEARCH_INDEX = 'ft_medicines_search'
+
+# Tables as first created; later columns are added by their own migration
+BASELINE_TABLES = {
+    'users': """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            phone VARCHAR(20),
+            password VARCHAR(255) NOT NULL,
+            address TEXT,
+            role VARCHAR(20) DEFAULT 'user',
+            image VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'medicines': """
+        CREATE TABLE IF NOT EXISTS medicines (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            stock_quantity INT NOT NULL DEFAULT 0,
+            sold_quantity INT NOT NULL DEFAULT 0,
+            ratings DECIMAL(3, 1) DEFAULT 0,
+            details TEXT,
+            category VARCHAR(100),
+            image VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'all_orders': """
+        CREATE TABLE IF NOT EXISTS all_orders (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            ordered_by VARCHAR(100),
+            phone VARCHAR(20),
+            email VARCHAR(100),
+            address TEXT,
+            product VARCHAR(255),
+            quantity INT NOT NULL DEFAULT 1,
+            price DECIMAL(10, 2) NOT NULL DEFAULT 0,
+            payment_method VARCHAR(50),
+            special_instruction TEXT,
+            status VARCHAR(50) DEFAULT 'Pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'cart': """
+        CREATE TABLE IF NOT EXISTS cart (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            medicine_id INT NOT NULL,
+            quantity INT NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'prescriptions': """
+        CREATE TABLE IF NOT EXISTS prescriptions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            patient_name VARCHAR(100),
+            patient_age INT,
+            patient_phone VARCHAR(20),
+            patient_email VARCHAR(100),
+            patient_address TEXT,
+            image_path VARCHAR(255),
+            special_instructions TEXT,
+            status VARCHAR(50) DEFAULT 'Pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'reviews': """
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            medicine_id INT,
+            ratings INT,
+            quote TEXT,
+            review_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'promo_codes': """
+        CREATE TABLE IF NOT EXISTS promo_codes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            code VARCHAR(50) NOT NULL UNIQUE,
+            discount_type VARCHAR(20) NOT NULL,
+            discount_value DECIMAL(10, 2) NOT NULL DEFAULT 0,
+            valid_from DATE,
+            valid_until DATE,
+            is_active BOOLEAN DEFAULT TRUE,
+            used_count INT NOT NULL DEFAULT 0,
+            max_uses INT NOT NULL DEFAULT 1
+        )
+    """,
+    'user_promo_codes': """
+        CREATE TABLE IF NOT EXISTS user_promo_codes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            promo_code_id INT NOT NULL,
+            used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'contact_messages': """
+        CREATE TABLE IF NOT EXISTS contact_messages (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100),
+            email VARCHAR(100),
+            phone VARCHAR(20),
+            subject VARCHAR(255),
+            message TEXT,
+            newsletter BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'newsletter_subscribers': """
+        CREATE TABLE IF NOT EXISTS newsletter_subscribers (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(100) NOT NULL UNIQUE,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'settings': """
+        CREATE TABLE IF NOT EXISTS settings (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            setting_key VARCHAR(100) NOT NULL UNIQUE,
+            setting_value TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+    'site_counters': """
+        CREATE TABLE IF NOT EXISTS site_counters (
+            counter_key VARCHAR(50) NOT NULL PRIMARY KEY,
+            counter_value BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+# Columns added after the baseline: table -> [column, ...]
+ADDED_COLUMNS = {
+    'all_orders': ['medicine_id'],
+    'uploads': ['claimed_at'],
+}
+
+# Secondary indexes on the hot query paths: name -> (table, columns)
+HOT_PATH_INDEXES = {
+    # Cart lookups and the "already in cart?" check
+    'idx_cart_user_medicine': ('cart', 'user_id, medicine_id'),
+    # Admin order lists filtered by status
+    'idx_all_orders_status_created_at': ('all_orders', 'status, created_at'),
+    # Category filters and best-seller lists
+    'idx_medicines_category': ('medicines', 'category'),
+    'idx_medicines_sold_quantity': ('medicines', 'sold_quantity'),
+    # A user's prescriptions, newest first
+    'idx_prescriptions_user_created_at': ('prescriptions', 'user_id, created_at'),
+    # Login and signup lookups
+    'idx_users_email': ('users', 'email'),
+}
+
+# Every index the code relies on: name -> (table, columns)
+EXPECTED_INDEXES = {
+    MEDICINE_SEARCH_INDEX: ('medicines', MEDICINE_SEARCH_COLUMNS),
+    ORDER_MEDICINE_INDEX: ('all_orders', 'medicine_id'),
+    **TIME_INDEXES,
+    **HOT_PATH_INDEXES,
+}
+
+
+class MigrationError(Exception):
+    pass
+
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    # Register apply(connection, cursor) as schema version ``version``
+    def register(apply):
+        MIGRATIONS.append((version, name, apply))
+        return apply
+    return register
+
+
+# ---------- introspection ----------
+def _split_columns(columns):
+    return tuple(column.strip() for column in columns.split(','))
+
+
+def live_indexes(cursor, table):
+    # {index name: (column, ...)} for one table
+    return table_indexes(cursor, table)
+
+
+def _index_satisfied(indexes, name, columns):
+    # An index counts when it has this name or starts with these columns
+    return name in indexes or any(existing[:len(columns)] == columns for existing in indexes.values())
+
+
+def ensure_index(cursor, table, name, columns, kind='INDEX'):
+    """Create an index unless an equivalent one already exists; returns True if created."""
+    if _index_satisfied(live_indexes(cursor, table), name, _split_columns(columns)):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD {kind} {name} ({columns})")
+    return True
+
+
+def declared_columns(ddl):
+    # Column names of a CREATE TABLE statement, skipping key definitions
+    body = ddl[ddl.index('(') + 1:ddl.rindex(')')]
+    columns = []
+    for line in body.split('\n'):
+        match = re.match(r'\s*(\w+)\s', line)
+        if match and match.group(1).upper() not in ('PRIMARY', 'KEY', 'UNIQUE', 'INDEX',
+                                                      'FULLTEXT', 'CONSTRAINT', 'FOREIGN'):
+            columns.append(match.group(1))
+    return columns
+
+
+def expected_indexes(cursor):
+    # EXPECTED_INDEXES minus the ones the connected database cannot have
+    if dialect_of(cursor) == SQLITE:
+        return {name: index for name, index in EXPECTED_INDEXES.items() if name != MEDICINE_SEARCH_INDEX}
+    return EXPECTED_INDEXES
+
+
+def expected_tables():
+    # table -> [column, ...] for every table the migrations create
+    ddls = {**BASELINE_TABLES, **ROLLUP_TABLES, **UPLOAD_TABLES}
+    tables = {table: declared_columns(ddl) for table, ddl in ddls.items()}
+    for table, columns in ADDED_COLUMNS.items():
+        tables[table].extend(columns)
+    return tables
+
+
+# ---------- migrations ----------
+@migration(1, 'baseline tables')
+def _baseline_tables(connection, cursor):
+    for ddl in BASELINE_TABLES.values():
+        cursor.execute(ddl)
+
+
+@migration(2, 'medicine full-text search index')
+def _medicine_search_index(connection, cursor):
+    # SQLite has no FULLTEXT indexes; the search falls back to LIKE there
+    if dialect_of(cursor) == SQLITE:
+        return
+    ensure_index(cursor, 'medicines', MEDICINE_SEARCH_INDEX, MEDICINE_SEARCH_COLUMNS, kind='FULLTEXT INDEX')
+
+
+@migration(3, 'order lines linked to medicines')
+def _order_medicine_link(connection, cursor):
+    ensure_order_medicine_link(connection, log=lambda message: None)
+
+
+@migration(4, 'created_at indexes')
+def _time_indexes(connection, cursor):
+    ensure_time_indexes(cursor)
+
+
+@migration(5, 'report rollup tables')
+def _rollup_tables(connection, cursor):
+    init_rollup_tables(cursor)
+
+
+@migration(6, 'hot path indexes')
+def _hot_path_indexes(connection, cursor):
+    for name, (table, columns) in HOT_PATH_INDEXES.items():
+        ensure_index(cursor, table, name, columns)
+
+
+@migration(7, 'upload processing table')
+def _upload_tables(connection, cursor):
+    init_upload_tables(cursor)
+
+
+@migration(8, 'upload claims')
+def _upload_claims(connection, cursor):
+    ensure_upload_claims(cursor)
+
+
+MIGRATIONS.sort()
+
+
+# ---------- runner ----------
+def _ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    _ensure_version_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor):
+    applied = applied_versions(cursor)
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+
+def _acquire_migration_lock(cursor, timeout):
+    # Named MySQL lock; held by the session, so it outlives the DDL commits
+    cursor.execute("SELECT GET_LOCK(CONCAT('schema_migrations.', DATABASE()), %s)", (timeout,))
+    if cursor.fetchone()[0] != 1:
+        raise MigrationError(f"timed out after {timeout}s waiting for another process to finish migrating")
+
+
+def _release_migration_lock(cursor):
+    cursor.execute("SELECT RELEASE_LOCK(CONCAT('schema_migrations.', DATABASE()))")
+    cursor.fetchone()
+
+
+def apply_migrations(connection, log=print, lock_timeout=MIGRATION_LOCK_TIMEOUT):
+    """Apply every pending migration in order; returns the versions applied.
+
+    Safe to call from several processes at once: only one applies a given
+    migration, the others find it recorded once they get the lock.
+    """
+    cursor = connection.cursor()
+    sqlite = dialect_of(cursor) == SQLITE
+    try:
+        if not sqlite:
+            _acquire_migration_lock(cursor, lock_timeout)
+        try:
+            done = []
+            for version, name, apply in MIGRATIONS:
+                if sqlite:
+                    # Held until the migration commits; waits up to the backend's busy timeout
+                    connection.commit()
+                    cursor.execute("BEGIN IMMEDIATE")
+                if version in applied_versions(cursor):
+                    connection.commit()
+                    continue
+                log(f"Applying migration {version}: {name}")
+                try:
+                    apply(connection, cursor)
+                    # IGNORE: a migration that commits part way (3) releases the
+                    # SQLite lock, so another process may have recorded it first
+                    cursor.execute("INSERT IGNORE INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                   (version, name))
+                    connection.commit()
+                except Exception as e:
+                    connection.rollback()
+                    raise MigrationError(f"migration {version} ({name}) failed: {e}") from e
+                done.append(version)
+            return done
+        finally:
+            if not sqlite:
+                _release_migration_lock(cursor)
+    finally:
+        cursor.close()
+
+
+def diff_schema(cursor):
+    """Compare the live database with what the migrations declare.
+
+    Returns {'pending': [(version, name)], 'missing_tables': [table],
+    'missing_columns': {table: [column]}, 'missing_indexes': [(name, table, columns)]};
+    every entry is empty when the database is up to date.
+    """
+    report = {'pending': pending_migrations(cursor), 'missing_tables': [],
+              'missing_columns': {}, 'missing_indexes': []}
+
+    live = table_columns(cursor)
+    for table, columns in expected_tables().items():
+        if table not in live:
+            report['missing_tables'].append(table)
+            continue
+        missing = [column for column in columns if column not in live[table]]
+        if missing:
+            report['missing_columns'][table] = missing
+
+    indexes = {}
+    for name, (table, columns) in expected_indexes(cursor).items():
+        if table in report['missing_tables']:
+            continue
+        if table not in indexes:
+            indexes[table] = live_indexes(cursor, table)
+        if not _index_satisfied(indexes[table], name, _split_columns(columns)):
+            report['missing_indexes'].append((name, table, columns))
+    return report
+
+
+def schema_is_current(report):
+    return not any(report.values())
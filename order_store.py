@@ -0,0 +1,498 @@
+# ==================== CANONICAL ORDER STORE ====================
+# all_orders is the only table order lines are written to. The legacy
+# orders and dborders tables, which used to receive a copy of every
+# write, are replaced by read-only views over all_orders so existing
+# reports and tools keep working. migrate_legacy_orders() performs that
+# switch once: it backfills anything missing from all_orders, checks that
+# the copies agree, keeps the old tables as *_legacy backups and then
+# creates the views.
+from datetime import date, datetime
+
+from backends import dialect_of, table_type, table_columns, table_indexes, SQLITE
+
+LEGACY_ORDER_TABLES = ('orders', 'dborders')
+
+# Columns compared between the copies; created_at is left out because the
+# three inserts of one order could land on different seconds
+ORDER_COMPARE_COLUMNS = (
+    'ordered_by', 'phone', 'email', 'address', 'product', 'quantity',
+    'price', 'payment_method', 'special_instruction', 'status'
+)
+
+
+class OrderMigrationError(Exception):
+    pass
+
+
+class OrderWriteError(Exception):
+    pass
+
+
+def _checksum(cursor, table):
+    columns = ', '.join(f"COALESCE({column}, '')" for column in ORDER_COMPARE_COLUMNS)
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS('|', id, {columns}))), 0)
+        FROM {table}
+    """)
+    count, checksum = cursor.fetchone()
+    return int(count), int(checksum)
+
+
+def find_mismatches(cursor, legacy_table, limit=20):
+    # Ids present in both tables whose contents differ
+    differs = ' OR '.join(f"NOT (a.{column} <=> l.{column})" for column in ORDER_COMPARE_COLUMNS)
+    cursor.execute(f"""
+        SELECT l.id FROM {legacy_table} l
+        JOIN all_orders a ON a.id = l.id
+        WHERE {differs}
+        LIMIT %s
+    """, (limit,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def verify_order_store(cursor):
+    """Compare every legacy table/view with all_orders.
+
+    Returns {table: {'type', 'count', 'checksum', 'matches'}} where
+    'matches' is True when the legacy copy holds exactly the rows of
+    all_orders (ignoring created_at).
+    """
+    reference = _checksum(cursor, 'all_orders')
+    report = {'all_orders': {'type': 'BASE TABLE', 'count': reference[0],
+                             'checksum': reference[1], 'matches': True}}
+    for table in LEGACY_ORDER_TABLES:
+        kind = table_type(cursor, table)
+        if kind is None:
+            report[table] = {'type': None, 'count': 0, 'checksum': 0, 'matches': False}
+            continue
+        count, checksum = _checksum(cursor, table)
+        report[table] = {'type': kind, 'count': count, 'checksum': checksum,
+                         'matches': (count, checksum) == reference}
+    return report
+
+
+def migrate_legacy_orders(connection, force=False, log=print):
+    """Replace the orders/dborders tables with views over all_orders.
+
+    Rows that exist only in a legacy table are copied into all_orders
+    (keeping their id). Rows with the same id but different contents
+    abort the migration unless ``force`` is set, in which case the
+    all_orders version wins. MySQL commits implicitly around the DDL
+    statements, so every step is written to be idempotent: a failed run
+    can simply be run again.
+    """
+    cursor = connection.cursor()
+    try:
+        legacy = [t for t in LEGACY_ORDER_TABLES if table_type(cursor, t) == 'BASE TABLE']
+        if not legacy:
+            log("orders and dborders are already views over all_orders.")
+        for table in legacy:
+            mismatches = find_mismatches(cursor, table)
+            if mismatches and not force:
+                raise OrderMigrationError(
+                    f"{table} disagrees with all_orders for ids {mismatches}; "
+                    f"rerun with --force to keep the all_orders version")
+
+            # Backfill rows that never made it into all_orders
+            columns = ['id', *ORDER_COMPARE_COLUMNS, 'created_at']
+            cursor.execute(f"""
+                INSERT INTO all_orders ({', '.join(columns)})
+                SELECT {', '.join('l.' + column for column in columns)}
+                FROM {table} l
+                LEFT JOIN all_orders a ON a.id = l.id
+                WHERE a.id IS NULL
+            """)
+            log(f"{table}: backfilled {cursor.rowcount} rows into all_orders")
+
+            # Every legacy row must now be represented in all_orders
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM {table} l
+                LEFT JOIN all_orders a ON a.id = l.id
+                WHERE a.id IS NULL
+            """)
+            missing = cursor.fetchone()[0]
+            if missing:
+                raise OrderMigrationError(f"{missing} rows of {table} are still missing from all_orders")
+
+            cursor.execute(f"RENAME TABLE {table} TO {table}_legacy")
+            log(f"{table}: kept the old table as {table}_legacy")
+
+        for table in LEGACY_ORDER_TABLES:
+            cursor.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM all_orders")
+        connection.commit()
+
+        report = verify_order_store(cursor)
+        for table, result in report.items():
+            log(f"{table}: {result['type']}, {result['count']} rows, "
+                f"{'OK' if result['matches'] else 'MISMATCH'}")
+        if not all(result['matches'] for result in report.values()):
+            raise OrderMigrationError("verification failed after migration")
+        return report
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# ==================== ORDER LINE -> MEDICINE LINK ====================
+# Order lines used to identify the medicine only by its name in product.
+# all_orders.medicine_id is an indexed foreign key to medicines.id so
+# reorders and joins are integer probes; product stays as the name the
+# customer saw at checkout.
+ORDER_MEDICINE_FK = 'fk_all_orders_medicine'
+ORDER_MEDICINE_INDEX = 'idx_all_orders_medicine_id'
+
+
+def _has_column(cursor, table, column):
+    return column in table_columns(cursor).get(table, ())
+
+
+def backfill_order_medicine_ids(cursor):
+    # Resolve names for lines that have no medicine_id yet; when several
+    # medicines share a name the oldest one wins. Returns the rows updated.
+    if dialect_of(cursor) == SQLITE:
+        cursor.execute("""
+            UPDATE all_orders
+            SET medicine_id = m.id
+            FROM (SELECT name, MIN(id) AS id FROM medicines GROUP BY name) m
+            WHERE m.name = all_orders.product AND all_orders.medicine_id IS NULL
+        """)
+        return cursor.rowcount
+    cursor.execute("""
+        UPDATE all_orders o
+        JOIN (SELECT name, MIN(id) AS id FROM medicines GROUP BY name) m ON m.name = o.product
+        SET o.medicine_id = m.id
+        WHERE o.medicine_id IS NULL
+    """)
+    return cursor.rowcount
+
+
+def ensure_order_medicine_link(connection, log=print):
+    """Add all_orders.medicine_id with its index and foreign key, then backfill.
+
+    Safe to run on every start: the column is only added once. History
+    is backfilled from product names when the column is first created;
+    later runs only fill lines that are still unlinked.
+    """
+    cursor = connection.cursor()
+    try:
+        if not _has_column(cursor, 'all_orders', 'medicine_id'):
+            if dialect_of(cursor) == SQLITE:
+                # SQLite adds the column and its foreign key in one step;
+                # its views expand SELECT * when queried
+                cursor.execute("""
+                    ALTER TABLE all_orders
+                    ADD COLUMN medicine_id INTEGER REFERENCES medicines (id) ON DELETE SET NULL
+                """)
+                cursor.execute(f"CREATE INDEX {ORDER_MEDICINE_INDEX} ON all_orders (medicine_id)")
+                log("all_orders: added medicine_id")
+            else:
+                # Match medicines.id exactly, as the foreign key requires
+                cursor.execute("""
+                    SELECT COLUMN_TYPE FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'medicines' AND COLUMN_NAME = 'id'
+                """)
+                id_type = cursor.fetchone()[0]
+                cursor.execute(f"""
+                    ALTER TABLE all_orders
+                    ADD COLUMN medicine_id {id_type} NULL AFTER product,
+                    ADD INDEX {ORDER_MEDICINE_INDEX} (medicine_id),
+                    ADD CONSTRAINT {ORDER_MEDICINE_FK} FOREIGN KEY (medicine_id)
+                        REFERENCES medicines (id) ON DELETE SET NULL
+                """)
+                log("all_orders: added medicine_id")
+
+                # Views keep the column list they were created with
+                for table in LEGACY_ORDER_TABLES:
+                    if table_type(cursor, table) == 'VIEW':
+                        cursor.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM all_orders")
+
+        updated = backfill_order_medicine_ids(cursor)
+        connection.commit()
+        if updated:
+            log(f"all_orders: linked {updated} order lines to medicines")
+        return updated
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# ==================== BULK ORDER WRITER ====================
+# Columns written for every order line, in the order insert_order_lines
+# expects the values of each row
+ORDER_LINE_COLUMNS = (
+    'ordered_by', 'phone', 'email', 'address', 'product', 'medicine_id',
+    'quantity', 'price', 'payment_method', 'special_instruction', 'status'
+)
+
+
+def insert_order_lines(connection, rows):
+    """Write every line of a checkout to all_orders in one statement.
+
+    ``rows`` is a list of value tuples matching ORDER_LINE_COLUMNS.
+    executemany() sends them as a single multi-row INSERT, so a cart
+    costs the same number of round trips whatever its size. The ids are
+    read back rather than derived from lastrowid: with
+    innodb_autoinc_lock_mode=2 a multi-row INSERT may get non-consecutive
+    values. Returns the ids in the order of ``rows``; raises
+    OrderWriteError if they cannot be matched to the rows.
+    """
+    if not rows:
+        return []
+    insert = f"""
+        INSERT INTO all_orders ({', '.join(ORDER_LINE_COLUMNS)})
+        VALUES ({', '.join(['%s'] * len(ORDER_LINE_COLUMNS))})
+    """
+    cursor = connection.cursor()
+    try:
+        if dialect_of(cursor) == SQLITE:
+            # sqlite3 does not report lastrowid for executemany(); its
+            # inserts are in-process calls, so one per row costs no round trips
+            ids = []
+            for row in rows:
+                cursor.execute(insert, row)
+                ids.append(cursor.lastrowid)
+            return ids
+        cursor.executemany(insert, rows)
+        if cursor.rowcount != len(rows):
+            raise OrderWriteError(f"inserted {cursor.rowcount} of {len(rows)} order lines")
+        first_id = cursor.lastrowid
+        if len(rows) == 1:
+            return [first_id]
+        # lastrowid is the first id of a multi-row INSERT and the statement
+        # numbers its rows in order; other checkouts may interleave, so keep
+        # only this customer's rows and check them against ours
+        ordered_by, email, address = rows[0][0], rows[0][2], rows[0][3]
+        cursor.execute("""
+            SELECT id, product, quantity FROM all_orders
+            WHERE id >= %s AND ordered_by <=> %s AND email <=> %s AND address <=> %s
+            ORDER BY id
+            LIMIT %s
+        """, (first_id, ordered_by, email, address, len(rows)))
+        found = cursor.fetchall()
+        if [(product, quantity) for _, product, quantity in found] != [(row[4], row[6]) for row in rows]:
+            raise OrderWriteError("could not read back the ids of the inserted order lines")
+        return [row[0] for row in found]
+    finally:
+        cursor.close()
+
+
+# ==================== INVENTORY COMMIT ====================
+def commit_inventory(connection, lines):
+    """Take stock for a whole checkout in the caller's transaction.
+
+    ``lines`` is an iterable of (medicine_id, quantity). Quantities for the
+    same medicine are added up. The affected rows are locked with one
+    SELECT ... FOR UPDATE and decremented with one guarded UPDATE, so a
+    checkout costs two round trips whatever its size and concurrent
+    checkouts can neither lose updates nor oversell.
+
+    Returns a list of failed lines as dicts with 'medicine_id',
+    'requested' and 'available' (None when the medicine does not exist).
+    When the list is non-empty nothing was changed and the caller should
+    roll back.
+    """
+    wanted = {}
+    for medicine_id, quantity in lines:
+        medicine_id, quantity = int(medicine_id), int(quantity)
+        if quantity > 0:
+            wanted[medicine_id] = wanted.get(medicine_id, 0) + quantity
+    if not wanted:
+        return []
+
+    ids = sorted(wanted)
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor = connection.cursor()
+    try:
+        # Lock in primary key order so concurrent checkouts cannot deadlock
+        cursor.execute(f"""
+            SELECT id, stock_quantity FROM medicines
+            WHERE id IN ({placeholders})
+            ORDER BY id
+            FOR UPDATE
+        """, ids)
+        available = {row[0]: row[1] for row in cursor.fetchall()}
+
+        failed = [
+            {'medicine_id': medicine_id, 'requested': quantity, 'available': available.get(medicine_id)}
+            for medicine_id, quantity in wanted.items()
+            if available.get(medicine_id) is None or available[medicine_id] < quantity
+        ]
+        if failed:
+            return failed
+
+        case = ' '.join(['WHEN %s THEN %s'] * len(ids))
+        case_params = [value for medicine_id in ids for value in (medicine_id, wanted[medicine_id])]
+        cursor.execute(f"""
+            UPDATE medicines
+            SET stock_quantity = stock_quantity - CASE id {case} END,
+                sold_quantity = sold_quantity + CASE id {case} END
+            WHERE id IN ({placeholders})
+              AND stock_quantity >= CASE id {case} END
+        """, case_params * 2 + ids + case_params)
+
+        # The rows are locked, so this only trips if the guard itself failed
+        if cursor.rowcount != len(ids):
+            return [{'medicine_id': medicine_id, 'requested': quantity, 'available': available[medicine_id]}
+                    for medicine_id, quantity in wanted.items()]
+        return []
+    finally:
+        cursor.close()
+
+
+# ==================== TIME-RANGE INDEXES AND PARTITIONING ====================
+# Time-bounded queries filter with half-open ranges on created_at
+# (created_at >= start AND created_at < end) so these indexes serve them.
+# all_orders can additionally be RANGE-partitioned by month, letting such
+# queries prune to the months they touch. Partitioning is optional: MySQL
+# requires created_at in the primary key and does not allow foreign keys
+# on partitioned tables, so partition_orders_by_month() drops the
+# medicine_id foreign key (its index stays).
+TIME_INDEXES = {
+    'idx_all_orders_created_at': ('all_orders', 'created_at'),
+    'idx_users_created_at': ('users', 'created_at'),
+    # A customer's order history, newest first
+    'idx_all_orders_email_created_at': ('all_orders', 'email, created_at'),
+}
+OVERFLOW_PARTITION = 'pmax'
+
+
+def _has_index(cursor, table, index):
+    return index in table_indexes(cursor, table)
+
+
+def ensure_time_indexes(cursor):
+    # Returns the names of the indexes that had to be created
+    created = []
+    for index, (table, columns) in TIME_INDEXES.items():
+        if not _has_index(cursor, table, index):
+            cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} ({columns})")
+            created.append(index)
+    return created
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def order_partitions(cursor):
+    # Names of the all_orders partitions in order; empty when not partitioned
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'all_orders' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _partition_clause(column_type, month):
+    # "PARTITION pYYYYMM VALUES LESS THAN (...)" holding the rows of month
+    bound = _next_month(month).strftime('%Y-%m-%d')
+    if column_type == 'timestamp':
+        limit = f"(UNIX_TIMESTAMP('{bound} 00:00:00'))"
+    else:
+        limit = f"('{bound}')"
+    return f"PARTITION p{month.strftime('%Y%m')} VALUES LESS THAN {limit}"
+
+
+def _overflow_clause(column_type):
+    limit = 'MAXVALUE' if column_type == 'timestamp' else '(MAXVALUE)'
+    return f"PARTITION {OVERFLOW_PARTITION} VALUES LESS THAN {limit}"
+
+
+def _created_at_type(cursor):
+    cursor.execute("""
+        SELECT DATA_TYPE, COLUMN_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'all_orders' AND COLUMN_NAME = 'created_at'
+    """)
+    data_type, column_type = cursor.fetchone()
+    return data_type.lower(), column_type
+
+
+def partition_orders_by_month(connection, months_ahead=3, log=print):
+    """Partition all_orders by month of created_at, then add future months.
+
+    The first run rebuilds the table: it makes created_at NOT NULL, moves
+    it into the primary key, drops the medicine_id foreign key and creates
+    one partition per month from the oldest order up to ``months_ahead``
+    months from now, plus an overflow partition. Later runs (schedule
+    them monthly) only split new months off the overflow partition.
+    Returns the names of the partitions added.
+    """
+    cursor = connection.cursor()
+    try:
+        if dialect_of(cursor) == SQLITE:
+            log("all_orders: SQLite does not support partitioning; the created_at index serves time ranges")
+            return []
+        data_type, column_type = _created_at_type(cursor)
+        last_month = _month_start(date.today())
+        for _ in range(months_ahead):
+            last_month = _next_month(last_month)
+
+        existing = order_partitions(cursor)
+        if not existing:
+            cursor.execute("SELECT MIN(created_at) FROM all_orders")
+            oldest = cursor.fetchone()[0]
+            month = _month_start(oldest) if oldest else _month_start(date.today())
+            months = []
+            while month <= last_month:
+                months.append(month)
+                month = _next_month(month)
+
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.TABLE_CONSTRAINTS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'all_orders'
+                  AND CONSTRAINT_NAME = %s AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+            """, (ORDER_MEDICINE_FK,))
+            if cursor.fetchone()[0]:
+                cursor.execute(f"ALTER TABLE all_orders DROP FOREIGN KEY {ORDER_MEDICINE_FK}")
+                log(f"all_orders: dropped foreign key {ORDER_MEDICINE_FK} (kept its index)")
+
+            cursor.execute(f"""
+                ALTER TABLE all_orders
+                MODIFY created_at {column_type} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY (id, created_at)
+            """)
+            partitioning = ('RANGE (UNIX_TIMESTAMP(created_at))' if data_type == 'timestamp'
+                            else 'RANGE COLUMNS (created_at)')
+            clauses = [_partition_clause(data_type, month) for month in months]
+            cursor.execute(f"""
+                ALTER TABLE all_orders PARTITION BY {partitioning} (
+                    {', '.join(clauses + [_overflow_clause(data_type)])}
+                )
+            """)
+            added = [f"p{month.strftime('%Y%m')}" for month in months]
+            log(f"all_orders: partitioned into {len(added)} monthly partitions")
+            return added
+
+        # Split the months after the newest partition off the overflow partition
+        monthly = [name for name in existing if name != OVERFLOW_PARTITION]
+        if monthly:
+            newest = datetime.strptime(monthly[-1], 'p%Y%m').date()
+            month = _next_month(newest)
+        else:
+            month = _month_start(date.today())
+        months = []
+        while month <= last_month:
+            months.append(month)
+            month = _next_month(month)
+        if months:
+            clauses = [_partition_clause(data_type, month) for month in months]
+            cursor.execute(f"""
+                ALTER TABLE all_orders REORGANIZE PARTITION {OVERFLOW_PARTITION} INTO (
+                    {', '.join(clauses + [_overflow_clause(data_type)])}
+                )
+            """)
+        added = [f"p{month.strftime('%Y%m')}" for month in months]
+        log(f"all_orders: added partitions {', '.join(added)}" if added else "all_orders: partitions are up to date")
+        return added
+    finally:
+        cursor.close()
@@ -0,0 +1,154 @@
+# ==================== RECOMMENDATIONS ====================
+# Product suggestions served from memory. Random picks come from the
+# per-category pools kept by the catalog index, so a suggestion costs
+# O(k) instead of an ORDER BY RAND() sort of the whole medicines table.
+# "Frequently bought together" suggestions come from CoPurchaseEngine.
+import threading
+from time import monotonic
+
+
+class RecommendationService:
+    def __init__(self, catalog_index, co_purchase=None):
+        self.catalog_index = catalog_index
+        self.co_purchase = co_purchase
+
+    def bought_together(self, medicine_ids, k=4, exclude_ids=()):
+        # Rows of the medicines most often bought with medicine_ids
+        if self.co_purchase is None or not medicine_ids or not self.co_purchase.ensure_fresh():
+            return []
+        if not self.catalog_index.ensure_loaded():
+            return []
+        related = self.co_purchase.related(list(medicine_ids), k, exclude_ids)
+        return self.catalog_index.get_rows(related)
+
+    def for_medicine(self, medicine, k=4):
+        # Co-purchased items first, then the same-category/random mix from similar()
+        picks = self.bought_together([medicine['id']], k)
+        if len(picks) < k:
+            exclude = {medicine['id']} | {item['id'] for item in picks}
+            picks.extend(item for item in self.similar(medicine, k) if item['id'] not in exclude)
+        return picks[:k]
+
+    def similar(self, medicine, k=4):
+        # Same-category picks first, then random fill-ins from the whole catalog
+        if not self.catalog_index.ensure_loaded():
+            return []
+        exclude = {medicine['id']}
+        picks = []
+        if medicine.get('category'):
+            picks = self.catalog_index.sample(medicine['category'], k, exclude)
+        if len(picks) < k:
+            exclude.update(item['id'] for item in picks)
+            picks.extend(self.catalog_index.sample(None, k - len(picks), exclude))
+        return picks
+
+    def random_picks(self, k=6, exclude_ids=()):
+        if not self.catalog_index.ensure_loaded():
+            return []
+        return self.catalog_index.sample(None, k, exclude_ids)
+
+
+class CoPurchaseEngine:
+    """Sparse item-item co-occurrence counts mined from past checkouts.
+
+    ``loader`` yields baskets (lists of medicine ids bought together).
+    The full matrix is rebuilt from order history in the background every
+    ``ttl`` seconds; new orders are folded in with add_basket() so the
+    counts stay current between rebuilds. Top-N neighbour lists are cached per item and dropped
+    whenever that item's row of the matrix changes.
+    """
+
+    def __init__(self, loader, ttl=3600, max_basket=50, top_n=20):
+        self._loader = loader
+        self.ttl = ttl
+        self._built_at = 0
+        self.max_basket = max_basket
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._top = {}
+        self._rebuilding = False
+        self._pending = []
+        self.ready = False
+
+    def _add(self, counts, item_ids):
+        items = list(dict.fromkeys(item_ids))[:self.max_basket]
+        for a in items:
+            row = counts.get(a)
+            if row is None:
+                row = counts[a] = {}
+            for b in items:
+                if a != b:
+                    row[b] = row.get(b, 0) + 1
+        return items
+
+    def rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._pending = []
+        try:
+            baskets = self._loader()
+            if baskets is None:
+                return
+            counts = {}
+            for basket in baskets:
+                if len(basket) > 1:
+                    self._add(counts, basket)
+            with self._lock:
+                # Replay orders that were placed while history was loading
+                for basket in self._pending:
+                    self._add(counts, basket)
+                self._counts = counts
+                self._top = {}
+                self._built_at = monotonic()
+                self.ready = True
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._pending = []
+
+    def rebuild_async(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+        threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def ensure_fresh(self):
+        # Never blocks a request: stale or missing data is rebuilt in the background
+        if not self.ready or monotonic() - self._built_at > self.ttl:
+            self.rebuild_async()
+        return self.ready
+
+    def add_basket(self, item_ids):
+        item_ids = [int(item_id) for item_id in item_ids]
+        if len(item_ids) < 2:
+            return
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append(item_ids)
+            for item in self._add(self._counts, item_ids):
+                self._top.pop(item, None)
+
+    def _neighbours(self, item_id):
+        # Cached [(other_id, count), ...] sorted by count; caller holds the lock
+        top = self._top.get(item_id)
+        if top is None:
+            row = self._counts.get(item_id, {})
+            top = sorted(row.items(), key=lambda pair: (-pair[1], pair[0]))[:self.top_n]
+            self._top[item_id] = top
+        return top
+
+    def related(self, item_ids, k=4, exclude_ids=()):
+        # Items most often bought with any of item_ids, best first
+        exclude = set(exclude_ids) | set(item_ids)
+        with self._lock:
+            if len(item_ids) == 1:
+                return [other for other, _ in self._neighbours(item_ids[0]) if other not in exclude][:k]
+            scores = {}
+            for item_id in item_ids:
+                for other, count in self._neighbours(item_id):
+                    if other not in exclude:
+                        scores[other] = scores.get(other, 0) + count
+        return [other for other, _ in sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))[:k]]
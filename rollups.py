@@ -0,0 +1,168 @@
+# ==================== REPORT ROLLUPS ====================
+# Pre-aggregated tables behind the admin reports page. Every order and
+# user write folds its rows into the rollups inside the same transaction
+# (record_order_rollups / record_signup_rollups), so the charts read a
+# few hundred small rows instead of grouping all_orders and users on
+# every view. rebuild_rollups() re-derives everything from the source
+# tables and repairs any drift.
+from datetime import date
+
+ROLLUP_TABLES = {
+    # Orders placed per day
+    'sales_daily': """
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            day DATE NOT NULL PRIMARY KEY,
+            order_lines INT NOT NULL DEFAULT 0,
+            items_sold BIGINT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0
+        )
+    """,
+    # Orders per product per day
+    'product_sales_daily': """
+        CREATE TABLE IF NOT EXISTS product_sales_daily (
+            day DATE NOT NULL,
+            product VARCHAR(255) NOT NULL,
+            items_sold BIGINT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product)
+        )
+    """,
+    # All-time totals per product, for the top-sellers chart
+    'product_sales_total': """
+        CREATE TABLE IF NOT EXISTS product_sales_total (
+            product VARCHAR(255) NOT NULL PRIMARY KEY,
+            items_sold BIGINT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            KEY idx_product_sales_total_items (items_sold)
+        )
+    """,
+    # Registrations per day
+    'user_signups_daily': """
+        CREATE TABLE IF NOT EXISTS user_signups_daily (
+            day DATE NOT NULL PRIMARY KEY,
+            signups INT NOT NULL DEFAULT 0
+        )
+    """,
+}
+
+# table -> (key expressions, value expressions, value columns); the
+# expressions are evaluated over the source rows being folded in
+_ORDER_ROLLUPS = {
+    'sales_daily': (
+        ['DATE(created_at)'],
+        ['COUNT(*)', 'SUM(quantity)', 'SUM(price)'],
+        ['day', 'order_lines', 'items_sold', 'revenue'],
+    ),
+    'product_sales_daily': (
+        ['DATE(created_at)', "LEFT(COALESCE(product, ''), 255)"],
+        ['SUM(quantity)', 'SUM(price)'],
+        ['day', 'product', 'items_sold', 'revenue'],
+    ),
+    'product_sales_total': (
+        ["LEFT(COALESCE(product, ''), 255)"],
+        ['SUM(quantity)', 'SUM(price)'],
+        ['product', 'items_sold', 'revenue'],
+    ),
+}
+_SIGNUP_ROLLUP = (['DATE(created_at)'], ['COUNT(*)'], ['day', 'signups'])
+
+
+def _fold(cursor, table, rollup, source, where, params, sign):
+    # INSERT ... SELECT ... GROUP BY that adds sign * aggregates into table
+    keys, values, columns = rollup
+    value_columns = columns[len(keys):]
+    select = ', '.join(keys + [f"{sign} * {value}" for value in values])
+    updates = ', '.join(f"{column} = {column} + VALUES({column})" for column in value_columns)
+    cursor.execute(f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        SELECT {select} FROM {source}
+        WHERE {where}
+        GROUP BY {', '.join(keys)}
+        ON DUPLICATE KEY UPDATE {updates}
+    """, params)
+
+
+def record_order_rollups(cursor, order_ids, sign=1):
+    """Add (sign=1) or remove (sign=-1) all_orders rows from the rollups.
+
+    Call with sign=1 after inserting or updating the rows and with
+    sign=-1 before deleting or updating them, in the same transaction.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    where = f"id IN ({', '.join(['%s'] * len(order_ids))}) AND created_at IS NOT NULL"
+    for table, rollup in _ORDER_ROLLUPS.items():
+        _fold(cursor, table, rollup, 'all_orders', where, order_ids, int(sign))
+
+
+def record_signup_rollups(cursor, user_ids, sign=1):
+    # Same as record_order_rollups, for users rows
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    where = f"id IN ({', '.join(['%s'] * len(user_ids))}) AND created_at IS NOT NULL"
+    _fold(cursor, 'user_signups_daily', _SIGNUP_ROLLUP, 'users', where, user_ids, int(sign))
+
+
+def rebuild_rollups(cursor):
+    # Re-derive every rollup from all_orders and users
+    for table, rollup in _ORDER_ROLLUPS.items():
+        cursor.execute(f"DELETE FROM {table}")
+        _fold(cursor, table, rollup, 'all_orders', 'created_at IS NOT NULL', (), 1)
+    cursor.execute("DELETE FROM user_signups_daily")
+    _fold(cursor, 'user_signups_daily', _SIGNUP_ROLLUP, 'users', 'created_at IS NOT NULL', (), 1)
+
+
+def init_rollup_tables(cursor):
+    """Create the rollup tables; returns True when they were empty and got built."""
+    for ddl in ROLLUP_TABLES.values():
+        cursor.execute(ddl)
+    cursor.execute("SELECT EXISTS(SELECT 1 FROM sales_daily), EXISTS(SELECT 1 FROM user_signups_daily)")
+    if any(cursor.fetchone()):
+        return False
+    rebuild_rollups(cursor)
+    return True
+
+
+def _year_bounds(year):
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def monthly_sales(cursor, year):
+    # [{'month': 1..12, 'total': revenue}] for the months that had sales
+    cursor.execute("""
+        SELECT MONTH(day) AS month, SUM(revenue) AS total
+        FROM sales_daily
+        WHERE day >= %s AND day < %s
+        GROUP BY MONTH(day)
+        ORDER BY month
+    """, _year_bounds(year))
+    return cursor.fetchall()
+
+
+def monthly_signups(cursor, year):
+    cursor.execute("""
+        SELECT MONTH(day) AS month, SUM(signups) AS total
+        FROM user_signups_daily
+        WHERE day >= %s AND day < %s
+        GROUP BY MONTH(day)
+        ORDER BY month
+    """, _year_bounds(year))
+    return cursor.fetchall()
+
+
+def top_products(cursor, limit=5):
+    cursor.execute("""
+        SELECT product, items_sold AS total_sold
+        FROM product_sales_total
+        WHERE items_sold > 0
+        ORDER BY items_sold DESC
+        LIMIT %s
+    """, (limit,))
+    return cursor.fetchall()
+
+
+def total_revenue(cursor):
+    cursor.execute("SELECT COALESCE(SUM(revenue), 0) FROM sales_daily")
+    return cursor.fetchone()[0]
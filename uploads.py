@@ -0,0 +1,311 @@
+# ==================== UPLOAD PROCESSING ====================
+# Uploaded images and prescriptions are written to disk and fsynced inside
+# the request, and recorded in the uploads table as 'pending'; the request
+# then returns. A small thread pool picks each upload up once the request
+# has committed. It strips metadata (EXIF, PDF info), renders the first
+# page of PDFs, writes a thumbnail and a preview next to the original, and
+# records the derived paths. A worker claims the row ('processing') before
+# touching the file, so an upload is never processed twice at once, even
+# across app processes. Rows left pending by a restart, and claims older
+# than the claim timeout, are queued again when the pool starts or
+# processed by `flask process-uploads`.
+# Pillow is needed for any processing and PyMuPDF for PDFs; uploads they
+# cannot handle are kept as uploaded and marked 'skipped'.
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+from backends import table_columns
+
+UPLOAD_TABLES = {
+    # One row per stored upload; path is stored exactly as the owning row
+    # (users.image, medicines.image, prescriptions.image_path) stores it
+    'uploads': """
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            path VARCHAR(255) NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            thumbnail_path VARCHAR(255),
+            preview_path VARCHAR(255),
+            error VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP NULL,
+            UNIQUE KEY idx_uploads_path (path),
+            KEY idx_uploads_status (status)
+        )
+    """,
+}
+
+# Derived files are JPEGs written next to the original
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+PREVIEW_SUFFIX = '.preview.jpg'
+
+
+def init_upload_tables(cursor):
+    for ddl in UPLOAD_TABLES.values():
+        cursor.execute(ddl)
+
+
+def ensure_upload_claims(cursor):
+    # claimed_at came after the uploads table; add it where it is missing
+    if 'claimed_at' not in table_columns(cursor).get('uploads', set()):
+        cursor.execute("ALTER TABLE uploads ADD COLUMN claimed_at TIMESTAMP NULL")
+
+
+# ---------- saving ----------
+def _fsync_directory(folder):
+    # Makes the rename itself durable; not possible on every platform
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def save_upload(file, folder, filename):
+    """Write an uploaded file to ``folder`` and fsync it; returns its path on disk.
+
+    ``filename`` must already be safe (secure_filename). It is prefixed
+    with a timestamp and a random token so a later upload with the same
+    name never replaces a file that is still being processed.
+    """
+    path = os.path.join(folder, f"{int(time())}_{secrets.token_hex(4)}_{filename}")
+    partial = path + '.part'
+    with open(partial, 'wb') as out:
+        file.save(out)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(partial, path)
+    _fsync_directory(folder)
+    return path
+
+
+def upload_kind(path):
+    return 'pdf' if path.lower().endswith('.pdf') else 'image'
+
+
+def record_upload(cursor, path):
+    """Insert a pending uploads row for ``path``; returns its id."""
+    cursor.execute("INSERT INTO uploads (path, kind) VALUES (%s, %s)", (path, upload_kind(path)))
+    return cursor.lastrowid
+
+
+# ---------- processing ----------
+def derived_paths(path):
+    # (thumbnail, preview) for a stored upload path, in the same form
+    base = os.path.splitext(path)[0]
+    return base + THUMBNAIL_SUFFIX, base + PREVIEW_SUFFIX
+
+
+def _flatten(image):
+    # JPEG has no alpha: paint transparent images onto white
+    if image.mode in ('RGBA', 'LA', 'P', 'PA'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _save_derived(image, path, size):
+    image = _flatten(image)
+    image.thumbnail(size)
+    image.save(path, 'JPEG', quality=85, optimize=True)
+
+
+def _strip_image(file_path):
+    """Rotate per EXIF orientation and rewrite the image without metadata; returns it."""
+    with Image.open(file_path) as original:
+        image_format = original.format
+        animated = getattr(original, 'is_animated', False)
+        icc_profile = original.info.get('icc_profile')
+        image = ImageOps.exif_transpose(original)
+    if animated:
+        # Re-saving would keep only the first frame
+        return image
+    options = {'quality': 90} if image_format == 'JPEG' else {}
+    if icc_profile and image_format in ('JPEG', 'PNG', 'WEBP'):
+        # Keep the colour profile; it is not personal data
+        options['icc_profile'] = icc_profile
+    partial = file_path + '.part'
+    image.save(partial, format=image_format, **options)
+    os.replace(partial, file_path)
+    return image
+
+
+def _strip_pdf(file_path, preview_size):
+    """Render the first page of a PDF and rewrite it without metadata; returns the page."""
+    with pymupdf.open(file_path) as document:
+        if document.needs_pass:
+            raise ValueError("PDF is password protected")
+        if document.page_count == 0:
+            raise ValueError("PDF has no pages")
+        page = document[0]
+        zoom = min(preview_size[0] / page.rect.width, preview_size[1] / page.rect.height)
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        document.set_metadata({})
+        document.del_xml_metadata()
+        partial = file_path + '.part'
+        document.save(partial, garbage=3, deflate=True)
+    os.replace(partial, file_path)
+    return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def process_upload(path, kind, thumbnail_size=(200, 200), preview_size=(1024, 1024)):
+    """Strip metadata and write a thumbnail and preview for one stored upload.
+
+    Returns (thumbnail_path, preview_path), or None when the libraries
+    needed for this kind of file are not installed.
+    """
+    if Image is None or (kind == 'pdf' and pymupdf is None):
+        return None
+    # Stored paths may be web paths ('/static/...'); files live under the app root
+    file_path = path.lstrip('/')
+    if kind == 'pdf':
+        page = _strip_pdf(file_path, preview_size)
+    else:
+        page = _strip_image(file_path)
+    thumbnail, preview = derived_paths(path)
+    _save_derived(page, preview.lstrip('/'), preview_size)
+    _save_derived(page, thumbnail.lstrip('/'), thumbnail_size)
+    return thumbnail, preview
+
+
+class UploadProcessor:
+    """Thread pool that post-processes rows of the uploads table.
+
+    ``connect`` returns a database connection (or None). Work is submitted
+    by upload id after the row has been committed. Each upload is claimed
+    before it is processed; a claim older than ``claim_timeout`` seconds
+    is taken to belong to a worker that died and may be claimed again.
+    """
+
+    def __init__(self, connect, workers=2, thumbnail_size=(200, 200), preview_size=(1024, 1024),
+                 claim_timeout=600, log=print):
+        self._connect = connect
+        self.workers = workers
+        self.thumbnail_size = thumbnail_size
+        self.preview_size = preview_size
+        self.claim_timeout = claim_timeout
+        self._log = log
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # The pool is started by the first submit; it then also picks up
+        # uploads left pending by a previous run
+        with self._lock:
+            if self._executor is not None:
+                return False
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='uploads')
+            return True
+
+    def submit(self, upload_id):
+        if self._start():
+            self._executor.submit(self.requeue_pending)
+        self._executor.submit(self.process, upload_id)
+
+    def _stale_before(self):
+        # Claims made before this time are abandoned
+        return datetime.now().replace(microsecond=0) - timedelta(seconds=self.claim_timeout)
+
+    def pending_ids(self):
+        """Ids of uploads waiting to be processed, including abandoned claims."""
+        connection = self._connect()
+        if connection is None:
+            return []
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT id FROM uploads
+                WHERE status = 'pending' OR (status = 'processing' AND claimed_at < %s)
+                ORDER BY id
+            """, (self._stale_before(),))
+            ids = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            return ids
+        finally:
+            connection.close()
+
+    def requeue_pending(self):
+        for upload_id in self.pending_ids():
+            self._executor.submit(self.process, upload_id)
+
+    def _claim(self, connection, cursor, upload_id):
+        """Mark an upload as being processed; returns the claim time, or None if it is taken."""
+        claimed_at = datetime.now().replace(microsecond=0)
+        cursor.execute("""
+            UPDATE uploads SET status = 'processing', claimed_at = %s
+            WHERE id = %s AND (status = 'pending' OR (status = 'processing' AND claimed_at < %s))
+        """, (claimed_at, upload_id, self._stale_before()))
+        connection.commit()
+        return claimed_at if cursor.rowcount == 1 else None
+
+    def process(self, upload_id):
+        """Process one pending upload; returns its new status (None if there was nothing to do)."""
+        connection = self._connect()
+        if connection is None:
+            # Stays pending and is picked up again later
+            return None
+        try:
+            cursor = connection.cursor(dictionary=True)
+            claimed_at = self._claim(connection, cursor, upload_id)
+            if claimed_at is None:
+                # Already processed, or another worker has it
+                cursor.close()
+                return None
+            cursor.execute("SELECT path, kind FROM uploads WHERE id = %s", (upload_id,))
+            upload = cursor.fetchone()
+            thumbnail = preview = error = None
+            try:
+                derived = process_upload(upload['path'], upload['kind'], self.thumbnail_size, self.preview_size)
+                if derived is None:
+                    status = 'skipped'
+                    error = "PyMuPDF is not installed" if Image is not None else "Pillow is not installed"
+                else:
+                    status = 'done'
+                    thumbnail, preview = derived
+            except Exception as e:
+                # A broken or unreadable file must not take the worker down
+                status = 'failed'
+                error = str(e)[:255]
+                self._log(f"Error processing upload {upload['path']}: {e}")
+            # Only record the result if the claim was not taken over meanwhile
+            cursor.execute("""
+                UPDATE uploads
+                SET status = %s, thumbnail_path = %s, preview_path = %s, error = %s, processed_at = NOW()
+                WHERE id = %s AND status = 'processing' AND claimed_at = %s
+            """, (status, thumbnail, preview, error, upload_id, claimed_at))
+            connection.commit()
+            cursor.close()
+            return status
+        except Exception as e:
+            self._log(f"Error recording processed upload {upload_id}: {e}")
+            return None
+        finally:
+            connection.close()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)